@@ -0,0 +1,151 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2012 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+"""
+Sends one notification to many users at once.
+
+This is what the team notification tasks use instead of calling
+render_to_string(), Message.save() and send_templated_email() once per
+recipient:
+
+    - each template is loaded and compiled once, then rendered per recipient
+    - site messages are inserted with bulk_create
+    - emails go out over one SMTP connection, reopened every
+      NOTIFICATION_EMAIL_CHUNK_SIZE messages, and any email that fails is
+      handed to the send_notification_email task to be retried on its own
+"""
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sites.models import Site
+from django.core.mail import EmailMessage, get_connection
+from django.template import Context
+from django.template.loader import get_template
+
+from messages.models import Message
+from utils import DEFAULT_PROTOCOL
+from utils.metrics import Meter
+
+
+EMAIL_CHUNK_SIZE = getattr(settings, 'NOTIFICATION_EMAIL_CHUNK_SIZE', 50)
+MESSAGE_BATCH_SIZE = 500
+
+
+def _render(template, context, user):
+    context = dict(context)
+    context['user'] = user
+    return template.render(Context(context))
+
+def create_messages(users, subject, context, template_name=None,
+                    content=None, obj=None, author=None):
+    """Create a site message for each user that wants them.
+
+    The content is either the given string, shared by every message, or
+    template_name rendered with context plus the recipient as "user".
+
+    Returns the number of messages created.
+
+    """
+    if getattr(settings, "MESSAGES_DISABLED", False):
+        return 0
+
+    users = [u for u in users if u.notify_by_message]
+    template = get_template(template_name) if content is None else None
+
+    content_type = object_pk = None
+    if obj is not None:
+        content_type = ContentType.objects.get_for_model(obj)
+        object_pk = obj.pk
+
+    messages = [
+        Message(user=user, subject=subject, author=author,
+                content_type=content_type, object_pk=object_pk,
+                content=content if template is None
+                        else _render(template, context, user))
+        for user in users
+    ]
+
+    for i in xrange(0, len(messages), MESSAGE_BATCH_SIZE):
+        Message.objects.bulk_create(messages[i:i + MESSAGE_BATCH_SIZE])
+
+    return len(messages)
+
+def send_emails(users, subject, template_name, context, meter=None,
+                extra_context=None):
+    """Email the given users, skipping the ones that opted out.
+
+    Like send_templated_email(), but with the template and site looked up once
+    and every email sent over the same connection.  extra_context, if given, is
+    called with each user and returns more context for that user's email.
+
+    Returns the number of emails sent here; failed ones are retried in the
+    background.
+
+    """
+    from messages.tasks import send_notification_email
+
+    users = [u for u in users if u.email and u.notify_by_email]
+    if not users:
+        return 0
+
+    domain = Site.objects.get_current().domain
+    context = dict(context)
+    context['STATIC_URL_BASE'] = settings.STATIC_URL_BASE
+    context['domain'] = domain
+    context['url_base'] = "%s://%s" % (DEFAULT_PROTOCOL, domain)
+
+    template = get_template(template_name)
+
+    emails = []
+    for user in users:
+        user_context = dict(context, **extra_context(user)) if extra_context \
+                       else context
+        email = EmailMessage(subject, _render(template, user_context, user),
+                             settings.DEFAULT_FROM_EMAIL, [user.email],
+                             bcc=settings.EMAIL_BCC_LIST)
+        email.content_subtype = 'html'
+        emails.append(email)
+
+    if meter:
+        Meter(meter).inc(len(emails))
+
+    sent = 0
+    connection = get_connection()
+    for i in xrange(0, len(emails), EMAIL_CHUNK_SIZE):
+        try:
+            for email in emails[i:i + EMAIL_CHUNK_SIZE]:
+                try:
+                    sent += connection.send_messages([email]) or 0
+                except Exception:
+                    # The connection may be unusable now, so start a new one
+                    # for the next email.
+                    connection.close()
+                    send_notification_email.delay(
+                        email.subject, email.body, email.from_email,
+                        email.to, email.bcc)
+        finally:
+            connection.close()
+
+    Meter('templated-emails-sent').inc(sent)
+    return sent
+
+def notify_users(users, subject, context, message_template, email_template,
+                 obj=None, author=None, meter=None):
+    """Send a site message and an email to each of the given users."""
+    users = list(users)
+    create_messages(users, subject, context, template_name=message_template,
+                    obj=obj, author=author)
+    return send_emails(users, subject, email_template, context, meter=meter)
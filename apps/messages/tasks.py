@@ -30,7 +30,7 @@ from django.contrib.sites.models import Site
 from django.core.urlresolvers import reverse
 from django.utils.translation import ugettext_lazy as _, ugettext
 from django.template.loader import render_to_string
-from django.contrib.contenttypes.models import ContentType
+from django.core.mail import EmailMessage
 
 from raven.contrib.django.models import client
 
@@ -43,6 +43,7 @@ from teams.moderation_const import REVIEWED_AND_PUBLISHED, \
      REVIEWED_AND_PENDING_APPROVAL, REVIEWED_AND_SENT_BACK
 
 
+from messages.fanout import create_messages, notify_users, send_emails
 from messages.models import Message
 from utils import send_templated_email
 from utils.metrics import Meter
@@ -56,6 +57,17 @@ def _team_sends_notification(team, notification_setting_name):
     from teams.models import Setting
     return not team.settings.filter( key=Setting.KEY_IDS[notification_setting_name]).exists()
 
+@task(max_retries=5, default_retry_delay=5 * 60)
+def send_notification_email(subject, body, from_email, to, bcc=None):
+    """Retry an email that failed to go out with the rest of a notification."""
+    email = EmailMessage(subject, body, from_email, to, bcc=bcc)
+    email.content_subtype = 'html'
+    try:
+        return email.send()
+    except Exception, e:
+        send_notification_email.retry(
+            args=[subject, body, from_email, to, bcc], exc=e)
+
 @task()
 def send_new_message_notification(message_id):
     from messages.models import Message
@@ -146,29 +158,19 @@ def application_sent(application_pk):
         return False
     notifiable = TeamMember.objects.filter( team=application.team,
        role__in=[TeamMember.ROLE_ADMIN, TeamMember.ROLE_OWNER])
-    for m in notifiable:
-
-        template_name = "messages/application-sent.txt"
-        context = {
-            "application": application,
-            "applicant": application.user,
-            "url_base": get_url_base(),
-            "team":application.team,
-            "note":application.note,
-            "user":m.user,
-        }
-        body = render_to_string(template_name,context)
-        subject  = ugettext(u'%(user)s is applying for team %(team)s') % dict(user=application.user, team=application.team.name)
-        if m.user.notify_by_message:
-            msg = Message()
-            msg.subject = subject
-            msg.content = body
-            msg.user = m.user
-            msg.object = application.team
-            msg.author = application.user
-            msg.save()
-        Meter('templated-emails-sent-by-type.teams.application-sent').inc()
-        send_templated_email(m.user, subject, "messages/email/application-sent-email.html", context)
+    context = {
+        "application": application,
+        "applicant": application.user,
+        "url_base": get_url_base(),
+        "team":application.team,
+        "note":application.note,
+    }
+    subject  = ugettext(u'%(user)s is applying for team %(team)s') % dict(user=application.user, team=application.team.name)
+    notify_users([m.user for m in notifiable.select_related('user')], subject,
+                 context, "messages/application-sent.txt",
+                 "messages/email/application-sent-email.html",
+                 obj=application.team, author=application.user,
+                 meter='templated-emails-sent-by-type.teams.application-sent')
     return True
 
 
@@ -217,26 +219,17 @@ def team_member_new(member_pk):
     # notify  admins and owners through messages
     notifiable = TeamMember.objects.filter( team=member.team,
        role__in=[TeamMember.ROLE_ADMIN, TeamMember.ROLE_OWNER]).exclude(pk=member.pk)
-    for m in notifiable:
-        context = {
-            "new_member": member.user,
-            "team":member.team,
-            "user":m.user,
-            "role":member.role,
-            "url_base":get_url_base(),
-        }
-        body = render_to_string("messages/team-new-member.txt",context)
-        subject = ugettext("%s team has a new member" % (member.team))
-        if m.user.notify_by_message:
-            msg = Message()
-            msg.subject = subject
-            msg.content = body
-            msg.user = m.user
-            msg.object = m.team
-            msg.save()
-        template_name = "messages/email/team-new-member.html"
-        Meter('templated-emails-sent-by-type.teams.new-member').inc()
-        send_templated_email(m.user, subject, template_name, context)
+    context = {
+        "new_member": member.user,
+        "team":member.team,
+        "role":member.role,
+        "url_base":get_url_base(),
+    }
+    subject = ugettext("%s team has a new member" % (member.team))
+    notify_users([m.user for m in notifiable.select_related('user')], subject,
+                 context, "messages/team-new-member.txt",
+                 "messages/email/team-new-member.html", obj=member.team,
+                 meter='templated-emails-sent-by-type.teams.new-member')
 
 
     # now send welcome mail to the new member
@@ -278,23 +271,15 @@ def team_member_leave(team_pk, user_pk):
     notifiable = TeamMember.objects.filter( team=team,
        role__in=[TeamMember.ROLE_ADMIN, TeamMember.ROLE_OWNER])
     subject = ugettext(u"%(user)s has left the %(team)s team" % dict(user=user, team=team))
-    for m in notifiable:
-        context = {
-            "parting_member": user,
-            "team":team,
-            "user":m.user,
-            "url_base":get_url_base(),
-        }
-        body = render_to_string("messages/team-member-left.txt",context)
-        if m.user.notify_by_message:
-            msg = Message()
-            msg.subject = subject
-            msg.content = body
-            msg.user = m.user
-            msg.object = team
-            msg.save()
-        Meter('templated-emails-sent-by-type.teams.someone-left').inc()
-        send_templated_email(m.user, subject, "messages/email/team-member-left.html", context)
+    context = {
+        "parting_member": user,
+        "team":team,
+        "url_base":get_url_base(),
+    }
+    notify_users([m.user for m in notifiable.select_related('user')], subject,
+                 context, "messages/team-member-left.txt",
+                 "messages/email/team-member-left.html", obj=team,
+                 meter='templated-emails-sent-by-type.teams.someone-left')
 
 
     context = {
@@ -693,54 +678,48 @@ def send_video_comment_notification(comment_pk_or_instance, version_pk=None):
     if language:
         followers.update(language.notification_list(comment.user))
 
-    for user in followers:
-        Meter('templated-emails-sent-by-type.new-comment-notification').inc()
-        send_templated_email(
-            user,
-            subject,
-            "messages/email/comment-notification.html",
-            {
-                "video": video,
-                "user": user,
-                "hash": user.hash_for_video(video.video_id),
-                "commenter": unicode(comment.user),
-                "commenter_url": comment.user.get_absolute_url(),
-                "version_url":version_url,
-                "language_url":language_url,
-                "domain":domain,
-                "version": version,
-                "body": comment.content,
-                "STATIC_URL": settings.STATIC_URL,
-            },
-            fail_silently=not settings.DEBUG)
+    send_emails(
+        followers,
+        subject,
+        "messages/email/comment-notification.html",
+        {
+            "video": video,
+            "commenter": unicode(comment.user),
+            "commenter_url": comment.user.get_absolute_url(),
+            "version_url":version_url,
+            "language_url":language_url,
+            "domain":domain,
+            "version": version,
+            "body": comment.content,
+            "STATIC_URL": settings.STATIC_URL,
+        },
+        meter='templated-emails-sent-by-type.new-comment-notification',
+        extra_context=lambda user: {
+            "hash": user.hash_for_video(video.video_id),
+        })
 
 
     if language:
         obj = language
-        object_pk = language.pk
-        content_type = ContentType.objects.get_for_model(language)
         exclude = list(language.followers.filter(notify_by_message=False))
         exclude.append(comment.user)
         message_followers = language.notification_list(exclude)
     else:
         obj = video
-        object_pk = video.pk
-        content_type = ContentType.objects.get_for_model(video)
         exclude = list(video.followers.filter(notify_by_message=False))
         exclude.append(comment.user)
         message_followers = video.notification_list(exclude)
 
-    for user in message_followers:
-        Message.objects.create(user=user, subject=subject, object_pk=object_pk,
-                content_type=content_type, object=obj,
-                content=render_to_string('messages/new-comment.html', {
-                    "video": video,
-                    "commenter": unicode(comment.user),
-                    "commenter_url": comment.user.get_absolute_url(),
-                    "version_url":version_url,
-                    "language_url":language_url,
-                    "domain":domain,
-                    "protocol": protocol,
-                    "version": version,
-                    "body": comment.content
-                }))
+    # Every follower gets the same message, so it's only rendered once.
+    content = render_to_string('messages/new-comment.html', {
+        "video": video,
+        "commenter": unicode(comment.user),
+        "commenter_url": comment.user.get_absolute_url(),
+        "version_url":version_url,
+        "language_url":language_url,
+        "domain":domain,
+        "protocol": protocol,
+        "version": version,
+        "body": comment.content
+    })
+    create_messages(message_followers, subject, None, content=content, obj=obj)
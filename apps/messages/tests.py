@@ -25,9 +25,12 @@ from django.core.urlresolvers import reverse
 from apps.auth.models import CustomUser as User
 from apps.auth.models import EmailConfirmation
 from django.core import mail
+from django.core.mail.backends import locmem
+from django.test.utils import override_settings
 
 from apps.messages.models import Message
 from apps.messages import tasks as notifier
+from apps.messages import fanout
 
 from teams.models import Team, TeamMember, Application, Workflow,\
      TeamVideo, Task, Setting, Invite
@@ -36,6 +39,55 @@ from videos.models import Action, Video, SubtitleVersion, SubtitleLanguage, \
      Subtitle
 from utils import send_templated_email
 
+class FlakyEmailBackend(locmem.EmailBackend):
+    """Fails the first email to each address containing "flaky"."""
+    failed = set()
+
+    def send_messages(self, messages):
+        for message in messages:
+            for address in message.to:
+                if 'flaky' in address and address not in self.failed:
+                    self.failed.add(address)
+                    raise IOError('Connection reset')
+        return super(FlakyEmailBackend, self).send_messages(messages)
+
+class FanoutTest(TestCase):
+    def setUp(self):
+        self.team = Team.objects.create(name='fanout', slug='fanout')
+        self.users = []
+        for name in ('one', 'two', 'flaky', 'quiet'):
+            user = User.objects.create(username=name,
+                                       email='%s@example.com' % name)
+            if name == 'quiet':
+                user.notify_by_email = user.notify_by_message = False
+                user.save()
+            self.users.append(user)
+
+    def test_create_messages(self):
+        count = fanout.create_messages(
+            self.users, 'Subject', {'team': self.team, 'url_base': ''},
+            template_name='messages/team-member-left.txt', obj=self.team)
+
+        self.assertEqual(count, 3)
+        for user in self.users[:3]:
+            message = Message.objects.get(user=user)
+            self.assertEqual(message.object, self.team)
+            self.assertTrue(unicode(user) in message.content)
+        self.assertFalse(Message.objects.filter(user=self.users[3]).exists())
+
+    @override_settings(EMAIL_BACKEND='apps.messages.tests.FlakyEmailBackend')
+    def test_send_emails_retries_failures(self):
+        mail.outbox = []
+        sent = fanout.send_emails(
+            self.users, 'Subject', 'messages/email/team-member-left.html',
+            {'team': self.team, 'parting_member': self.users[0]})
+
+        # The failed email went out through the retry task instead.
+        self.assertEqual(sent, 2)
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox),
+                         ['flaky@example.com', 'one@example.com',
+                          'two@example.com'])
+
 class MessageTest(TestCase):
 
     def setUp(self):
@@ -65,10 +65,12 @@ def user_videos_activity(context, user=None):
     user = user or context['user']
 
     if user.is_authenticated():
-        context['users_actions'] = Action.objects.select_related('video', 'language', 'language__video', 'user') \
-            .filter(video__customuser=user) \
-            .exclude(user=user) \
-            .exclude(user=User.get_anonymous())[:ACTIONS_ON_PAGE]
+        actions = list(Action.objects.filter(video__customuser=user)
+                                     .exclude(user=user)
+                                     .exclude(user=User.get_anonymous())
+                                     [:ACTIONS_ON_PAGE])
+        Action.renderer.render_many(actions)
+        context['users_actions'] = actions
     else:
         context['users_actions'] = Action.objects.none()
     return context
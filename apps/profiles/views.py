@@ -33,7 +33,8 @@ from profiles.rpc import ProfileApiClass
 from utils.amazon import S3StorageError
 from utils.orm import LoadRelatedQuerySet
 from utils.rpc import RpcRouter
-from videos.models import Action, SubtitleLanguage, VideoUrl
+from videos.templatetags.paginator import paginate_keyset
+from videos.models import Action, ActionFeedEntry, SubtitleLanguage, VideoUrl
 
 
 rpc_router = RpcRouter('profiles:rpc_router', {
@@ -96,9 +97,13 @@ def dashboard(request):
     for t in tasks:
         t.cached_video_url = video_urls.get(t.team_video.video_id)
 
+    action_list = ActionFeedEntry.objects.actions(
+        ActionFeedEntry.objects.for_user(user)[:5])
+    Action.renderer.render_many(action_list)
+
     context = {
         'user_info': user,
-        'action_list': Action.objects.for_user(user)[:5],
+        'action_list': action_list,
         'tasks': tasks,
         'widget_settings': widget_settings,
     }
@@ -189,16 +194,21 @@ def send_message(request):
 
 @login_required
 def actions_list(request):
-    qs = Action.objects.for_user(request.user)
-    extra_context = {
+    entries, pagination_info = paginate_keyset(
+        ActionFeedEntry.objects.for_user(request.user),
+        settings.ACTIVITIES_ONPAGE,
+        request.GET.get('after'), request.GET.get('before'))
+
+    action_list = ActionFeedEntry.objects.actions(entries)
+    Action.renderer.render_many(action_list)
+
+    context = {
+        'action_list': action_list,
         'user_info': request.user
     }
+    context.update(pagination_info)
 
-    return object_list(request, queryset=qs, allow_empty=True,
-                       paginate_by=settings.ACTIVITIES_ONPAGE,
-                       template_name='profiles/actions_list.html',
-                       template_object_name='action',
-                       extra_context=extra_context)
+    return direct_to_template(request, 'profiles/actions_list.html', context)
 
 @login_required
 def generate_api_key(request):
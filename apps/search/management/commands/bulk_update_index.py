@@ -0,0 +1,94 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2012 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import reset_queries
+from django.db.models import get_model
+from haystack import site
+
+
+DEFAULT_BATCH_SIZE = getattr(settings, 'HAYSTACK_BATCH_SIZE', 1000)
+
+
+class Command(BaseCommand):
+    args = '[app_label.ModelName ...]'
+    help = ('Reindexes the given models (all indexed models by default) in '
+            'chunks, letting each index prefetch what it needs for a whole '
+            'chunk at once.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('-b', '--batch-size', action='store', dest='batch_size',
+                    type='int', default=DEFAULT_BATCH_SIZE,
+                    help='Number of objects to index at once.'),
+    )
+
+    def get_models(self, labels):
+        if not labels:
+            return site.get_indexed_models()
+
+        models = []
+        for label in labels:
+            try:
+                app_label, model_name = label.split('.')
+            except ValueError:
+                raise CommandError('Models should look like app_label.ModelName')
+
+            model = get_model(app_label, model_name)
+            if model is None:
+                raise CommandError('Unknown model: %s' % label)
+            models.append(model)
+        return models
+
+    def update(self, model, batch_size, verbosity):
+        index = site.get_index(model)
+        qs = index.index_queryset().order_by('-pk')
+        prefetch = getattr(index, 'prefetch', None)
+
+        if verbosity >= 1:
+            print 'Indexing %s.' % model._meta.verbose_name_plural
+
+        # Walk the pks instead of using offsets, which get slower the further
+        # into the table we get.
+        last_pk = None
+        count = 0
+        while True:
+            chunk_qs = qs if last_pk is None else qs.filter(pk__lt=last_pk)
+            objects = list(chunk_qs[:batch_size])
+            if not objects:
+                break
+
+            last_pk = objects[-1].pk
+            count += len(objects)
+
+            if prefetch is not None:
+                prefetch(objects)
+            index.backend.update(index, objects)
+
+            if verbosity >= 2:
+                print '  indexed %d.' % count
+
+            # The query log bloats up RAM when DEBUG is on.
+            reset_queries()
+
+    def handle(self, *labels, **options):
+        verbosity = int(options.get('verbosity', 1))
+
+        for model in self.get_models(labels):
+            self.update(model, options['batch_size'], verbosity)
@@ -16,14 +16,26 @@
 # along with this program.  If not, see 
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
+from datetime import timedelta
+
 from celery.schedules import crontab
 from celery.decorators import periodic_task
 from django.core.management import call_command
 
 from django.conf import settings
 
+from utils.celery_search_index import process_dirty
+
 SEARCH_INDEXING_HOUR_STARTS = getattr(settings, "SEARCH_INDEXING_HOUR_STARTS", 0)
+# With the dirty queue keeping the index current the nightly rebuild is only a
+# safety net, and can be switched off.
+SEARCH_NIGHTLY_REBUILD = getattr(settings, "SEARCH_NIGHTLY_REBUILD", True)
 
 @periodic_task(run_every=crontab(minute=0, hour=SEARCH_INDEXING_HOUR_STARTS))
 def update_search_index():
-    call_command('update_index', verbosity=2)
+    if SEARCH_NIGHTLY_REBUILD:
+        call_command('bulk_update_index', verbosity=2)
+
+@periodic_task(run_every=timedelta(seconds=30))
+def process_search_index_queue():
+    process_dirty()
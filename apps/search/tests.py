@@ -179,3 +179,89 @@ class TestSearch(TestCase):
 
         self.assertEquals(videos[0].title, u"Default")
         self.assertEquals(videos[1].title, u"This is my unique title")
+
+    def test_prefetch(self):
+        from haystack import site
+        index = site.get_index(Video)
+
+        keys = ['languages', 'languages_count', 'contributors_count',
+                'activity_count', 'week_views', 'title']
+        expected = [dict((k, index.prepare(video)[k]) for k in keys)
+                    for video in Video.objects.all()]
+
+        videos = list(Video.objects.all())
+        index.prefetch(videos)
+        prepared = [dict((k, index.prepare(video)[k]) for k in keys)
+                    for video in videos]
+
+        self.assertEquals(prepared, expected)
+
+    def test_dirty_queue(self):
+        from utils import celery_search_index
+        from utils.redis_utils import default_connection
+
+        default_connection.delete(celery_search_index.DIRTY_KEY)
+        default_connection.delete(celery_search_index.HIGH_WATER_KEY)
+
+        video = Video.objects.all()[0]
+        video.title = u'Queued unique title'
+        video.save()
+
+        for i in xrange(100):
+            celery_search_index.mark_dirty(Video, [video.pk])
+        self.assertEquals(
+            default_connection.zcard(celery_search_index.DIRTY_KEY), 1)
+
+        settle = celery_search_index.QUEUE_SETTLE
+        celery_search_index.QUEUE_SETTLE = 0
+        try:
+            self.assertEquals(celery_search_index.process_dirty(), 1)
+        finally:
+            celery_search_index.QUEUE_SETTLE = settle
+
+        self.assertEquals(
+            default_connection.zcard(celery_search_index.DIRTY_KEY), 0)
+        self.assertTrue(
+            default_connection.get(celery_search_index.HIGH_WATER_KEY))
+
+        rpc = SearchApiClass()
+        rdata = RpcMultiValueDict(dict(q=u'Queued unique title'))
+        result = rpc.search(rdata, self.user, testing=True)['sqs']
+        self.assertTrue(video in [item.object for item in result])
+
+    def test_dirty_queue_lock(self):
+        from utils import celery_search_index
+        from utils.redis_utils import default_connection
+
+        lock_key = celery_search_index.LOCK_KEY
+        default_connection.delete(lock_key)
+
+        token = celery_search_index._acquire_lock()
+        self.assertTrue(token)
+        self.assertTrue(default_connection.ttl(lock_key) > 0)
+        self.assertEquals(celery_search_index._acquire_lock(), None)
+        self.assertEquals(celery_search_index.process_dirty(), None)
+
+        # Only the holder's token releases the lock.
+        celery_search_index._release_lock('someone else')
+        self.assertEquals(default_connection.get(lock_key), token)
+        celery_search_index._release_lock(token)
+        self.assertEquals(default_connection.get(lock_key), None)
+
+    def test_dirty_queue_old_redis(self):
+        from utils import celery_search_index
+        from utils.redis_utils import default_connection
+
+        info = default_connection.info
+        queue_updates = celery_search_index.QUEUE_UPDATES
+        default_connection.info = lambda: {'redis_version': '2.4.17'}
+        celery_search_index.QUEUE_UPDATES = True
+        celery_search_index._queue_supported = None
+        try:
+            # Older servers get a task per update instead of the queue.
+            self.assertFalse(celery_search_index._use_queue())
+            self.assertEquals(celery_search_index.process_dirty(), 0)
+        finally:
+            default_connection.info = info
+            celery_search_index.QUEUE_UPDATES = queue_updates
+            celery_search_index._queue_supported = None
@@ -19,7 +19,9 @@ from django.db import IntegrityError
 from django.db.models import F
 
 from statistic.models import SubtitleFetchCounters, VideoViewCounter, WidgetViewCounter
-from statistic.pre_day_statistic import BasePerDayStatistic, UpdatingLogger
+from statistic.pre_day_statistic import (
+    BasePerDayStatistic, UpdatingLogger, group_by_value
+)
 from utils.redis_utils import default_connection
 
 
@@ -61,6 +63,23 @@ class VideoViewStatistic(BasePerDayStatistic):
         obj, created = self.model.objects.get_or_create(video=video, date=date)
         return obj
 
+    def get_objects(self, keys):
+        from videos.models import Video
+
+        parsed = {}
+        for key in keys:
+            prefix, video_id, date_str = key.split(':')
+            parsed[key] = (video_id, self.get_date(date_str))
+
+        video_pks = dict(Video.objects.filter(
+            video_id__in=set(video_id for video_id, date in parsed.values())
+        ).values_list('video_id', 'pk'))
+
+        return self.get_or_create_objects(dict(
+            (key, {'video_id': video_pks[video_id], 'date': date})
+            for key, (video_id, date) in parsed.items()
+            if video_id in video_pks))
+
     def get_query_set(self, video):
         return self.model.objects.filter(video=video)
 
@@ -68,6 +87,13 @@ class VideoViewStatistic(BasePerDayStatistic):
         video = obj.video
         video.__class__.objects.filter(pk=video.pk).update(view_count=F('view_count')+value)
 
+    def update_totals(self, updates):
+        from videos.models import Video
+
+        by_value = group_by_value((obj.video_id, value) for obj, value in updates)
+        for value, pks in by_value.items():
+            Video.objects.filter(pk__in=pks).update(view_count=F('view_count')+value)
+
 st_video_view_handler = VideoViewStatistic()
 
 class WidgetViewStatistic(VideoViewStatistic):
@@ -100,6 +126,14 @@ class WidgetViewStatistic(VideoViewStatistic):
         Video.objects.filter(pk=obj.video_id) \
             .update(widget_views_count=F('widget_views_count')+value)
 
+    def update_totals(self, updates):
+        from videos.models import Video
+
+        by_value = group_by_value((obj.video_id, value) for obj, value in updates)
+        for value, pks in by_value.items():
+            Video.objects.filter(pk__in=pks) \
+                .update(widget_views_count=F('widget_views_count')+value)
+
     def post_migrate(self, updated_objects, updated_keys):
         from utils.celery_search_index import update_search_index_for_qs
         from videos.models import Video
@@ -146,9 +180,10 @@ class SubtitleFetchStatistic(BasePerDayStatistic):
 
         return key
 
-    def get_object(self, key):
-        from videos.models import Video
-
+    def _parse_key(self, key):
+        """
+        Return (video_id, language, date) for Redis key
+        """
         parts = key.split(':')
 
         if len(parts) == 6:
@@ -156,13 +191,20 @@ class SubtitleFetchStatistic(BasePerDayStatistic):
         else:
             lang = ''
 
+        return parts[1], lang, self.get_date(parts[-1])
+
+    def get_object(self, key):
+        from videos.models import Video
+
+        video_id, lang, date = self._parse_key(key)
+
         try:
-            video = Video.objects.get(video_id=parts[1])
+            video = Video.objects.get(video_id=video_id)
         except Video.DoesNotExist:
             return
 
         fields = {
-            'date': self.get_date(parts[-1]),
+            'date': date,
             'video': video,
             'language': lang
         }
@@ -181,8 +223,30 @@ class SubtitleFetchStatistic(BasePerDayStatistic):
 
         return sl
 
+    def get_objects(self, keys):
+        from videos.models import Video
+
+        parsed = dict((key, self._parse_key(key)) for key in keys)
+
+        video_pks = dict(Video.objects.filter(
+            video_id__in=set(video_id for video_id, lang, date in parsed.values())
+        ).values_list('video_id', 'pk'))
+
+        return self.get_or_create_objects(dict(
+            (key, {'video_id': video_pks[video_id], 'language': lang, 'date': date})
+            for key, (video_id, lang, date) in parsed.items()
+            if video_id in video_pks))
+
     def update_total(self, key, obj, value):
         video = obj.video
-        video.__class__.objects.filter(pk=video.pk).update(view_count=F('subtitles_fetched_count')+value)
+        video.__class__.objects.filter(pk=video.pk).update(subtitles_fetched_count=F('subtitles_fetched_count')+value)
+
+    def update_totals(self, updates):
+        from videos.models import Video
+
+        by_value = group_by_value((obj.video_id, value) for obj, value in updates)
+        for value, pks in by_value.items():
+            Video.objects.filter(pk__in=pks) \
+                .update(subtitles_fetched_count=F('subtitles_fetched_count')+value)
 
 st_sub_fetch_handler = SubtitleFetchStatistic()
@@ -0,0 +1,102 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2012 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+import datetime
+import random
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from statistic import WidgetViewStatistic
+from utils.redis_utils import default_connection
+from videos.models import Video
+
+
+class BenchmarkWidgetViewStatistic(WidgetViewStatistic):
+    """Widget views under their own prefix, so real views are left alone."""
+    prefix = 'st_benchmark_widget_view'
+    log_to_redis = None
+
+    def post_migrate(self, updated_objects, updated_keys):
+        pass
+
+
+class Command(BaseCommand):
+    help = ('Compares the per-key and batched Redis -> DB migration of widget '
+            'view statistics.  Database changes are rolled back afterwards.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--videos', action='store', dest='videos',
+                    type='int', default=1000,
+                    help='Number of videos to "view".'),
+        make_option('--days', action='store', dest='days',
+                    type='int', default=3,
+                    help='Number of days to spread the views over.'),
+        make_option('--batch-size', action='store', dest='batch_size',
+                    type='int', default=1000,
+                    help='Batch size for the batched migration.'),
+    )
+
+    def fill(self, handler, videos, days):
+        """Put view counters for the videos into Redis."""
+        today = datetime.date.today()
+        pipe = default_connection.pipeline(transaction=False)
+
+        for video in videos:
+            for day in xrange(days):
+                date = today - datetime.timedelta(days=day)
+                key = handler.get_key(date=date, video_id=video.video_id)
+                pipe.incr(key, random.randint(1, 5))
+                pipe.sadd(handler.set_key.redis_key, key)
+
+        pipe.execute()
+
+    def run(self, label, handler, videos, options):
+        self.fill(handler, videos, options['days'])
+
+        start = time.time()
+        with transaction.commit_manually():
+            try:
+                if label == 'batched':
+                    count = handler.migrate(verbosity=0,
+                                            batch_size=options['batch_size'])
+                else:
+                    count = handler.migrate(verbosity=0)
+            finally:
+                transaction.rollback()
+        elapsed = time.time() - start
+
+        print '%-8s %8d %8.2fs %10.0f' % (label, count, elapsed,
+                                          count / elapsed if elapsed else 0)
+
+    def handle(self, *args, **options):
+        if default_connection.ping() is None:
+            print 'Redis is unavailable.'
+            return
+
+        videos = list(Video.objects.all()[:options['videos']])
+        if not videos:
+            print 'No videos to benchmark with.'
+            return
+
+        handler = BenchmarkWidgetViewStatistic()
+
+        print '%-8s %8s %9s %10s' % ('mode', 'keys', 'time', 'keys/s')
+        self.run('per-key', handler, videos, options)
+        self.run('batched', handler, videos, options)
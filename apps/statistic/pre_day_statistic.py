@@ -16,7 +16,7 @@
 # along with this program.  If not, see 
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
-from django.db import models
+from django.db import IntegrityError, connections, models, transaction
 from utils.redis_utils import RedisKey
 from django.contrib.admin import ModelAdmin
 from django.views.generic.simple import direct_to_template
@@ -116,6 +116,22 @@ class UpdatingLogger(object):
             
         return output
         
+def group_by_value(counts):
+    """
+    Group (pk, value) pairs into dict value -> list of pks, summing values
+    for same pk. 
+    Most of counters are small numbers, so one UPDATE per distinct value is
+    much less queries than one UPDATE per object.
+    """
+    totals = {}
+    for pk, value in counts:
+        totals[pk] = totals.get(pk, 0) + value
+    
+    by_value = {}
+    for pk, value in totals.items():
+        by_value.setdefault(value, []).append(pk)
+    return by_value
+        
 class BasePerDayStatisticModel(models.Model):
     """
     Base Model for saving statistic information in DB
@@ -175,11 +191,18 @@ class BasePerDayStatistic(object):
     Really *get_query_set* and *get_key* should get same arguments, because 
     as you update statistic for some objects, for same you wish get this statistic
     in future.
+    
+    *migrate* can also work in batches (pass *batch_size*). Keys are then popped
+    from Redis with pipelines, counts are grouped by object and applied with
+    a few queries per batch. By default this still calls *get_object* and
+    *update_total* for every key, override *get_objects* and *update_totals*
+    to do this in bulk too. *get_or_create_objects* helps with the former.
     """
     connection = None   #Redis connection
     prefix = None       #keys' prefix
     model = None        #Model to save info in DB, BasePerDayStatisticModel subclass
     log_to_redis = None
+    migrate_batch_size = 1000 #Default batch size for the periodic migration
     
     def __init__(self):
         if not self.connection:
@@ -229,6 +252,65 @@ class BasePerDayStatistic(object):
         """
         raise Exception('Not implemented')        
     
+    def get_objects(self, keys):
+        """
+        Return dict Redis key -> instance of self.model for batched migration.
+        Keys without object can be omitted.
+        By default *get_object* is called for each key.
+        """
+        objects = {}
+        for key in keys:
+            obj = self.get_object(key)
+            if obj:
+                objects[key] = obj
+        return objects
+    
+    def get_or_create_objects(self, lookups):
+        """
+        Helper for *get_objects* implementations.
+        lookups - dict Redis key -> dict of field values (like get_or_create
+        kwargs) which are unique together for self.model
+        
+        Existing objects are fetched with one query, missing ones are created
+        with bulk_create. Return dict Redis key -> instance of self.model
+        """
+        if not lookups:
+            return {}
+        
+        manager = self.model._default_manager
+        fields = sorted(lookups.values()[0].keys())
+        
+        def _values(lookup):
+            return tuple(lookup[f] for f in fields)
+        
+        def _fetch(values):
+            #this can match more rows than we need, but it's one query
+            qs = manager.filter(**dict(('%s__in' % f, set(v[i] for v in values))
+                                       for i, f in enumerate(fields)))
+            return dict((tuple(getattr(obj, f) for f in fields), obj) for obj in qs)
+        
+        wanted = set(_values(lookup) for lookup in lookups.values())
+        found = _fetch(wanted)
+        missing = [v for v in wanted if v not in found]
+        
+        if missing:
+            sid = transaction.savepoint()
+            try:
+                manager.bulk_create([self.model(**dict(zip(fields, v)))
+                                     for v in missing])
+                transaction.savepoint_commit(sid)
+            except IntegrityError:
+                #somebody created some of them in the meantime
+                transaction.savepoint_rollback(sid)
+                for v in missing:
+                    manager.get_or_create(**dict(zip(fields, v)))
+            
+            #bulk_create doesn't set pk, so we need fetch them
+            found.update(_fetch(missing))
+        
+        return dict((key, found[_values(lookup)]) for key, lookup in lookups.items()
+                    if _values(lookup) in found)
+    
     def get_query_set(self, **kwargs):
         """
         Should return QuerySet for self.model for get_views method
@@ -249,7 +331,90 @@ class BasePerDayStatistic(object):
             video.__class__.objects.filter(pk=video.pk).update(view_count=F('view_count')+value)        
         """
         raise Exception('Not implemented')
+    
+    def update_totals(self, updates):
+        """
+        Batched version of *update_total*.
+        updates - list of (obj, value) pairs, each obj is unique
+        By default *update_total* is called for each of them with key None.
+        """
+        for obj, value in updates:
+            self.update_total(None, obj, value)
+        
+    def get_windows(self, today=None):
+        """
+        Return list of (name, first date, last date) windows for views statistic
+        """
+        today = (today or datetime.datetime.today()).date()
+        day = datetime.timedelta(days=1)
+        return [
+            ('week', today - 7 * day, today),
+            ('month', today - 30 * day, today),
+            ('year', today - 365 * day, today),
+            ('today', today, today),
+            ('yesterday', today - day, today - day),
+        ]
+    
+    def get_window_sums(self, qs, group_by=None, today=None, windows=None):
+        """
+        Sum counts of *qs* for each window from *get_windows* with one query.
+        *windows* can be passed to use other (name, first date, last date)
+        windows instead.
+        
+        Return dict like {'week': value, 'month': value, ...}. If *group_by* 
+        (name of model field) is passed, return dict field value -> such dict, 
+        for values that have any counts.
+        """
+        if windows is None:
+            windows = self.get_windows(today)
+        first = min(start for name, start, end in windows)
+        last = max(end for name, start, end in windows)
+        
+        opts = self.model._meta
+        fields = ['date', 'count']
+        if group_by:
+            fields.insert(0, group_by)
+        
+        qs = qs.filter(date__range=(first, last)).values_list(*fields)
+        inner_sql, inner_params = qs.query.get_compiler(using=qs.db).as_sql()
+        
+        connection = connections[qs.db]
+        qn = connection.ops.quote_name
+        date_col = 'st.%s' % qn(opts.get_field('date').column)
+        count_col = 'st.%s' % qn(opts.get_field('count').column)
+        
+        #CASE WHEN is supported by all databases we care about
+        columns = ['SUM(CASE WHEN %s BETWEEN %%s AND %%s THEN %s ELSE 0 END)'
+                   % (date_col, count_col) for w in windows]
+        params = []
+        for name, start, end in windows:
+            params.extend([start, end])
+        
+        if group_by:
+            group_col = 'st.%s' % qn(opts.get_field(group_by).column)
+            columns.insert(0, group_col)
+        
+        sql = 'SELECT %s FROM (%s) st' % (', '.join(columns), inner_sql)
+        if group_by:
+            sql += ' GROUP BY %s' % group_col
+        
+        cursor = connection.cursor()
+        cursor.execute(sql, params + list(inner_params))
         
+        def _to_dict(row):
+            return dict((name, int(value or 0))
+                        for (name, start, end), value in zip(windows, row))
+        
+        if group_by:
+            return dict((row[0], _to_dict(row[1:])) for row in cursor.fetchall())
+        else:
+            return _to_dict(cursor.fetchone())
+    
+    def _views_from_sums(self, sums, today):
+        result = dict((k, sums[k]) for k in ('week', 'month', 'year'))
+        result['today'] = int(sums['today'] + sums['yesterday'] * (1 - today.hour / 24.))
+        return result
+    
     def get_views(self, **kwargs):
         """
         Return views statistic for week and month like: {'month': value, 'week': value, 'year': value}
@@ -257,25 +422,22 @@ class BasePerDayStatistic(object):
         """
         qs = self.get_query_set(**kwargs)
         today = datetime.datetime.today()
-        yesterday  = today - datetime.timedelta(days=1)
-        week_ago = today - datetime.timedelta(days=7)
-        month_ago = today - datetime.timedelta(days=30)
-        year_ago = today - datetime.timedelta(days=365)
-        
-        #TODO: refactor this. too many queries. 
-        result = dict(week=0, month=0)
-        result['week'] = qs.filter(date__range=(week_ago, today)) \
-            .aggregate(s=models.Sum('count'))['s'] or 0
-        result['month'] = qs.filter(date__range=(month_ago, today)) \
-            .aggregate(s=models.Sum('count'))['s'] or 0
-        result['year'] = qs.filter(date__range=(year_ago, today)) \
-            .aggregate(s=models.Sum('count'))['s'] or 0
-
-        today_views = qs.filter(date=today).aggregate(s=models.Sum('count'))['s'] or 0
-        yesterday_views = qs.filter(date=yesterday).aggregate(s=models.Sum('count'))['s'] or 0
-        result['today'] =  int(today_views + yesterday_views * (1 - today.hour / 24.))
-                    
-        return result
+        return self._views_from_sums(self.get_window_sums(qs, today=today), today)
+    
+    def get_views_bulk(self, field, values):
+        """
+        Return views statistic for many objects with one query.
+        *field* is name of self.model field (for example FK to video) and *values*
+        are its values (for example video pks).
+        Return dict value -> dict like returned by *get_views*
+        """
+        today = datetime.datetime.today()
+        qs = self.model._default_manager.filter(**{'%s__in' % field: values})
+        sums = self.get_window_sums(qs, group_by=field, today=today)
+        
+        empty = dict((name, 0) for name, start, end in self.get_windows(today))
+        return dict((value, self._views_from_sums(sums.get(value, empty), today))
+                    for value in values)
     
     def post_migrate(self, updated_objects, updated_keys):
         """
@@ -289,9 +451,10 @@ class BasePerDayStatistic(object):
         """
         pass
     
-    def migrate(self, verbosity=1):
+    def migrate(self, verbosity=1, batch_size=None):
         """
         Migrate information from Redis to DB
+        If *batch_size* is passed, keys are migrated in batches of this size.
         """
         if verbosity >= 2:
             print '>>> Start migration...'
@@ -300,6 +463,14 @@ class BasePerDayStatistic(object):
         
         self.pre_migrate()
         
+        if batch_size:
+            count = self._migrate_in_batches(batch_size, verbosity)
+            
+            if self.log_to_redis and count:
+                self.log_to_redis.save(datetime.datetime.now(), count, time.time()-start)
+            
+            return count
+        
         count = self.set_key.scard()
         
         i = count 
@@ -339,6 +510,85 @@ class BasePerDayStatistic(object):
             self.log_to_redis.save(datetime.datetime.now(), count, time.time()-start)
 
         return count
+    
+    def _pop_keys(self, count):
+        """
+        Pop up to *count* keys from the set in one round trip
+        """
+        pipe = self.connection.pipeline(transaction=False)
+        for i in xrange(count):
+            pipe.spop(self.set_key.redis_key)
+        return [key for key in pipe.execute() if key]
+    
+    def _pop_values(self, keys):
+        """
+        Read and delete counters for *keys* in one transaction, so we don't
+        lose views that happen in the meantime.
+        Return dict key -> value
+        """
+        pipe = self.connection.pipeline()
+        for key in keys:
+            pipe.get(key)
+            pipe.delete(key)
+        results = pipe.execute()
+        
+        values = {}
+        for key, value in zip(keys, results[::2]):
+            try:
+                values[key] = int(value)
+            except (TypeError, ValueError):
+                pass
+        return values
+    
+    def _apply_counts(self, objects, values):
+        """
+        Add *values* to DB. Return list of updated objects
+        """
+        #several keys can point to the same object
+        counts = {}
+        for key, obj in objects.items():
+            if key in values:
+                if obj.pk in counts:
+                    counts[obj.pk][1] += values[key]
+                else:
+                    counts[obj.pk] = [obj, values[key]]
+        
+        manager = self.model._default_manager
+        by_value = group_by_value((pk, value) for pk, (obj, value) in counts.items())
+        for value, pks in by_value.items():
+            manager.filter(pk__in=pks).update(count=models.F('count')+value)
+        
+        self.update_totals([(obj, value) for obj, value in counts.values()])
+        
+        return [obj for obj, value in counts.values()]
+    
+    def _migrate_batch(self, keys):
+        values = self._pop_values(keys)
+        objects = self.get_objects(keys)
+        return self._apply_counts(objects, values)
+    
+    def _migrate_in_batches(self, batch_size, verbosity=1):
+        #don't chase keys that are added while we are working, like migrate
+        remaining = self.set_key.scard()
+        count = 0
+        updated_keys = []
+        updated_objects = []
+        
+        while remaining > 0:
+            keys = self._pop_keys(min(batch_size, remaining))
+            if not keys:
+                break
+            remaining -= len(keys)
+            
+            count += len(keys)
+            updated_keys.extend(keys)
+            updated_objects.extend(self._migrate_batch(keys))
+            
+            if verbosity >= 2:
+                print '  >>> migrated keys: %s' % count
+        
+        self.post_migrate(updated_objects, updated_keys)
+        return count
         
     def update(self, **kwargs):
         """
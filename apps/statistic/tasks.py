@@ -63,9 +63,10 @@ def gauge_statistic_languages():
 
 @periodic_task(run_every=timedelta(hours=6))
 def update_statistic(*args, **kwargs):
-    st_sub_fetch_handler.migrate(verbosity=kwargs.get('verbosity', 1))
-    st_video_view_handler.migrate(verbosity=kwargs.get('verbosity', 1))
-    st_widget_view_statistic.migrate(verbosity=kwargs.get('verbosity', 1))
+    for handler in (st_sub_fetch_handler, st_video_view_handler,
+                    st_widget_view_statistic):
+        handler.migrate(verbosity=kwargs.get('verbosity', 1),
+                        batch_size=handler.migrate_batch_size)
 
 
 @task
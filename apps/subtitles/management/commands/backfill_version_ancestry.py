@@ -0,0 +1,70 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2012 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.subtitles.models import SubtitleVersion, SubtitleVersionAncestry
+from apps.videos.models import Video
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    args = '[video_id ...]'
+    help = ('Rebuilds the SubtitleVersion ancestry table from the parents of '
+            'each version.  Pass video_ids to only rebuild those videos.')
+
+    BATCH_SIZE = 100
+
+    def handle(self, *video_ids, **options):
+        verbosity = int(options.get('verbosity', 1))
+
+        if video_ids:
+            pks = (Video.objects.filter(video_id__in=video_ids)
+                                .values_list('pk', flat=True))
+        else:
+            pks = (SubtitleVersion.objects.order_by('video')
+                                          .values_list('video_id', flat=True)
+                                          .distinct())
+        pks = list(pks)
+
+        # Ancestry never crosses videos, so each video is rebuilt (and
+        # committed) on its own and only its own versions are in memory.
+        count = failed = 0
+        for i in xrange(0, len(pks), self.BATCH_SIZE):
+            videos = Video.objects.in_bulk(pks[i:i + self.BATCH_SIZE])
+            for pk in pks[i:i + self.BATCH_SIZE]:
+                video = videos[pk]
+                try:
+                    with transaction.commit_on_success():
+                        SubtitleVersionAncestry.objects.rebuild_for_video(
+                            video)
+                    count += 1
+                except Exception:
+                    failed += 1
+                    logger.exception("failed to rebuild ancestry for %s",
+                                     video.video_id)
+
+                if verbosity >= 2:
+                    print 'Rebuilt %s' % video.video_id
+
+        if verbosity >= 1:
+            print '%s videos rebuilt, %s failed' % (count, failed)
@@ -0,0 +1,74 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2012 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from apps.subtitles.models import SubtitleVersion
+from apps.subtitles.tasks import backfill_version_summaries
+
+
+class Command(BaseCommand):
+    help = ('Fills in the denormalized summary fields of SubtitleVersions that '
+            'predate them.  Batches are farmed out to celery workers so they '
+            'run in parallel.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', action='store', dest='batch_size',
+                    type='int', default=200,
+                    help='Number of versions per task.'),
+        make_option('--sync', action='store_true', dest='sync',
+                    default=False,
+                    help='Process batches in this process instead of queueing '
+                         'them.'),
+    )
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity', 1))
+        batch_size = options['batch_size']
+
+        # Only the ids are pulled here; the workers load the blobs themselves.
+        ids = (SubtitleVersion.objects.filter(subtitle_count__isnull=True)
+                                      .order_by('id')
+                                      .values_list('id', flat=True))
+
+        batches = failed = 0
+        last_id = 0
+
+        while True:
+            batch = list(ids.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+
+            last_id = batch[-1]
+            batches += 1
+
+            if options['sync']:
+                failed += backfill_version_summaries(batch)
+            else:
+                backfill_version_summaries.delay(batch)
+
+            if verbosity >= 2:
+                print 'Batch %s: versions up to id %s' % (batches, last_id)
+
+        if verbosity >= 1:
+            if options['sync']:
+                print '%s batches processed, %s versions failed' % (batches,
+                                                                  failed)
+            else:
+                print '%s batches queued' % batches
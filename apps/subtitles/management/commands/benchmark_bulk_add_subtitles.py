@@ -0,0 +1,85 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2012 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from apps.subtitles import pipeline
+from apps.videos.models import Video
+
+
+class Command(BaseCommand):
+    help = ('Compares N single add_subtitles calls against one batched '
+            'add_subtitles_bulk call.  Everything is rolled back afterwards.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--count', action='store', dest='count',
+                    type='int', default=500,
+                    help='Number of (video, language, subtitles) items.'),
+        make_option('--subtitles', action='store', dest='subtitles',
+                    type='int', default=50,
+                    help='Number of subtitles per item.'),
+        make_option('--language', action='store', dest='language',
+                    default='eo', help='Language code to add subtitles in.'),
+    )
+
+    def run(self, label, fn):
+        queries_before = len(connection.queries)
+        start = time.time()
+
+        with transaction.commit_manually():
+            try:
+                fn()
+            finally:
+                transaction.rollback()
+
+        elapsed = time.time() - start
+        queries = len(connection.queries) - queries_before
+
+        print '%-8s %8.2fs %10s' % (label, elapsed,
+                                    queries if connection.queries else 'n/a')
+
+    def handle(self, *args, **options):
+        videos = list(Video.objects.order_by('-id')[:options['count']])
+
+        if not videos:
+            print 'No videos to benchmark with.'
+            return
+
+        subtitles = [(i * 1000, i * 1000 + 900, 'Subtitle %d' % i)
+                     for i in xrange(options['subtitles'])]
+        items = [(video, options['language'], subtitles) for video in videos]
+
+        def _single():
+            for item in items:
+                pipeline.add_subtitles_unsafe(*item)
+
+        def _bulk():
+            results = pipeline._bulk_add_subtitles(items)
+            failed = [error for _, error in results if error]
+            if failed:
+                print '%d items failed, e.g.: %s' % (len(failed), failed[0])
+
+        print '%d items of %d subtitles' % (len(items), len(subtitles))
+        print '(query counts are only available with DEBUG on)'
+        print ''
+        print '%-8s %9s %10s' % ('mode', 'time', 'queries')
+        self.run('single', _single)
+        self.run('bulk', _bulk)
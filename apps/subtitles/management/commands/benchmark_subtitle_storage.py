@@ -0,0 +1,116 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2012 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from apps.subtitles.models import SubtitleVersion
+from apps.subtitles.packing import PackedSubtitles, is_packed, pack_to_field
+from babelsubs import load_from
+from babelsubs.storage import SubtitleSet
+from utils.compress import compress, decompress
+
+
+def _synthetic_items(count):
+    return [(i * 2000, i * 2000 + 1500,
+             'Subtitle number %d, with a <b>bit</b> of markup.' % i)
+            for i in xrange(count)]
+
+
+class Command(BaseCommand):
+    help = ('Compares decode time and bytes per version of the DFXP and packed '
+            'subtitle storage formats.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--versions', action='store', dest='versions',
+                    type='int', default=200,
+                    help='Number of versions to sample from the database.'),
+        make_option('--synthetic', action='store', dest='synthetic',
+                    type='int', default=0,
+                    help='Benchmark a synthetic set of this many subtitles '
+                         'instead of sampling the database.'),
+        make_option('--repeat', action='store', dest='repeat',
+                    type='int', default=5,
+                    help='Number of times to decode each sample.'),
+    )
+
+    def samples(self, options):
+        """Return a list of (language_code, items) pairs to benchmark."""
+        if options['synthetic']:
+            return [('en', _synthetic_items(options['synthetic']))]
+
+        samples = []
+        qs = (SubtitleVersion.objects.exclude(serialized_subtitles='')
+                                     .order_by('-id')[:options['versions']])
+        for version in qs:
+            samples.append((version.language_code,
+                            list(version.get_subtitle_items())))
+        return samples
+
+    def time(self, fn, repeat):
+        start = time.time()
+        for _ in xrange(repeat):
+            fn()
+        return (time.time() - start) / repeat
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        samples = self.samples(options)
+
+        if not samples:
+            print 'Nothing to benchmark.'
+            return
+
+        totals = {'dfxp_bytes': 0, 'packed_bytes': 0, 'dfxp_decode': 0.0,
+                  'packed_decode': 0.0, 'packed_count': 0.0}
+
+        for language_code, items in samples:
+            dfxp = compress(SubtitleSet.from_list(language_code, items).to_xml())
+            packed = pack_to_field(items)
+            assert is_packed(decompress(packed))
+
+            totals['dfxp_bytes'] += len(dfxp)
+            totals['packed_bytes'] += len(packed)
+
+            # This is what get_subtitles() used to do on every load.
+            totals['dfxp_decode'] += self.time(
+                lambda: list(load_from(decompress(dfxp), type='dfxp')
+                             .to_internal().subtitle_items()),
+                repeat)
+
+            totals['packed_decode'] += self.time(
+                lambda: list(PackedSubtitles.from_field(packed)
+                             .subtitle_items()),
+                repeat)
+
+            totals['packed_count'] += self.time(
+                lambda: len(PackedSubtitles.from_field(packed)), repeat)
+
+        n = len(samples)
+        print '%d samples, %d decodes each' % (n, repeat)
+        print ''
+        print '%-10s %14s %18s' % ('format', 'bytes/version', 'decode ms/version')
+        print '%-10s %14.0f %18.3f' % ('dfxp', totals['dfxp_bytes'] / float(n),
+                                       totals['dfxp_decode'] * 1000 / n)
+        print '%-10s %14.0f %18.3f' % ('packed',
+                                       totals['packed_bytes'] / float(n),
+                                       totals['packed_decode'] * 1000 / n)
+        print ''
+        print 'packed count only: %.3f ms/version' % (
+            totals['packed_count'] * 1000 / n)
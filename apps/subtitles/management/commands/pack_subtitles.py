@@ -0,0 +1,109 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2012 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+import logging
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from apps.subtitles.models import SubtitleVersion
+from apps.subtitles.packing import is_packed, pack_subtitle_set
+from babelsubs import load_from
+from utils.compress import decompress
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = ('Repacks SubtitleVersions still stored as DFXP into the packed '
+            'binary format.  Safe to run while the site is up.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', action='store', dest='batch_size',
+                    type='int', default=500,
+                    help='Number of versions to load per query.'),
+        make_option('--start-id', action='store', dest='start_id',
+                    type='int', default=0,
+                    help='Only repack versions with an id above this one.'),
+        make_option('--sleep', action='store', dest='sleep',
+                    type='float', default=0,
+                    help='Seconds to sleep between batches to go easy on the DB.'),
+        make_option('--dry-run', action='store_true', dest='dry_run',
+                    default=False, help="Don't write anything."),
+    )
+
+    def repack(self, version):
+        """Repack a single version.  Return True if it needed repacking."""
+        data = decompress(version.serialized_subtitles)
+
+        if is_packed(data):
+            return False
+
+        serialized, _ = pack_subtitle_set(
+            load_from(data, type='dfxp').to_internal(), version.language_code)
+
+        if not self.dry_run:
+            # Versions are immutable, so a targeted UPDATE is safe even while
+            # other processes are reading and writing the table.
+            (SubtitleVersion.objects.filter(pk=version.pk)
+                                    .update(serialized_subtitles=serialized))
+
+        return True
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity', 1))
+        batch_size = options['batch_size']
+        self.dry_run = options['dry_run']
+
+        last_id = options['start_id']
+        seen = repacked = failed = 0
+
+        while True:
+            # Walk the table by primary key so every batch is a cheap range scan
+            # and new versions written in the meantime don't shift the batches.
+            batch = list(SubtitleVersion.objects.filter(id__gt=last_id)
+                                                .exclude(serialized_subtitles='')
+                                                .order_by('id')
+                                                .only('id', 'language_code',
+                                                      'serialized_subtitles')
+                                                [:batch_size])
+            if not batch:
+                break
+
+            for version in batch:
+                seen += 1
+                try:
+                    if self.repack(version):
+                        repacked += 1
+                except Exception:
+                    failed += 1
+                    logger.exception("failed to repack version %s", version.pk)
+
+            last_id = batch[-1].pk
+
+            if verbosity >= 2:
+                print 'Checked up to id %s (%s repacked, %s failed)' % (
+                    last_id, repacked, failed)
+
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        if verbosity >= 1:
+            print '%s versions checked, %s repacked, %s failed' % (
+                seen, repacked, failed)
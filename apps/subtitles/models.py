@@ -32,7 +32,11 @@ from apps.videos.models import Video
 from babelsubs.storage import SubtitleSet
 from babelsubs import load_from
 
-from utils.compress import compress, decompress
+from apps.subtitles.packing import (
+    PackedSubtitles, apply_styles, is_packed, pack_subtitle_set
+)
+from libs.dxfpy.dxfpy import summarize_items
+from utils.compress import decompress
 
 ALL_LANGUAGES = sorted([(val, _(name)) for val, name in settings.ALL_LANGUAGES],
                        key=lambda v: v[1])
@@ -71,24 +75,36 @@ def ensure_stringy(val):
         raise ValidationError('Value must be a string.')
 
 def graphviz(video):
-    """Return the dot code for a Graphviz visualization of a video's history."""
+    """Return the dot code for a Graphviz visualization of a video's history.
 
+    This runs two queries no matter how many versions the video has.  Edges
+    come straight from the parents, which every version has, rather than from
+    the ancestry table.
+
+    """
     lines = []
 
     lines.append("digraph video_%s {" % video.video_id)
     lines.append("rankdir = BT;")
 
-    def _name(sv):
-        return '%s%d' % (sv.language_code, sv.version_number)
-
-    for sl in video.newsubtitlelanguage_set.all():
-        for sv in sl.subtitleversion_set.all():
-            lines.append('%s[label="%s"];' % (_name(sv), _name(sv)))
-
-    for sl in video.newsubtitlelanguage_set.all():
-        for sv in sl.subtitleversion_set.all():
-            for pv in sv.parents.all():
-                lines.append("%s -> %s;" % (_name(pv), _name(sv)))
+    def _name(language_code, version_number):
+        return '%s%d' % (language_code, version_number)
+
+    versions = (SubtitleVersion.objects.filter(video=video)
+                                       .values_list('language_code',
+                                                    'version_number'))
+    for v in versions:
+        lines.append('%s[label="%s"];' % (_name(*v), _name(*v)))
+
+    through = SubtitleVersion.parents.through
+    edges = (through.objects.filter(from_subtitleversion__video=video)
+                            .values_list(
+                                'to_subtitleversion__language_code',
+                                'to_subtitleversion__version_number',
+                                'from_subtitleversion__language_code',
+                                'from_subtitleversion__version_number'))
+    for pl, pn, l, n in edges:
+        lines.append("%s -> %s;" % (_name(pl, pn), _name(l, n)))
 
     lines.append("}")
 
@@ -325,25 +341,26 @@ class SubtitleLanguage(models.Model):
                         "their lineage!")
 
 
-    def add_version(self, *args, **kwargs):
-        """Add a SubtitleVersion to the tip of this language.
+    def prepare_version(self, tip, *args, **kwargs):
+        """Build, but do not save, a SubtitleVersion on top of the given tip.
 
-        You probably don't need this.  You probably want
-        apps.subtitles.pipeline.add_subtitles instead.
+        Returns a (version, parents) pair.  The version has its number and
+        lineage filled in and its parents have been sanity checked, but it has
+        not been validated or saved, and the parent links haven't been created.
 
-        Does not check any writelocking -- that's up to the pipeline.
+        This is the shared guts of add_version and the bulk pipeline, which
+        looks up the tips of many languages at once.  You probably want one of
+        those instead.
 
         """
         kwargs['subtitle_language'] = self
         kwargs['language_code'] = self.language_code
         kwargs['video'] = self.video
 
-        tip = self.get_tip()
-
         version_number = ((tip.version_number + 1) if tip else 1)
         kwargs['version_number'] = version_number
 
-        parents = (kwargs.pop('parents', None) or [])
+        parents = list(kwargs.pop('parents', None) or [])
 
         if tip:
             parents.append(tip)
@@ -357,11 +374,26 @@ class SubtitleLanguage(models.Model):
 
         self._sanity_check_parents(sv, parents)
 
+        return sv, parents
+
+    def add_version(self, *args, **kwargs):
+        """Add a SubtitleVersion to the tip of this language.
+
+        You probably don't need this.  You probably want
+        apps.subtitles.pipeline.add_subtitles instead.
+
+        Does not check any writelocking -- that's up to the pipeline.
+
+        """
+        sv, parents = self.prepare_version(self.get_tip(), *args, **kwargs)
+
         sv.full_clean()
         sv.save()
 
-        for p in parents:
-            sv.parents.add(p)
+        if parents:
+            sv.parents.add(*parents)
+
+        SubtitleVersionAncestry.objects.add_for_version(sv, parents)
 
         return sv
 
@@ -408,10 +440,19 @@ class SubtitleLanguage(models.Model):
         return self.subtitleversion_set.count()
 
     def get_subtitle_count(self):
-        tip = self.get_tip()
-        if tip:
-            return tip.get_subtitle_count()
-        return 0
+        # Only fetch the denormalized count so we don't drag the serialized
+        # subtitles of the tip across the wire.
+        counts = (self.subtitleversion_set.order_by('-version_number')
+                                          .values_list('subtitle_count',
+                                                       flat=True)[:1])
+        if not counts:
+            return 0
+
+        if counts[0] != None:
+            return counts[0]
+
+        # The tip hasn't been backfilled yet.
+        return self.get_tip().get_subtitle_count()
 
 
     def is_primary_audio_language(self):
@@ -497,31 +538,117 @@ class SubtitleVersion(models.Model):
 
     created = models.DateTimeField(editable=False)
 
-    # Subtitles are stored in a text blob, serialized as base64'ed zipped XML
-    # (oh the joys of Django).  Use the subtitles property to get and set them.
-    # You shouldn't be touching this field.
+    # Subtitles are stored in a text blob, serialized in the packed format from
+    # apps.subtitles.packing (older rows may still hold base64'ed zipped DFXP
+    # until the pack_subtitles command gets to them).  Use the get_subtitles
+    # and get_subtitle_items methods.  You shouldn't be touching this field.
     serialized_subtitles = models.TextField(blank=True)
 
     # Lineage is stored as a blob of JSON to save on DB rows.  You shouldn't
     # need to touch this field yourself, use the lineage property.
     serialized_lineage = models.TextField(blank=True)
 
+    # Denormalized summary fields.
+    # These are computed from the subtitles whenever they're set, so listings,
+    # billing and the widget don't need to decode the serialized subtitles just
+    # to get a few numbers.  A null subtitle_count means the version predates
+    # these fields and hasn't been backfilled (see the
+    # backfill_version_summaries command) yet.  Times are in milliseconds.
+    subtitle_count = models.PositiveIntegerField(null=True, blank=True,
+                                                 editable=False)
+    synced_subtitle_count = models.PositiveIntegerField(null=True, blank=True,
+                                                        editable=False)
+    first_subtitle_ms = models.IntegerField(null=True, blank=True,
+                                            editable=False)
+    last_subtitle_ms = models.IntegerField(null=True, blank=True,
+                                           editable=False)
+    duration_ms = models.IntegerField(null=True, blank=True, editable=False)
+
     objects = SubtitleVersionManager()
 
+    def _get_packed_subtitles(self):
+        """Return a PackedSubtitles for this version, or None for legacy data.
+
+        Legacy rows (DFXP blobs that haven't been repacked yet) return None, and
+        callers should fall back to parsing the XML.
+
+        """
+        if self._packed_subtitles == None:
+            if not self.serialized_subtitles:
+                self._packed_subtitles = PackedSubtitles.from_items([])
+            else:
+                data = decompress(self.serialized_subtitles)
+
+                if not is_packed(data):
+                    return None
+
+                self._packed_subtitles = PackedSubtitles(data)
+
+        return self._packed_subtitles
+
     def get_subtitles(self):
         """Return the SubtitleSet for this version.
 
         A SubtitleSet will always be returned.  It may be empty if there are no
         subtitles.
 
+        Building a SubtitleSet means building the full DFXP document, so only
+        use this when you really need DFXP (e.g. for exporting).  If you just
+        want to look at the subtitles use get_subtitle_items instead.
+
         """
         # We cache the parsed subs for speed.
         if self._subtitles == None:
-            self._subtitles = load_from(decompress(self.serialized_subtitles),
+            packed = self._get_packed_subtitles()
+
+            if packed != None:
+                self._subtitles = SubtitleSet.from_list(
+                    self.language_code, packed.subtitle_items())
+                apply_styles(self._subtitles, packed.get_styles())
+            else:
+                self._subtitles = load_from(
+                    decompress(self.serialized_subtitles),
                     type='dfxp').to_internal()
 
         return self._subtitles
 
+    def get_subtitle_items(self):
+        """Return an iterable of (from_ms, to_ms, content) tuples.
+
+        Packed versions are decoded lazily without ever building a DFXP
+        document.  Legacy versions hold whatever babelsubs wrote, which can use
+        any TTML time expression, so those are parsed by babelsubs itself.  Run
+        the pack_subtitles command to convert them.
+
+        """
+        if self._subtitles != None:
+            return self._subtitles.subtitle_items()
+
+        packed = self._get_packed_subtitles()
+
+        if packed != None:
+            return packed.subtitle_items()
+        else:
+            return self.get_subtitles().subtitle_items()
+
+    def get_subtitle_summary(self):
+        """Return count, synced count and timing information for the subtitles.
+
+        See libs.dxfpy.dxfpy.summarize_items for the keys of the returned
+        dictionary.  For packed versions only the timings are decoded, legacy
+        versions are parsed in full.
+
+        This always computes the summary from the subtitles themselves.  You
+        probably want the denormalized summary fields instead.
+
+        """
+        packed = self._get_packed_subtitles()
+
+        if packed != None:
+            return summarize_items(packed.timings())
+        else:
+            return summarize_items(self.get_subtitle_items())
+
     def set_subtitles(self, subtitles):
         """Set the SubtitleSet for this version.
 
@@ -549,10 +676,40 @@ class SubtitleVersion(models.Model):
                 raise TypeError("Cannot create SubtitleSet from type %s"
                                 % str(type(subtitles)))
 
-        self.serialized_subtitles = compress(subtitles.to_xml())
+        # We always go through a SubtitleSet when writing so the stored items
+        # are normalized exactly the way the DFXP would have been.
+        self.serialized_subtitles, items = pack_subtitle_set(
+            subtitles, self.language_code)
+        self.set_summary(summarize_items(items))
 
         # We cache the parsed subs for speed.
         self._subtitles = subtitles
+        self._packed_subtitles = None
+
+
+    def set_summary(self, summary):
+        """Set the denormalized summary fields from a summarize_items dict."""
+        self.subtitle_count = summary['count']
+        self.synced_subtitle_count = summary['synced_count']
+        self.first_subtitle_ms = summary['first_ms']
+        self.last_subtitle_ms = summary['last_ms']
+        self.duration_ms = summary['duration_ms']
+
+    def update_summary(self):
+        """Recompute the denormalized summary fields and save them.
+
+        Only the summary fields are written, so this is safe to run against
+        versions that are in use.
+
+        """
+        self.set_summary(self.get_subtitle_summary())
+
+        SubtitleVersion.objects.filter(pk=self.pk).update(
+            subtitle_count=self.subtitle_count,
+            synced_subtitle_count=self.synced_subtitle_count,
+            first_subtitle_ms=self.first_subtitle_ms,
+            last_subtitle_ms=self.last_subtitle_ms,
+            duration_ms=self.duration_ms)
 
 
     def get_lineage(self):
@@ -601,6 +758,7 @@ class SubtitleVersion(models.Model):
         super(SubtitleVersion, self).__init__(*args, **kwargs)
 
         self._subtitles = None
+        self._packed_subtitles = None
         if has_subtitles:
             self.set_subtitles(subtitles)
 
@@ -632,23 +790,167 @@ class SubtitleVersion(models.Model):
 
 
     def get_ancestors(self):
-        """Return all ancestors of this version.  WARNING: MAY EAT YOUR DB!
+        """Return all ancestors of this version.
 
-        Returning all ancestors of a version is very database-intensive, because
-        we need to walk each relation.  It will make roughly l^b database calls,
-        where l is the length of a branch of history and b is the "branchiness".
-
-        You probably don't need this.  You probably want to use the lineage
-        instead.  This is mostly here for sanity tests.
+        This is a single indexed query against the ancestry table.  You may
+        still want to use the lineage instead if you only need the latest
+        ancestor in each language.
 
         """
-        def _ancestors(version):
-            return [version] + list(mapcat(_ancestors, version.parents.all()))
+        return set(SubtitleVersion.objects.filter(
+            descendant_links__descendant=self))
 
-        return set(mapcat(_ancestors, self.parents.all()))
+    def get_descendants(self):
+        """Return all versions (in any language) descended from this one."""
+        return set(SubtitleVersion.objects.filter(
+            ancestor_links__ancestor=self))
 
     def get_subtitle_count(self):
-        return len([s for s in self.get_subtitles().subtitle_items()])
+        if self.subtitle_count != None:
+            return self.subtitle_count
+
+        packed = self._get_packed_subtitles()
+
+        if packed != None:
+            return len(packed)
+        else:
+            return sum(1 for _ in self.get_subtitle_items())
+
+
+# Ancestry --------------------------------------------------------------------
+def _ancestor_distances(parent_ids, closure):
+    """Return an {ancestor_id: distance} map for a version with these parents.
+
+    `closure` should map each parent id to its own {ancestor_id: distance}
+    map.  Where there are several paths to an ancestor we keep the shortest.
+
+    """
+    distances = {}
+
+    for parent_id in parent_ids:
+        candidates = [(parent_id, 1)] + [
+            (ancestor_id, distance + 1)
+            for ancestor_id, distance in closure.get(parent_id, {}).items()]
+
+        for ancestor_id, distance in candidates:
+            if distances.get(ancestor_id, distance) >= distance:
+                distances[ancestor_id] = distance
+
+    return distances
+
+class SubtitleVersionAncestryManager(models.Manager):
+    BATCH_SIZE = 1000
+
+    def add_for_version(self, version, parents):
+        """Record the ancestry of a newly-created version.
+
+        The new version's ancestors are its parents plus all of their
+        ancestors, which we can read in a single query since every parent
+        already has its own ancestry recorded.
+
+        """
+        self.add_for_versions([(version, parents)])
+
+    def add_for_versions(self, versions):
+        """Record the ancestry of many newly-created versions at once.
+
+        `versions` should be a list of (version, parents) pairs in the order the
+        versions were created, so a version's parents are either already in the
+        database or earlier in the list.  All the versions must have been saved.
+
+        This runs one query for the existing parents' ancestry and one bulk
+        insert, no matter how many versions are given.
+
+        """
+        new_ids = set(v.pk for v, _ in versions)
+        existing_parent_ids = set(p.pk for _, parents in versions
+                                  for p in parents) - new_ids
+
+        closure = {}
+        if existing_parent_ids:
+            links = (self.get_query_set()
+                         .filter(descendant__in=list(existing_parent_ids))
+                         .values_list('descendant_id', 'ancestor_id',
+                                      'distance'))
+            for descendant_id, ancestor_id, distance in links:
+                closure.setdefault(descendant_id, {})[ancestor_id] = distance
+
+        rows = []
+        for version, parents in versions:
+            distances = _ancestor_distances([p.pk for p in parents], closure)
+            closure[version.pk] = distances
+
+            rows.extend(
+                SubtitleVersionAncestry(video_id=version.video_id,
+                                        ancestor_id=ancestor_id,
+                                        descendant_id=version.pk,
+                                        distance=distance)
+                for ancestor_id, distance in distances.items())
+
+        if rows:
+            self.bulk_create(rows)
+
+    def rebuild_for_video(self, video):
+        """Rebuild the ancestry of every version of a video from its parents.
+
+        The backfill_version_ancestry command runs this for every video to
+        fill in the ancestry of versions created before the table existed.
+
+        """
+        through = SubtitleVersion.parents.through
+        edges = (through.objects.filter(from_subtitleversion__video=video)
+                                .values_list('from_subtitleversion_id',
+                                             'to_subtitleversion_id'))
+
+        parents = {}
+        for child_id, parent_id in edges:
+            parents.setdefault(child_id, []).append(parent_id)
+
+        # Parents are always created before their children, so walking the
+        # versions in id order means every parent is done before we need it.
+        closure = {}
+        for version_id in sorted(SubtitleVersion.objects.filter(video=video)
+                                                        .values_list('id',
+                                                                     flat=True)):
+            closure[version_id] = _ancestor_distances(
+                parents.get(version_id, []), closure)
+
+        self.get_query_set().filter(video=video).delete()
+
+        rows = [SubtitleVersionAncestry(video_id=video.pk,
+                                        ancestor_id=ancestor_id,
+                                        descendant_id=version_id,
+                                        distance=distance)
+                for version_id, distances in closure.items()
+                for ancestor_id, distance in distances.items()]
+        for i in xrange(0, len(rows), self.BATCH_SIZE):
+            self.bulk_create(rows[i:i + self.BATCH_SIZE])
+
+class SubtitleVersionAncestry(models.Model):
+    """An ancestry closure table for SubtitleVersions.
+
+    There is one row for every (ancestor, descendant) pair, across all the
+    languages of a video, so "all ancestors" or "all descendants" of a version
+    is a single indexed query instead of a recursive walk of the parents.
+
+    Distance is the length of the shortest path between the two versions.
+    A distance of 1 means the ancestor is a direct parent.
+
+    Rows are written by SubtitleLanguage.add_version.  Like versions, they are
+    never changed once written.
+
+    """
+    video = models.ForeignKey(Video)
+    ancestor = models.ForeignKey(SubtitleVersion,
+                                 related_name='descendant_links')
+    descendant = models.ForeignKey(SubtitleVersion,
+                                   related_name='ancestor_links')
+    distance = models.PositiveIntegerField(default=1)
+
+    objects = SubtitleVersionAncestryManager()
+
+    class Meta:
+        unique_together = [('ancestor', 'descendant')]
 
 
 # Collaborators ---------------------------------------------------------------
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2012 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+"""Compact binary storage for the subtitles of a SubtitleVersion.
+
+Originally every version stored its subtitles as a hunk of pretty-printed DFXP,
+zipped and base64'ed.  Reading a version meant decompressing the blob and
+parsing the entire XML document, even if all we wanted was to count the
+subtitles.
+
+The packed format stores the same (from_ms, to_ms, content) tuples in
+a flat binary layout:
+
+    header:  magic (4 bytes) + format version (1 byte)
+    items:   item count (uint32), then for each item
+             from_ms (int32), to_ms (int32), content length (uint32), content
+    styles:  style count (uint32), then for each entry
+             item index (uint32), style length (uint32), style
+
+All integers are big-endian.  A timing of -1 means "None" (unsynced).  Content
+and styles are UTF-8.  The styling side table is optional and sparse: it maps
+item indexes to an opaque string of styling data for items that need it.
+
+For SubtitleSets the styling data is a JSON object of the attributes of the
+subtitle's <p> (other than its timing), stored only for subtitles whose
+attributes differ from what SubtitleSet.from_list would generate.  Inline
+markup is part of the content.  Everything outside the <p>s (the head, the
+<div>s) is not stored and is regenerated by from_list when reading, just like
+for versions created from a list of tuples.
+
+The whole thing is then run through utils.compress just like the old format
+was, so the field stays a TextField that Django is happy with.  The magic
+bytes let us tell the two formats apart after decompressing, which is what
+lets the migration happen online.
+
+"""
+
+import struct
+
+from babelsubs.storage import SubtitleSet
+from django.utils import simplejson as json
+
+from utils.compress import compress, decompress
+
+
+MAGIC = 'AMSB'
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct('>4sB')
+_COUNT = struct.Struct('>I')
+_ITEM = struct.Struct('>iiI')
+_STYLE = struct.Struct('>II')
+
+_NO_TIME = -1
+
+
+# Utility functions -----------------------------------------------------------
+def _encode_time(ms):
+    return _NO_TIME if ms == None else int(ms)
+
+def _decode_time(ms):
+    return None if ms == _NO_TIME else ms
+
+def _encode_text(text):
+    if text == None:
+        return ''
+    if isinstance(text, unicode):
+        return text.encode('utf-8')
+    return text
+
+def _decode_text(data):
+    return data.decode('utf-8')
+
+_TIMING_ATTRS = ('begin', 'end', 'dur')
+
+def _style_attrs(el):
+    return dict((k, v) for k, v in el.attrib.items()
+                if k.rsplit('}', 1)[-1] not in _TIMING_ATTRS)
+
+
+# Packing ---------------------------------------------------------------------
+def pack(items, styles=None):
+    """Pack an iterable of (from_ms, to_ms, content) tuples into a bytestring.
+
+    `styles` can be a dictionary mapping item indexes to strings of styling
+    data.  Entries for indexes that do not exist are an error.
+
+    The result is raw binary data.  Use pack_to_field if you want something
+    you can store in a Django TextField.
+
+    """
+    parts = []
+    count = 0
+
+    for from_ms, to_ms, content in items:
+        content = _encode_text(content)
+        parts.append(_ITEM.pack(_encode_time(from_ms), _encode_time(to_ms),
+                                len(content)))
+        parts.append(content)
+        count += 1
+
+    styles = styles or {}
+    parts.append(_COUNT.pack(len(styles)))
+    for index in sorted(styles):
+        if not 0 <= index < count:
+            raise ValueError("Style given for nonexistent subtitle %d" % index)
+
+        style = _encode_text(styles[index])
+        parts.append(_STYLE.pack(index, len(style)))
+        parts.append(style)
+
+    return (_HEADER.pack(MAGIC, FORMAT_VERSION) + _COUNT.pack(count) +
+            ''.join(parts))
+
+def pack_to_field(items, styles=None):
+    """Pack the items and compress them for storage in a text field."""
+    return compress(pack(items, styles))
+
+def pack_subtitle_set(subtitles, language_code):
+    """Pack a SubtitleSet, keeping the attributes of its subtitles.
+
+    Returns a (field data, items) pair, where items is the list of
+    (from_ms, to_ms, content) tuples that were packed.
+
+    """
+    items = list(subtitles.subtitle_items())
+    plain = SubtitleSet.from_list(language_code, items)
+
+    styles = {}
+    for i, (el, plain_el) in enumerate(zip(subtitles.get_subtitles(),
+                                           plain.get_subtitles())):
+        attrs = _style_attrs(el)
+        if attrs != _style_attrs(plain_el):
+            styles[i] = json.dumps(attrs)
+
+    return pack_to_field(items, styles), items
+
+def apply_styles(subtitles, styles):
+    """Restore the subtitle attributes saved by pack_subtitle_set."""
+    for i, el in enumerate(subtitles.get_subtitles()):
+        if i in styles:
+            for k in el.attrib.keys():
+                if k.rsplit('}', 1)[-1] not in _TIMING_ATTRS:
+                    del el.attrib[k]
+            el.attrib.update(json.loads(styles[i]))
+
+def is_packed(data):
+    """Return whether a (decompressed) bytestring is in the packed format."""
+    return data[:len(MAGIC)] == MAGIC
+
+
+# Unpacking -------------------------------------------------------------------
+class PackedSubtitles(object):
+    """A read-only, lazily-decoded view of a packed set of subtitles.
+
+    Creating one of these only validates the header.  Items are decoded one at
+    a time as you iterate over subtitle_items(), so counting the subtitles or
+    looking at the first one never touches the rest of the data.
+
+    """
+    def __init__(self, data):
+        magic, version = _HEADER.unpack_from(data, 0)
+
+        if magic != MAGIC:
+            raise ValueError("Data is not in the packed subtitle format.")
+        if version != FORMAT_VERSION:
+            raise ValueError("Unknown packed subtitle format version %d."
+                             % version)
+
+        self._data = data
+        self._count, = _COUNT.unpack_from(data, _HEADER.size)
+        self._styles = None
+
+    @classmethod
+    def from_field(cls, field_data):
+        """Return a PackedSubtitles from a compressed field value."""
+        return cls(decompress(field_data))
+
+    @classmethod
+    def from_items(cls, items, styles=None):
+        """Return a PackedSubtitles from (from_ms, to_ms, content) tuples."""
+        return cls(pack(items, styles))
+
+    def __len__(self):
+        return self._count
+
+    def _iter_raw(self):
+        """Yield (from_ms, to_ms, content_start, content_end) for each item."""
+        data = self._data
+        offset = _HEADER.size + _COUNT.size
+
+        for _ in xrange(self._count):
+            from_ms, to_ms, length = _ITEM.unpack_from(data, offset)
+            offset += _ITEM.size
+
+            yield from_ms, to_ms, offset, offset + length
+            offset += length
+
+    def _styles_offset(self):
+        offset = _HEADER.size + _COUNT.size
+
+        for _, _, _, end in self._iter_raw():
+            offset = end
+
+        return offset
+
+    def subtitle_items(self):
+        """A generator over the subs, yielding (from_ms, to_ms, content) tuples.
+
+        This mirrors SubtitleSet.subtitle_items, but never builds an XML tree.
+
+        """
+        data = self._data
+
+        for from_ms, to_ms, start, end in self._iter_raw():
+            yield (_decode_time(from_ms), _decode_time(to_ms),
+                   _decode_text(data[start:end]))
+
+    def __iter__(self):
+        return self.subtitle_items()
+
+    def timings(self):
+        """A generator over (from_ms, to_ms) pairs that skips the content."""
+        for from_ms, to_ms, _, _ in self._iter_raw():
+            yield _decode_time(from_ms), _decode_time(to_ms)
+
+    def get_styles(self):
+        """Return the styling side table as a dictionary of index -> style."""
+        if self._styles == None:
+            data = self._data
+            offset = self._styles_offset()
+
+            styles = {}
+            count, = _COUNT.unpack_from(data, offset)
+            offset += _COUNT.size
+
+            for _ in xrange(count):
+                index, length = _STYLE.unpack_from(data, offset)
+                offset += _STYLE.size
+                styles[index] = _decode_text(data[offset:offset + length])
+                offset += length
+
+            self._styles = styles
+
+        return self._styles
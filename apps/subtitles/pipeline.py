@@ -54,9 +54,18 @@ a nutshell:
 
 """
 
-from django.db import transaction
+import datetime
 
-from apps.subtitles.models import SubtitleLanguage, SubtitleVersion
+from django.db import IntegrityError, transaction
+from django.db.models import Max, Q
+
+from apps.subtitles.models import (
+    SubtitleLanguage, SubtitleVersion, SubtitleVersionAncestry
+)
+
+
+# Number of items the bulk pipeline handles per round of queries.
+BULK_CHUNK_SIZE = 500
 
 
 def _strip_nones(d):
@@ -132,6 +141,213 @@ def _add_subtitles(video, language_code, subtitles, title, description, author,
     return version
 
 
+def _bulk_item(item):
+    """Normalize a bulk pipeline item into a dict of add_subtitles kwargs."""
+    if isinstance(item, dict):
+        item = dict(item)
+    else:
+        video, language_code, subtitles = item
+        item = {'video': video, 'language_code': language_code,
+                'subtitles': subtitles}
+
+    for k in ('title', 'description', 'author', 'visibility',
+              'visibility_override', 'parents'):
+        item.setdefault(k, None)
+
+    return item
+
+def _or_filter(qs, conditions):
+    """Filter the queryset to rows matching any of the given kwargs dicts."""
+    q = Q()
+    for condition in conditions:
+        q |= Q(**condition)
+    return qs.filter(q)
+
+def _bulk_get_languages(keys, videos):
+    """Return a {(video_id, language_code): SL} map, creating missing SLs.
+
+    `keys` should be a set of (video_id, language_code) pairs, and `videos`
+    a {video_id: video} map.
+
+    Runs one query for the existing languages, and one insert plus one query
+    for any that need creating.
+
+    """
+    languages = {}
+
+    conditions = [{'video': video_id, 'language_code': language_code}
+                  for video_id, language_code in keys]
+    for sl in _or_filter(SubtitleLanguage.objects.all(), conditions):
+        languages[(sl.video_id, sl.language_code)] = sl
+
+    missing = [k for k in keys if k not in languages]
+    if missing:
+        now = datetime.datetime.now()
+        sid = transaction.savepoint()
+        try:
+            SubtitleLanguage.objects.bulk_create([
+                SubtitleLanguage(video_id=video_id, language_code=language_code,
+                                 created=now)
+                for video_id, language_code in missing])
+            transaction.savepoint_commit(sid)
+        except IntegrityError:
+            # Somebody else created one of them in the meantime.  The query
+            # below will pick up their copy.
+            transaction.savepoint_rollback(sid)
+            for video_id, language_code in missing:
+                SubtitleLanguage.objects.get_or_create(
+                    video_id=video_id, language_code=language_code,
+                    defaults={'created': now})
+
+        conditions = [{'video': video_id, 'language_code': language_code}
+                      for video_id, language_code in missing]
+        for sl in _or_filter(SubtitleLanguage.objects.all(), conditions):
+            languages[(sl.video_id, sl.language_code)] = sl
+
+    # Spare each language a query for its video later.
+    for (video_id, _), sl in languages.items():
+        sl.video = videos[video_id]
+
+    return languages
+
+def _bulk_get_tips(languages):
+    """Return a {language_id: tip version} map for the given SLs.
+
+    Runs two queries.  The serialized subtitles of the tips are never loaded.
+
+    """
+    numbers = (SubtitleVersion.objects.filter(subtitle_language__in=languages)
+                                      .values('subtitle_language')
+                                      .annotate(number=Max('version_number')))
+    conditions = [{'subtitle_language': n['subtitle_language'],
+                   'version_number': n['number']} for n in numbers]
+
+    if not conditions:
+        return {}
+
+    tips = _or_filter(SubtitleVersion.objects.defer('serialized_subtitles'),
+                      conditions)
+    return dict((tip.subtitle_language_id, tip) for tip in tips)
+
+def _bulk_insert(prepared):
+    """Insert the prepared (index, version, parents) triples.
+
+    Versions, parent links and ancestry are each written with a single bulk
+    insert.  The versions' primary keys are filled in afterwards with one
+    query, since bulk_create can't return them.
+
+    """
+    versions = [sv for _, sv, _ in prepared]
+    SubtitleVersion.objects.bulk_create(versions)
+
+    conditions = [{'subtitle_language': sv.subtitle_language_id,
+                   'version_number': sv.version_number} for sv in versions]
+    ids = dict(((language_id, number), pk) for pk, language_id, number in
+               _or_filter(SubtitleVersion.objects.all(), conditions)
+                   .values_list('id', 'subtitle_language_id', 'version_number'))
+    for sv in versions:
+        sv.id = ids[(sv.subtitle_language_id, sv.version_number)]
+
+    through = SubtitleVersion.parents.through
+    through.objects.bulk_create([
+        through(from_subtitleversion_id=sv.pk, to_subtitleversion_id=p.pk)
+        for _, sv, parents in prepared for p in parents])
+
+    SubtitleVersionAncestry.objects.add_for_versions(
+        [(sv, parents) for _, sv, parents in prepared])
+
+def _bulk_add_chunk(items, results):
+    """Run one chunk of the bulk pipeline.
+
+    `items` is a list of (index, item) pairs.  Results are stored in the
+    `results` list at each item's index.
+
+    """
+    videos = dict((item['video'].pk, item['video']) for _, item in items)
+    keys = set((item['video'].pk, item['language_code']) for _, item in items)
+
+    languages = _bulk_get_languages(keys, videos)
+    tips = _bulk_get_tips(languages.values())
+
+    prepared = []
+    for index, item in items:
+        try:
+            video = item['video']
+            sl = languages[(video.pk, item['language_code'])]
+
+            data = {'title': item['title'],
+                    'description': item['description'],
+                    'author': item['author'],
+                    'visibility': item['visibility'],
+                    'visibility_override': item['visibility_override'],
+                    'parents': [_get_version(video, p)
+                                for p in (item['parents'] or [])]}
+            _strip_nones(data)
+
+            sv, parents = sl.prepare_version(tips.get(sl.pk),
+                                             subtitles=item['subtitles'],
+                                             **data)
+
+            # This is what full_clean does, minus the per-object uniqueness
+            # queries.  The version numbers come from the tips we just looked
+            # up and the database has the unique constraint anyway.
+            sv.clean_fields()
+            sv.clean()
+
+            # bulk_create bypasses save(), so we need to do its work here.
+            sv.created = datetime.datetime.now()
+        except Exception, e:
+            results[index] = (None, e)
+            continue
+
+        # Later items for the same language build on top of this one.
+        tips[sl.pk] = sv
+        prepared.append((index, sv, parents))
+
+    if not prepared:
+        return
+
+    sid = transaction.savepoint()
+    try:
+        _bulk_insert(prepared)
+        transaction.savepoint_commit(sid)
+    except IntegrityError:
+        # Most likely someone else added a version to one of these languages
+        # while we were working.  Fall back to adding the items one at a time
+        # so only the items that actually conflict fail.
+        transaction.savepoint_rollback(sid)
+        for index, item in items:
+            if results[index] is not None:
+                continue
+
+            sid = transaction.savepoint()
+            try:
+                version = _add_subtitles(
+                    item['video'], item['language_code'], item['subtitles'],
+                    item['title'], item['description'], item['author'],
+                    item['visibility'], item['visibility_override'],
+                    item['parents'])
+                transaction.savepoint_commit(sid)
+                results[index] = (version, None)
+            except Exception, e:
+                transaction.savepoint_rollback(sid)
+                results[index] = (None, e)
+        return
+
+    for index, sv, _ in prepared:
+        results[index] = (sv, None)
+
+def _bulk_add_subtitles(items):
+    items = [_bulk_item(item) for item in items]
+    results = [None] * len(items)
+
+    indexed = list(enumerate(items))
+    for start in xrange(0, len(indexed), BULK_CHUNK_SIZE):
+        _bulk_add_chunk(indexed[start:start + BULK_CHUNK_SIZE], results)
+
+    return results
+
+
 # Public API ------------------------------------------------------------------
 def add_subtitles_unsafe(video, language_code, subtitles,
                          title=None, description=None, author=None,
@@ -191,3 +407,30 @@ def add_subtitles(video, language_code, subtitles,
         return _add_subtitles(video, language_code, subtitles, title,
                               description, author, visibility,
                               visibility_override, parents)
+
+def add_subtitles_bulk(items):
+    """Add many sets of subtitles at once.  Meant for imports.
+
+    Each item can be a (video, language_code, subtitles) tuple, or a dictionary
+    with 'video', 'language_code' and 'subtitles' keys plus any of the keyword
+    arguments accepted by add_subtitles (title, description, author,
+    visibility, visibility_override, parents).  Items for the same language are
+    added in the order given, each on top of the previous one.  Explicit parents
+    must already exist before the batch starts.
+
+    Rather than doing the lookups and inserts for every item separately, the
+    languages and tips for a whole chunk of items are fetched in a handful of
+    queries and the versions, parent links and ancestry are written with bulk
+    inserts.  Lineage and parent sanity checks work the same way as they do for
+    add_subtitles.
+
+    A failing item doesn't abort the batch.  The return value is a list with
+    one (version, error) pair per item, in the same order as the items, where
+    exactly one of the pair is None.
+
+    It runs in a transaction.  Writelocking is not checked, same as
+    add_subtitles.
+
+    """
+    with transaction.commit_on_success():
+        return _bulk_add_subtitles(items)
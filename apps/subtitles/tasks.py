@@ -0,0 +1,43 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2012 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+import logging
+
+from celery.task import task
+
+
+logger = logging.getLogger(__name__)
+
+
+@task()
+def backfill_version_summaries(version_ids):
+    """Compute the denormalized summary fields for the given versions.
+
+    Returns the number of versions that failed.
+
+    """
+    from apps.subtitles.models import SubtitleVersion
+
+    failed = 0
+    for version in SubtitleVersion.objects.filter(pk__in=version_ids):
+        try:
+            version.update_summary()
+        except Exception:
+            failed += 1
+            logger.exception("failed to summarize version %s", version.pk)
+
+    return failed
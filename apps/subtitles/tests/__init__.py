@@ -1,2 +1,3 @@
 from apps.subtitles.tests.models import *
 from apps.subtitles.tests.pipeline import *
+from apps.subtitles.tests.packing import *
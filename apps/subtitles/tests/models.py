@@ -19,6 +19,7 @@
 
 """Basic sanity tests to make sure the subtitle models aren't completely broken."""
 
+from django.core.management import call_command
 from django.test import TestCase
 from django.db import IntegrityError
 
@@ -26,7 +27,10 @@ from babelsubs.storage import SubtitleSet
 
 from apps.auth.models import CustomUser as User
 from apps.subtitles import pipeline
-from apps.subtitles.models import SubtitleLanguage, Collaborator
+from apps.subtitles.models import (
+    SubtitleLanguage, SubtitleVersion, SubtitleVersionAncestry, Collaborator,
+    graphviz
+)
 from apps.subtitles.tests.utils import (
     make_video, make_video_2, make_video_3, make_sl, refresh, ids, parent_ids,
     ancestor_ids
@@ -162,6 +166,40 @@ class TestSubtitleVersion(TestCase):
         sv = refresh(sv)
         self.assertEqual(sv.get_subtitles(), SubtitleSet.from_list('en', [s0, s1]))
 
+    def test_summary_fields(self):
+        """Test the denormalized subtitle summary fields."""
+
+        sv = self.sl_en.add_version(subtitles=[])
+        sv = refresh(sv)
+        self.assertEqual(sv.subtitle_count, 0)
+        self.assertEqual(sv.synced_subtitle_count, 0)
+        self.assertEqual(sv.first_subtitle_ms, None)
+        self.assertEqual(sv.last_subtitle_ms, None)
+        self.assertEqual(sv.duration_ms, None)
+
+        sv = self.sl_en.add_version(subtitles=[(100, 200, "a"),
+                                               (300, 400, "b"),
+                                               (500, None, "c")])
+        sv = refresh(sv)
+        self.assertEqual(sv.subtitle_count, 3)
+        self.assertEqual(sv.synced_subtitle_count, 2)
+        self.assertEqual(sv.first_subtitle_ms, 100)
+        self.assertEqual(sv.last_subtitle_ms, 500)
+        self.assertEqual(sv.duration_ms, 400)
+        self.assertEqual(self.sl_en.get_subtitle_count(), 3)
+
+        # Versions that predate the fields get them computed on demand.
+        SubtitleVersion.objects.filter(pk=sv.pk).update(subtitle_count=None,
+                                                        duration_ms=None)
+        sv = refresh(sv)
+        self.assertEqual(sv.get_subtitle_count(), 3)
+        self.assertEqual(self.sl_en.get_subtitle_count(), 3)
+
+        sv.update_summary()
+        sv = refresh(sv)
+        self.assertEqual(sv.subtitle_count, 3)
+        self.assertEqual(sv.duration_ms, 400)
+
     def test_denormalization_sanity_checks(self):
         """Test the sanity checks for data denormalized into the version model."""
 
@@ -481,6 +519,54 @@ class TestHistory(TestCase):
         self.assertEqual(f3.lineage, {'fr': 2})
 
 
+    def test_ancestry_table(self):
+        """Test descendants, ancestry rebuilding and the graphviz output."""
+
+        # en fr
+        #    2
+        #   /|
+        #  2 |
+        #  | 1
+        #  |/
+        #  1
+        e1 = self.sl_en.add_version()
+        f1 = self.sl_fr.add_version(parents=[e1])
+        e2 = self.sl_en.add_version()
+        f2 = self.sl_fr.add_version(parents=[e2])
+
+        self.assertEqual(ids(e1.get_descendants()), ids([f1, e2, f2]))
+        self.assertEqual(ids(f1.get_descendants()), ids([f2]))
+        self.assertEqual(ids(f2.get_descendants()), ids([]))
+        self.assertEqual(ancestor_ids(f2), ids([e1, f1, e2]))
+
+        def _links():
+            return set(SubtitleVersionAncestry.objects
+                                              .filter(video=self.video)
+                                              .values_list('ancestor_id',
+                                                           'descendant_id',
+                                                           'distance'))
+
+        links = _links()
+        self.assertIn((e1.pk, f2.pk, 2), links)
+
+        # Rebuilding from the parents should give the exact same table.
+        SubtitleVersionAncestry.objects.rebuild_for_video(self.video)
+        self.assertEqual(_links(), links)
+
+        lines = graphviz(self.video)
+        self.assertIn('en1 -> fr1;', lines)
+        self.assertIn('en2 -> fr2;', lines)
+        self.assertIn('fr1 -> fr2;', lines)
+        self.assertNotIn('en1 -> fr2;', lines)
+
+        # The graph doesn't depend on the ancestry table being filled in.
+        SubtitleVersionAncestry.objects.filter(video=self.video).delete()
+        self.assertEqual(graphviz(self.video), lines)
+
+        # The backfill command fills it back in.
+        call_command('backfill_version_ancestry', verbosity=0)
+        self.assertEqual(_links(), links)
+
 class TestSubtitleLanguageHavingQueries(TestCase):
     """Test the [not_]having[_public]_versions methods of the SL manager.
 
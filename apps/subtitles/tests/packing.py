@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2012 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+"""Tests for the packed subtitle storage format."""
+
+from django.test import TestCase
+
+from babelsubs import load_from
+from babelsubs.storage import SubtitleSet
+
+from apps.subtitles.models import SubtitleVersion
+from apps.subtitles.packing import (
+    PackedSubtitles, is_packed, pack, pack_to_field
+)
+from apps.subtitles.tests.utils import make_video, make_sl, refresh
+from utils.compress import compress, decompress
+
+
+LEGACY_DFXP = """<tt xmlns="http://www.w3.org/ns/ttml" xml:lang="en">
+    <head/>
+    <body>
+        <div>
+            <p begin="00:00:01.500" end="00:00:02.000">a</p>
+            <p begin="00:00:02.500" end="00:00:03.250">b</p>
+        </div>
+    </body>
+</tt>"""
+
+
+class TestPacking(TestCase):
+    def test_round_trip(self):
+        items = [(100, 200, u'a'),
+                 (300, None, u'<b>b</b>'),
+                 (None, None, u'ünïcödé')]
+
+        packed = PackedSubtitles(pack(items))
+
+        self.assertEqual(len(packed), 3)
+        self.assertEqual(list(packed.subtitle_items()), items)
+        self.assertEqual(list(packed.timings()),
+                         [(100, 200), (300, None), (None, None)])
+        self.assertEqual(packed.get_styles(), {})
+
+    def test_empty(self):
+        packed = PackedSubtitles(pack([]))
+
+        self.assertEqual(len(packed), 0)
+        self.assertEqual(list(packed.subtitle_items()), [])
+
+    def test_styles(self):
+        items = [(0, 1, u'a'), (1, 2, u'b')]
+        packed = PackedSubtitles(pack(items, {1: u'italic'}))
+
+        self.assertEqual(list(packed.subtitle_items()), items)
+        self.assertEqual(packed.get_styles(), {1: u'italic'})
+
+        self.assertRaises(ValueError, lambda: pack(items, {2: u'bold'}))
+
+    def test_format_detection(self):
+        self.assertTrue(is_packed(decompress(pack_to_field([]))))
+        self.assertFalse(is_packed('<tt xmlns="http://www.w3.org/ns/ttml"/>'))
+
+        self.assertRaises(ValueError, lambda: PackedSubtitles('<tt/>'))
+
+
+class TestVersionStorage(TestCase):
+    def setUp(self):
+        self.video = make_video()
+        self.sl_en = make_sl(self.video, 'en')
+
+    def test_versions_are_packed(self):
+        sv = self.sl_en.add_version(subtitles=[(100, 200, "a"),
+                                               (300, 400, "b")])
+        sv = refresh(sv)
+
+        self.assertTrue(is_packed(decompress(sv.serialized_subtitles)))
+        self.assertEqual(sv.get_subtitle_count(), 2)
+        self.assertEqual(list(sv.get_subtitle_items()),
+                         [(100, 200, "a"), (300, 400, "b")])
+
+    def test_legacy_dfxp_versions(self):
+        subs = SubtitleSet.from_list('en', [(100, 200, "a"), (300, 400, "b")])
+
+        sv = self.sl_en.add_version()
+        SubtitleVersion.objects.filter(pk=sv.pk).update(
+            serialized_subtitles=compress(subs.to_xml()))
+        sv = refresh(sv)
+
+        self.assertEqual(sv.get_subtitles(), subs)
+        self.assertEqual(sv.get_subtitle_count(), 2)
+        self.assertEqual(list(sv.get_subtitle_items()),
+                         [(100, 200, "a"), (300, 400, "b")])
+
+    def test_styles_round_trip(self):
+        align = '{http://www.w3.org/ns/ttml#styling}textAlign'
+        subs = SubtitleSet.from_list('en', [(100, 200, "a"),
+                                            (300, 400, "<span>b</span>")])
+        subs.get_subtitles()[1].set(align, 'left')
+
+        sv = refresh(self.sl_en.add_version(subtitles=subs))
+        packed = PackedSubtitles.from_field(sv.serialized_subtitles)
+        self.assertEqual(packed.get_styles().keys(), [1])
+
+        els = sv.get_subtitles().get_subtitles()
+        self.assertEqual(els[0].get(align), None)
+        self.assertEqual(els[1].get(align), 'left')
+        self.assertEqual(list(sv.get_subtitles().subtitle_items()),
+                         list(subs.subtitle_items()))
+
+        # Versions created from plain tuples don't need a styling table.
+        sv = refresh(self.sl_en.add_version(subtitles=[(100, 200, "a")]))
+        packed = PackedSubtitles.from_field(sv.serialized_subtitles)
+        self.assertEqual(packed.get_styles(), {})
+
+    def _make_legacy(self, xml):
+        sv = self.sl_en.add_version()
+        SubtitleVersion.objects.filter(pk=sv.pk).update(
+            serialized_subtitles=compress(xml))
+        return refresh(sv)
+
+    def test_legacy_babelsubs_output(self):
+        subs = SubtitleSet.from_list('en', [(100, 200, "a"),
+                                            (300, None, "<b>b</b>"),
+                                            (None, None, "c")])
+        sv = self._make_legacy(subs.to_xml())
+
+        self.assertEqual(list(sv.get_subtitle_items()),
+                         list(subs.subtitle_items()))
+
+    def test_legacy_clock_times(self):
+        sv = self._make_legacy(LEGACY_DFXP)
+        expected = list(load_from(LEGACY_DFXP, type='dfxp').to_internal()
+                                                            .subtitle_items())
+
+        self.assertEqual(list(sv.get_subtitle_items()), expected)
+        self.assertEqual([item[:2] for item in expected],
+                         [(1500, 2000), (2500, 3250)])
+
+        sv.update_summary()
+        sv = refresh(sv)
+        self.assertEqual(sv.synced_subtitle_count, 2)
+        self.assertEqual(sv.first_subtitle_ms, 1500)
+        self.assertEqual(sv.last_subtitle_ms, 3250)
@@ -570,3 +570,70 @@ class TestBasicAdding(TestCase):
         # Shut up, Pyflakes.
         assert (en1 and en2 and en3 and fr1 and fr2 and fr3 and fr4 and
                 de1 and de2 and cy1 and cy2)
+
+
+class TestBulkAdding(TestCase):
+    def setUp(self):
+        self.video = make_video()
+        self.video2 = make_video_2()
+
+    def test_add_subtitles_bulk(self):
+        en1 = pipeline.add_subtitles(self.video, 'en', None)
+        fr1 = pipeline.add_subtitles(self.video, 'fr', None)
+
+        results = pipeline.add_subtitles_bulk([
+            (self.video, 'en', [(100, 200, "foo")]),
+            (self.video, 'de', [(100, 200, "das foo")]),
+            {'video': self.video2, 'language_code': 'en',
+             'subtitles': [(100, 200, "bar")], 'title': 'bar'},
+            {'video': self.video, 'language_code': 'en',
+             'subtitles': None, 'parents': [('fr', 1)]},
+        ])
+
+        self.assertEqual([error for _, error in results],
+                         [None, None, None, None])
+
+        en2, de1, v2_en1, en3 = [version for version, _ in results]
+
+        def _get(video, language_code, version_number):
+            return SubtitleVersion.objects.get(video=video,
+                                               language_code=language_code,
+                                               version_number=version_number)
+
+        self.assertEqual(en2.pk, _get(self.video, 'en', 2).pk)
+        self.assertEqual(de1.pk, _get(self.video, 'de', 1).pk)
+        self.assertEqual(v2_en1.pk, _get(self.video2, 'en', 1).pk)
+        self.assertEqual(en3.pk, _get(self.video, 'en', 3).pk)
+
+        self.assertEqual(list(_get(self.video, 'en', 2).get_subtitle_items()),
+                         [(100, 200, "foo")])
+        self.assertEqual(_get(self.video2, 'en', 1).title, 'bar')
+
+        # Parents, lineage and ancestry should match the single-item pipeline.
+        en3 = _get(self.video, 'en', 3)
+        self.assertEqual(set(p.pk for p in en3.parents.all()),
+                         set([en2.pk, fr1.pk]))
+        self.assertEqual(en3.lineage, {'en': 2, 'fr': 1})
+        self.assertEqual(set(v.pk for v in en3.get_ancestors()),
+                         set([en1.pk, en2.pk, fr1.pk]))
+
+    def test_bulk_failures(self):
+        results = pipeline.add_subtitles_bulk([
+            (self.video, 'en', None),
+            {'video': self.video, 'language_code': 'en', 'subtitles': None,
+             'title': 1},
+            {'video': self.video, 'language_code': 'en', 'subtitles': None,
+             'visibility': 'bogus'},
+            (self.video, 'en', None),
+        ])
+
+        self.assertEqual(results[0][1], None)
+        self.assertTrue(isinstance(results[1][1], ValidationError))
+        self.assertTrue(isinstance(results[2][1], ValidationError))
+        self.assertEqual(results[3][1], None)
+
+        # The failures shouldn't leave gaps in the version numbers.
+        self.assertEqual(results[0][0].version_number, 1)
+        self.assertEqual(results[3][0].version_number, 2)
+        self.assertEqual(
+            SubtitleVersion.objects.filter(video=self.video).count(), 2)
@@ -18,49 +18,47 @@
 
 from django.core.cache import cache
 
+from utils import cache_utils
+
 TIMEOUT = 60 * 60 * 24 * 5 # 5 days
 
+# Name for our metrics in utils.cache_utils.
+METRIC_NAME = 'teams-cache'
+
 
 def _team_readable_langs_id(team):
     return u"%s-readable-langs" % team.pk
 
 def _team_writable_langs_id(team):
-    return u"%s-readable-langs" % team.pk
+    return u"%s-writable-langs" % team.pk
 
 def _team_preferred_langs_id(team):
     return u"%s-preferred-langs" % team.pk
 
 
 def invalidate_lang_preferences(team):
-    cache.delete(_team_readable_langs_id(team))
-    cache.delete(_team_writable_langs_id(team))
-    cache.delete(_team_preferred_langs_id(team))
+    cache.delete_many([_team_readable_langs_id(team),
+                       _team_writable_langs_id(team),
+                       _team_preferred_langs_id(team)])
 
 
 def get_readable_langs(team):
-    cache_key = _team_readable_langs_id(team)
-    value = cache.get(cache_key)
-    if value is None:
-        from teams.models import TeamLanguagePreference
-        value = TeamLanguagePreference.objects._generate_readable(team)
-        cache.set(cache_key, value, TIMEOUT)
-    return value
+    from teams.models import TeamLanguagePreference
+    return cache_utils.get_or_compute(
+        _team_readable_langs_id(team),
+        lambda: TeamLanguagePreference.objects._generate_readable(team),
+        TIMEOUT, METRIC_NAME)
 
 def get_writable_langs(team):
-    cache_key = _team_writable_langs_id(team)
-    value = cache.get(cache_key)
-    if value is  None:
-        from teams.models import TeamLanguagePreference
-        value = TeamLanguagePreference.objects._generate_writable(team)
-        cache.set(cache_key, value, TIMEOUT)
-    return value
+    from teams.models import TeamLanguagePreference
+    return cache_utils.get_or_compute(
+        _team_writable_langs_id(team),
+        lambda: TeamLanguagePreference.objects._generate_writable(team),
+        TIMEOUT, METRIC_NAME)
 
 def get_preferred_langs(team):
-    cache_key = _team_preferred_langs_id(team)
-    value = cache.get(cache_key)
-    if value is  None:
-        from teams.models import TeamLanguagePreference
-        value = TeamLanguagePreference.objects._generate_preferred(team)
-        cache.set(cache_key, value, TIMEOUT)
-    return value
-
+    from teams.models import TeamLanguagePreference
+    return cache_utils.get_or_compute(
+        _team_preferred_langs_id(team),
+        lambda: TeamLanguagePreference.objects._generate_preferred(team),
+        TIMEOUT, METRIC_NAME)
@@ -0,0 +1,61 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2012 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from teams.models import Task, TeamVideo, task_title_key
+
+
+class Command(BaseCommand):
+    help = ('Fills in the project and video_title columns of existing tasks '
+            'from their team videos.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('-b', '--batch-size', action='store', dest='batch_size',
+                    type='int', default=500,
+                    help='Number of team videos to handle at once.'),
+    )
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity', 1))
+        batch_size = options['batch_size']
+
+        last_pk, updated = 0, 0
+        while True:
+            team_videos = list(TeamVideo.objects.filter(pk__gt=last_pk)
+                                                .select_related('video')
+                                                .order_by('pk')[:batch_size])
+            if not team_videos:
+                break
+
+            for tv in team_videos:
+                title = task_title_key(tv.title or tv.video.title)
+                updated += (Task.objects.filter(team_video=tv)
+                                        .exclude(project=tv.project_id,
+                                                 video_title=title)
+                                        .update(project=tv.project_id,
+                                                video_title=title))
+
+            last_pk = team_videos[-1].pk
+            if verbosity >= 2:
+                print 'Up to team video %d, %d tasks updated.' % (last_pk,
+                                                                   updated)
+
+        if verbosity >= 1:
+            print 'Updated %d tasks.' % updated
@@ -0,0 +1,54 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2012 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from haystack import site
+
+from teams.models import Team, TeamVideo
+
+
+class Command(BaseCommand):
+    args = '<team_slug>'
+    help = 'Reindexes all of the videos of a single team.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('-b', '--batch-size', action='store', dest='batch_size',
+                    type='int', default=None,
+                    help='Number of team videos to index at once.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Usage: update_team_index <team_slug>')
+
+        try:
+            team = Team.objects.get(slug=args[0])
+        except Team.DoesNotExist:
+            raise CommandError('No team with slug %s' % args[0])
+
+        verbosity = int(options.get('verbosity', 1))
+        index = site.get_index(TeamVideo)
+
+        if verbosity >= 1:
+            print 'Indexing videos of %s.' % team
+
+        count = index.update_team(team, options['batch_size'], verbosity)
+
+        if verbosity >= 1:
+            print 'Indexed %d team videos.' % count
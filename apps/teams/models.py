@@ -48,7 +48,9 @@ from utils import DEFAULT_PROTOCOL
 from utils.amazon import S3EnabledImageField, S3EnabledFileField
 from utils.panslugify import pan_slugify
 from utils.searching import get_terms
-from videos.models import Video, SubtitleLanguage, SubtitleVersion
+from videos.models import (
+    Video, SubtitleLanguage, SubtitleVersion, ActionFeedEntry
+)
 
 from functools import partial
 
@@ -749,6 +751,8 @@ class TeamVideo(models.Model):
 
         self.save()
 
+        ActionFeedEntry.objects.set_video_team(self.video_id, new_team.pk)
+
         # We need to make any as-yet-unmoderated versions public.
         # TODO: Dedupe this and the team video delete signal.
         video = self.video
@@ -881,6 +885,15 @@ def team_video_add_video_moderation(sender, instance, created, raw, **kwargs):
         instance.video.moderated_by = instance.team
         instance.video.save()
 
+def team_video_add_action_feed(sender, instance, created, raw, **kwargs):
+    """Add the existing activity of a newly added TeamVideo's Video to the team feed."""
+    if created and not raw:
+        ActionFeedEntry.objects.set_video_team(instance.video_id, instance.team_id)
+
+def team_video_rm_action_feed(sender, instance, **kwargs):
+    """Remove a deleted TeamVideo's Video activity from the team feed."""
+    ActionFeedEntry.objects.set_video_team(instance.video_id, None)
+
 def team_video_rm_video_moderation(sender, instance, **kwargs):
     """Clear the .moderated_by attribute on a newly deleted TeamVideo's Video, if necessary."""
     try:
@@ -897,6 +910,8 @@ post_save.connect(team_video_autocreate_task, TeamVideo, dispatch_uid='teams.tea
 post_save.connect(team_video_add_video_moderation, TeamVideo, dispatch_uid='teams.teamvideo.team_video_add_video_moderation')
 post_delete.connect(team_video_delete, TeamVideo, dispatch_uid="teams.teamvideo.team_video_delete")
 post_delete.connect(team_video_rm_video_moderation, TeamVideo, dispatch_uid="teams.teamvideo.team_video_rm_video_moderation")
+post_save.connect(team_video_add_action_feed, TeamVideo, dispatch_uid='teams.teamvideo.team_video_add_action_feed')
+post_delete.connect(team_video_rm_action_feed, TeamVideo, dispatch_uid='teams.teamvideo.team_video_rm_action_feed')
 
 
 # TeamMember
@@ -996,6 +1011,12 @@ def clear_tasks(sender, instance, *args, **kwargs):
 
 pre_delete.connect(clear_tasks, TeamMember, dispatch_uid='teams.members.clear-tasks-on-delete')
 
+def remove_action_feed_entries(sender, instance, **kwargs):
+    """Take the team's activity out of the feed of a user who left it."""
+    ActionFeedEntry.objects.remove_member(instance.team_id, instance.user_id)
+
+post_delete.connect(remove_action_feed_entries, TeamMember, dispatch_uid='teams.members.remove-action-feed-entries')
+
 
 # MembershipNarrowing
 class MembershipNarrowing(models.Model):
@@ -1626,6 +1647,16 @@ class Task(models.Model):
     # on complex criteria and expect us to be able to sort tasks on it.
     # Higher numbers mean higher priority
     priority = models.PositiveIntegerField(blank=True, default=0, db_index=True)
+
+    # Copied from the team video so the task list can be filtered, sorted and
+    # searched without joining through it.  Kept up to date by Task.save() and
+    # the TeamVideo/Video post_save handlers below.  video_title is the
+    # lowercased title, cut to fit an index, for prefix searches.
+    project = models.ForeignKey(Project, blank=True, null=True, editable=False,
+                                on_delete=models.SET_NULL)
+    video_title = models.CharField(max_length=255, blank=True, default='',
+                                   editable=False, db_index=True)
+
     # Review and Approval -specific fields
     approved = models.PositiveIntegerField(choices=APPROVED_CHOICES,
                                            null=True, blank=True)
@@ -2070,12 +2101,40 @@ class Task(models.Model):
             assert self.subtitle_version, \
                    "Review and Approve tasks must have a subtitle_version!"
 
+        self.project_id = self.team_video.project_id
+        self.video_title = task_title_key(self.team_video.title or
+                                          self.team_video.video.title)
+
         result = super(Task, self).save(*args, **kwargs)
         if update_team_video_index:
             update_one_team_video.delay(self.team_video.pk)
         return result
 
 
+def task_title_key(title):
+    """Return the Task.video_title value for the given title."""
+    return title.strip().lower()[:255]
+
+def team_video_update_tasks(sender, instance, raw, **kwargs):
+    """Copy a team video's project and title onto its tasks."""
+    if raw:
+        return
+
+    title = task_title_key(instance.title or instance.video.title)
+    (Task.objects.filter(team_video=instance)
+                 .exclude(project=instance.project_id, video_title=title)
+                 .update(project=instance.project_id, video_title=title))
+
+def video_update_tasks(sender, instance, raw, **kwargs):
+    """Copy a video's title onto the tasks of team videos using it."""
+    if raw:
+        return
+
+    title = task_title_key(instance.title)
+    (Task.objects.filter(team_video__video=instance, team_video__title='')
+                 .exclude(video_title=title)
+                 .update(video_title=title))
+
 def task_moderate_version(sender, instance, created, **kwargs):
     """If we create a review or approval task for this subtitle_version, mark it.
 
@@ -2089,6 +2148,10 @@ def task_moderate_version(sender, instance, created, **kwargs):
                 instance.subtitle_version.moderation_status = WAITING_MODERATION
                 instance.subtitle_version.save()
 
+post_save.connect(team_video_update_tasks, TeamVideo,
+                  dispatch_uid='teams.teamvideo.team_video_update_tasks')
+post_save.connect(video_update_tasks, Video,
+                  dispatch_uid='teams.video.video_update_tasks')
 post_save.connect(task_moderate_version, Task,
                   dispatch_uid="teams.task.task_moderate_version")
 
@@ -16,6 +16,8 @@
 # along with this program.  If not, see
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
+from django.utils.functional import cached_property
+
 from teams.models import Team, MembershipNarrowing, Workflow, TeamMember, Task
 
 from teams.permissions_const import (
@@ -82,35 +84,424 @@ def get_role(member):
     else:
         return member.role
 
-def get_role_for_target(user, team, project=None, lang=None):
-    """Return the role the given user effectively has for the given target.
+class PermissionContext(object):
+    """The permissions of one user in one team.
 
-    `lang` should be a string (the language code).
+    Everything the checks need (the user's membership and narrowings, the
+    team's workflows and projects) is loaded the first time it's needed and
+    then kept, so any number of checks against a context take a fixed number
+    of queries.
+
+    The module-level can_* functions build a throwaway context for each call.
+    Code that checks many tasks or team videos for the same user should get a
+    shared one from for_request() and use annotate_tasks() or
+    annotate_team_videos().
 
     """
-    member = get_member(user, team)
-    role = get_role(member)
-    narrowings = get_narrowings(member)
+    def __init__(self, user, team):
+        self.user = user
+        self.team = team
+        self._roles = {}
+        self._version_authors = {}
+
+    @classmethod
+    def for_request(cls, request, team):
+        """Return the context for request.user in team, built once per request."""
+        if not hasattr(request, '_permission_contexts'):
+            request._permission_contexts = {}
+
+        if team.pk not in request._permission_contexts:
+            request._permission_contexts[team.pk] = cls(request.user, team)
+
+        return request._permission_contexts[team.pk]
+
+    # Data
+    @cached_property
+    def member(self):
+        return get_member(self.user, self.team)
+
+    @cached_property
+    def narrowings(self):
+        return get_narrowings(self.member)
+
+    @cached_property
+    def workflows(self):
+        return list(Workflow.objects.filter(team=self.team.id)
+                                    .select_related('project', 'team',
+                                                    'team_video'))
+
+    @cached_property
+    def projects(self):
+        return list(self.team.project_set.all())
+
+    @cached_property
+    def admin_owner_count(self):
+        return self.team.members.filter(
+            user__is_active=True, role__in=(ROLE_ADMIN, ROLE_OWNER)
+        ).count()
+
+    def role_for_target(self, project=None, lang=None):
+        """Return the role the user effectively has for the given target.
+
+        `lang` should be a string (the language code).
+
+        """
+        # The default project is the same as "no project".
+        if project and project.is_default_project:
+            project = None
+
+        key = (project.pk if project else None, lang)
+        if key not in self._roles:
+            self._roles[key] = self._role_for_target(project, lang)
+        return self._roles[key]
+
+    def _role_for_target(self, project, lang):
+        role = get_role(self.member)
+
+        # If the user has no narrowings, just return their overall role.
+        if not self.narrowings:
+            return role
+
+        # Otherwise the narrowings must match the target.
+        project_narrowings = [n.project_id for n in self.narrowings
+                              if n.project_id]
+        lang_narrowings = [n.language for n in self.narrowings if n.language]
+
+        if project_narrowings and (not project or
+                                   project.pk not in project_narrowings):
+            return ROLE_CONTRIBUTOR
+
+        if lang_narrowings and lang not in lang_narrowings:
+            return ROLE_CONTRIBUTOR
 
-    # If the user has no narrowings, just return their overall role.
-    if not narrowings:
         return role
 
-    # Otherwise the narrowings must match the target.
-    project_narrowings = [n.project for n in narrowings if n.project]
-    lang_narrowings = [n.language for n in narrowings if n.language]
+    def workflow_for(self, team_video):
+        """Return the most specific Workflow for the given team video."""
+        # Check the cache first, so a cached workflow costs no queries at all.
+        if hasattr(team_video, '_cached_workflow'):
+            return team_video._cached_workflow
+
+        team_video._cached_workflow = self._find_workflow(team_video)
+        return team_video._cached_workflow
+
+    def _find_workflow(self, team_video):
+        # This is Workflow.get_for_target() over self.workflows, without the
+        # query it makes to find the project of a video with no workflow of
+        # its own.
+        for workflow in self.workflows:
+            if workflow.team_video_id == team_video.pk:
+                return workflow
+
+        if team_video.project_id:
+            for workflow in self.workflows:
+                if (workflow.project_id == team_video.project_id
+                    and not workflow.team_video_id
+                    and workflow.project.workflow_enabled):
+                    return workflow
+
+        if self.team.workflow_enabled:
+            for workflow in self.workflows:
+                if not workflow.project_id and not workflow.team_video_id:
+                    return workflow
+
+        return Workflow(team=self.team)
+
+    def _latest_version_author(self, team_video, lang):
+        key = (team_video.pk, lang)
+        if key not in self._version_authors:
+            version = team_video.video.latest_version(language_code=lang,
+                                                      public_only=False)
+            self._version_authors[key] = version.user_id if version else None
+        return self._version_authors[key]
+
+    def _prefetch_version_authors(self, tasks):
+        from videos.models import SubtitleLanguage, SubtitleVersion
+
+        wanted = set((t.team_video.video_id, t.language) for t in tasks
+                     if t.type == Task.TYPE_IDS['Review'] and t.language)
+        if not wanted:
+            return
+
+        # Video.subtitle_language() picks the language with the most
+        # subtitles when there's more than one with the same code.
+        languages = {}
+        for sl in (SubtitleLanguage.objects
+                   .filter(video__in=set(v for v, _ in wanted),
+                           language__in=set(l for _, l in wanted))
+                   .order_by('subtitle_count')):
+            if (sl.video_id, sl.language) in wanted:
+                languages[(sl.video_id, sl.language)] = sl.pk
+
+        authors = {}
+        for language_pk, user_pk in (SubtitleVersion.objects
+                                     .filter(language__in=languages.values())
+                                     .order_by('language', '-version_no')
+                                     .values_list('language', 'user')):
+            authors.setdefault(language_pk, user_pk)
+
+        for task in tasks:
+            key = (task.team_video.video_id, task.language)
+            if key in wanted:
+                self._version_authors[(task.team_video_id, task.language)] = \
+                    authors.get(languages.get(key))
+
+    # Team videos
+    def _video_policy_role(self):
+        return {
+            1: ROLE_CONTRIBUTOR,
+            2: ROLE_MANAGER,
+            3: ROLE_ADMIN,
+        }[self.team.video_policy]
+
+    def can_add_video(self, project=None):
+        role = self.role_for_target(project)
+        return role in _perms_equal_or_greater(self._video_policy_role())
+
+    def can_add_video_somewhere(self):
+        return any(self.can_add_video(project) for project in self.projects)
+
+    def can_edit_video(self, team_video):
+        if not team_video:
+            return False
+
+        role = self.role_for_target(team_video.project)
+        return role in _perms_equal_or_greater(self._video_policy_role())
 
-    # The default project is the same as "no project".
-    if project and project.is_default_project:
-        project = None
+    def can_remove_video(self, team_video):
+        return self.can_edit_video(team_video)
+
+    def can_delete_video(self):
+        return self.role_for_target() == ROLE_OWNER
+
+    def can_change_video_settings(self, team_video):
+        role = self.role_for_target(team_video.project)
+        return role in [ROLE_MANAGER, ROLE_ADMIN, ROLE_OWNER]
+
+    # Subtitles
+    def can_review_own_subtitles(self, role):
+        if role == ROLE_OWNER:
+            return True
+
+        if role == ROLE_ADMIN and self.admin_owner_count == 1:
+            return True
+
+        return False
+
+    def can_review(self, team_video, lang=None, allow_own=False):
+        workflow = self.workflow_for(team_video)
+        role = self.role_for_target(team_video.project, lang)
+
+        if not workflow.review_allowed:
+            return False
+
+        role_req = {
+            10: ROLE_CONTRIBUTOR,
+            20: ROLE_MANAGER,
+            30: ROLE_ADMIN,
+        }[workflow.review_allowed]
+
+        # Check that the user has the correct role.
+        if role not in _perms_equal_or_greater(role_req):
+            return False
+
+        # Users cannot review their own subtitles, unless we're specifically
+        # overriding that restriction in the arguments.
+        if allow_own:
+            return True
+
+        # Users usually cannot review their own subtitles.
+        if lang:
+            author = self._latest_version_author(team_video, lang)
+            if author is not None and author == self.user.id:
+                return self.can_review_own_subtitles(role)
+
+        return True
+
+    def can_approve(self, team_video, lang=None):
+        workflow = self.workflow_for(team_video)
+        role = self.role_for_target(team_video.project, lang)
+
+        if not workflow.approve_allowed:
+            return False
+
+        role_req = {
+            10: ROLE_MANAGER,
+            20: ROLE_ADMIN,
+        }[workflow.approve_allowed]
+
+        return role in _perms_equal_or_greater(role_req)
+
+    def can_delete_subs(self, team_video, lang=None):
+        role = self.role_for_target(team_video.project, lang)
+        return (self.can_unpublish_subs(team_video, lang) and
+                role in [ROLE_ADMIN, ROLE_OWNER])
+
+    def can_create_and_edit_subtitles(self, team_video, lang=None):
+        role = self.role_for_target(team_video.project, lang)
+
+        role_req = {
+            10: ROLE_OUTSIDER,
+            20: ROLE_CONTRIBUTOR,
+            30: ROLE_MANAGER,
+            40: ROLE_ADMIN,
+        }[self.team.subtitle_policy]
+
+        return role in _perms_equal_or_greater(role_req, include_outsiders=True)
+
+    def can_create_and_edit_translations(self, team_video, lang=None):
+        role = self.role_for_target(team_video.project, lang)
+
+        role_req = {
+            10: ROLE_OUTSIDER,
+            20: ROLE_CONTRIBUTOR,
+            30: ROLE_MANAGER,
+            40: ROLE_ADMIN,
+        }[self.team.translate_policy]
+
+        return role in _perms_equal_or_greater(role_req, include_outsiders=True)
+
+    def can_publish_edits_immediately(self, team_video, lang):
+        workflow = self.workflow_for(team_video)
+
+        if workflow.approve_allowed:
+            return self.can_approve(team_video, lang)
+
+        if workflow.review_allowed:
+            return self.can_review(team_video, lang)
+
+        return True
 
-    if project_narrowings and project not in project_narrowings:
-        return ROLE_CONTRIBUTOR
+    def can_unpublish_subs(self, team_video, lang):
+        workflow = self.workflow_for(team_video)
 
-    if lang_narrowings and lang not in lang_narrowings:
-        return ROLE_CONTRIBUTOR
+        if workflow.approve_allowed:
+            return self.can_approve(team_video, lang)
 
-    return role
+        if workflow.review_allowed:
+            return self.can_review(team_video, lang, allow_own=True)
+
+        return False
+
+    # Tasks
+    def can_assign_tasks(self, project=None, lang=None):
+        role = self.role_for_target(project, lang)
+
+        role_required = {
+            10: ROLE_CONTRIBUTOR,
+            20: ROLE_MANAGER,
+            30: ROLE_ADMIN,
+        }[self.team.task_assign_policy]
+
+        return role in _perms_equal_or_greater(role_required)
+
+    def can_delete_tasks(self, project=None, lang=None):
+        if self.role_for_target(project, lang) == ROLE_CONTRIBUTOR:
+            return False
+        return self.can_assign_tasks(project, lang)
+
+    def can_create_tasks_for(self, team_video):
+        # TODO: Take language into account for translate tasks.
+        return self.can_assign_tasks(team_video.project)
+
+    def can_perform_task_for(self, type, team_video, language):
+        if type:
+            type = int(type)
+
+        if type == Task.TYPE_IDS['Subtitle']:
+            return self.can_create_and_edit_subtitles(team_video)
+        elif type == Task.TYPE_IDS['Translate']:
+            return self.can_create_and_edit_translations(team_video, language)
+        elif type == Task.TYPE_IDS['Review']:
+            return self.can_review(team_video, language)
+        elif type == Task.TYPE_IDS['Approve']:
+            return self.can_approve(team_video, language)
+
+    def can_perform_task(self, task):
+        # See can_perform_task() below for why assignees get a pass here.
+        if task.get_type_display() in ['Review', 'Approve']:
+            if task.assignee_id and task.assignee_id == self.user.id:
+                return True
+
+        return self.can_perform_task_for(task.type, task.team_video,
+                                         task.language)
+
+    def can_assign_task(self, task):
+        return (self.can_assign_tasks(task.team_video.project, task.language)
+                and self.can_perform_task(task))
+
+    def can_decline_task(self, task):
+        return task.assignee_id == self.user.id
+
+    def can_delete_task(self, task):
+        can_delete = self.can_delete_tasks(task.team_video.project,
+                                           task.language)
+
+        # Allow stray review tasks to be deleted.
+        if task.type == Task.TYPE_IDS['Review']:
+            if not self.workflow_for(task.team_video).review_allowed:
+                return can_delete
+
+        # Allow stray approve tasks to be deleted.
+        if task.type == Task.TYPE_IDS['Approve']:
+            if not self.workflow_for(task.team_video).approve_allowed:
+                return can_delete
+
+        return can_delete and self.can_perform_task(task)
+
+    # Bulk
+    def annotate_tasks(self, tasks):
+        """Set allowed_actions on each of the given tasks.
+
+        allowed_actions is a dict of booleans keyed by 'perform', 'assign',
+        'decline' and 'delete'.  The tasks should have their team videos (and
+        those videos' projects) select_related.  Returns the tasks.
+
+        """
+        self._prefetch_version_authors(tasks)
+
+        for task in tasks:
+            task.allowed_actions = {
+                'perform': bool(self.can_perform_task(task)),
+                'assign': bool(self.can_assign_task(task)),
+                'decline': self.can_decline_task(task),
+                'delete': bool(self.can_delete_task(task)),
+            }
+
+        return tasks
+
+    def annotate_team_videos(self, team_videos):
+        """Set allowed_actions on each of the given team videos.
+
+        allowed_actions is a dict of booleans keyed by 'edit', 'remove',
+        'delete', 'change_settings', 'create_tasks', 'create_subtitles' and
+        'create_translations'.  The team videos should have their projects
+        select_related.  Returns the team videos.
+
+        """
+        for team_video in team_videos:
+            team_video.allowed_actions = {
+                'edit': self.can_edit_video(team_video),
+                'remove': self.can_remove_video(team_video),
+                'delete': self.can_delete_video(),
+                'change_settings': self.can_change_video_settings(team_video),
+                'create_tasks': self.can_create_tasks_for(team_video),
+                'create_subtitles':
+                    self.can_create_and_edit_subtitles(team_video),
+                'create_translations':
+                    self.can_create_and_edit_translations(team_video),
+            }
+
+        return team_videos
+
+
+def get_role_for_target(user, team, project=None, lang=None):
+    """Return the role the given user effectively has for the given target.
+
+    `lang` should be a string (the language code).
+
+    """
+    return PermissionContext(user, team).role_for_target(project, lang)
 
 
 def roles_user_can_assign(team, user, to_user=None):
@@ -350,35 +741,15 @@ def can_remove_member(team, user):
 
 def can_add_video(team, user, project=None):
     """Return whether the given user can add a video to the given target."""
-
-    role = get_role_for_target(user, team, project)
-    role_required = {
-        1: ROLE_CONTRIBUTOR,
-        2: ROLE_MANAGER,
-        3: ROLE_ADMIN,
-    }[team.video_policy]
-
-    return role in _perms_equal_or_greater(role_required)
+    return PermissionContext(user, team).can_add_video(project)
 
 def can_add_video_somewhere(team, user):
     """Return whether the given user can add a video somewhere in the given team."""
-
-    # TODO: Make this faster.
-    return any(can_add_video(team, user, project)
-               for project in team.project_set.all())
+    return PermissionContext(user, team).can_add_video_somewhere()
 
 def can_remove_video(team_video, user):
     """Return whether the given user can remove the given team video."""
-
-    role = get_role_for_target(user, team_video.team, team_video.project)
-
-    role_required = {
-        1: ROLE_CONTRIBUTOR,
-        2: ROLE_MANAGER,
-        3: ROLE_ADMIN,
-    }[team_video.team.video_policy]
-
-    return role in _perms_equal_or_greater(role_required)
+    return PermissionContext(user, team_video.team).can_remove_video(team_video)
 
 def can_delete_video(team_video, user):
     """Returns whether the give user can delete a team video from unisubs entirely.
@@ -394,25 +765,14 @@ def can_delete_video_in_team(team, user):
     Currently only team owners have this permission.
 
     """
-    role = get_role_for_target(user, team)
-
-    return role in [ROLE_OWNER]
+    return PermissionContext(user, team).can_delete_video()
 
 def can_edit_video(team_video, user):
     """Return whether the given user can edit the given video."""
-
     if not team_video:
         return False
 
-    role = get_role_for_target(user, team_video.team, team_video.project)
-
-    role_required = {
-        1: ROLE_CONTRIBUTOR,
-        2: ROLE_MANAGER,
-        3: ROLE_ADMIN,
-    }[team_video.team.video_policy]
-
-    return role in _perms_equal_or_greater(role_required)
+    return PermissionContext(user, team_video.team).can_edit_video(team_video)
 
 
 def can_view_settings_tab(team, user):
@@ -455,8 +815,8 @@ def can_invite(team, user):
     return role in _perms_equal_or_greater(role_required)
 
 def can_change_video_settings(user, team_video):
-    role = get_role_for_target(user, team_video.team, team_video.project, None)
-    return role in [ROLE_MANAGER, ROLE_ADMIN, ROLE_OWNER]
+    context = PermissionContext(user, team_video.team)
+    return context.can_change_video_settings(team_video)
 
 
 def can_review_own_subtitles(role, team_video):
@@ -471,69 +831,14 @@ def can_review_own_subtitles(role, team_video):
     one can review their own subs.
 
     '''
-
-    if role == ROLE_OWNER:
-        return True
-
-    if role == ROLE_ADMIN:
-        admin_owner_count = team_video.team.members.filter(
-            user__is_active=True, role__in=(ROLE_ADMIN, ROLE_OWNER)
-        ).count()
-
-        if admin_owner_count == 1:
-            return True
-
-    return False
+    return PermissionContext(None, team_video.team).can_review_own_subtitles(role)
 
 def can_review(team_video, user, lang=None, allow_own=False):
-    workflow = Workflow.get_for_team_video(team_video)
-    role = get_role_for_target(user, team_video.team, team_video.project, lang)
-
-    if not workflow.review_allowed:
-        return False
-
-    role_req = {
-        10: ROLE_CONTRIBUTOR,
-        20: ROLE_MANAGER,
-        30: ROLE_ADMIN,
-    }[workflow.review_allowed]
-
-    # Check that the user has the correct role.
-    if role not in _perms_equal_or_greater(role_req):
-        return False
-
-    # Users cannot review their own subtitles, unless we're specifically
-    # overriding that restriction in the arguments.
-    if allow_own:
-        return True
-
-    # Users usually cannot review their own subtitles.
-    if not hasattr(team_video, '_cached_version_for_review'):
-        team_video._cached_version_for_review = team_video.video.latest_version(language_code=lang, public_only=False)
-
-    subtitle_version = team_video._cached_version_for_review
-
-    if lang and subtitle_version.user_id == user.id:
-        if can_review_own_subtitles(role, team_video):
-            return True
-        else:
-            return False
-
-    return True
+    context = PermissionContext(user, team_video.team)
+    return context.can_review(team_video, lang, allow_own)
 
 def can_approve(team_video, user, lang=None):
-    workflow = Workflow.get_for_team_video(team_video)
-    role = get_role_for_target(user, team_video.team, team_video.project, lang)
-
-    if not workflow.approve_allowed:
-        return False
-
-    role_req = {
-        10: ROLE_MANAGER,
-        20: ROLE_ADMIN,
-    }[workflow.approve_allowed]
-
-    return role in _perms_equal_or_greater(role_req)
+    return PermissionContext(user, team_video.team).can_approve(team_video, lang)
 
 def can_delete_subs(team_video, user, lang=None):
     """Return whether the user has permission to delete subtitles.
@@ -541,8 +846,8 @@ def can_delete_subs(team_video, user, lang=None):
     lang should be a language code string.
 
     """
-    role = get_role_for_target(user, team_video.team, team_video.project, lang)
-    return can_unpublish_subs(team_video, user, lang) and role in [ROLE_ADMIN, ROLE_OWNER]
+    context = PermissionContext(user, team_video.team)
+    return context.can_delete_subs(team_video, lang)
 
 
 def can_message_all_members(team, user):
@@ -561,28 +866,12 @@ def can_edit_project(team, user, project):
     return role in [ROLE_ADMIN, ROLE_OWNER]
 
 def can_create_and_edit_subtitles(user, team_video, lang=None):
-    role = get_role_for_target(user, team_video.team, team_video.project, lang)
-
-    role_req = {
-        10: ROLE_OUTSIDER,
-        20: ROLE_CONTRIBUTOR,
-        30: ROLE_MANAGER,
-        40: ROLE_ADMIN,
-    }[team_video.team.subtitle_policy]
-
-    return role in _perms_equal_or_greater(role_req, include_outsiders=True)
+    context = PermissionContext(user, team_video.team)
+    return context.can_create_and_edit_subtitles(team_video, lang)
 
 def can_create_and_edit_translations(user, team_video, lang=None):
-    role = get_role_for_target(user, team_video.team, team_video.project, lang)
-
-    role_req = {
-        10: ROLE_OUTSIDER,
-        20: ROLE_CONTRIBUTOR,
-        30: ROLE_MANAGER,
-        40: ROLE_ADMIN,
-    }[team_video.team.translate_policy]
-
-    return role in _perms_equal_or_greater(role_req, include_outsiders=True)
+    context = PermissionContext(user, team_video.team)
+    return context.can_create_and_edit_translations(team_video, lang)
 
 
 def can_publish_edits_immediately(team_video, user, lang):
@@ -594,15 +883,8 @@ def can_publish_edits_immediately(team_video, user, lang):
     lang should be a language code string.
 
     """
-    workflow = Workflow.get_for_team_video(team_video)
-
-    if workflow.approve_allowed:
-        return can_approve(team_video, user, lang)
-
-    if workflow.review_allowed:
-        return can_review(team_video, user, lang)
-
-    return True
+    context = PermissionContext(user, team_video.team)
+    return context.can_publish_edits_immediately(team_video, lang)
 
 
 def can_unpublish_subs(team_video, user, lang):
@@ -611,15 +893,8 @@ def can_unpublish_subs(team_video, user, lang):
     lang should be a language code string.
 
     """
-    workflow = Workflow.get_for_team_video(team_video)
-
-    if workflow.approve_allowed:
-        return can_approve(team_video, user, lang)
-
-    if workflow.review_allowed:
-        return can_review(team_video, user, lang, allow_own=True)
-
-    return False
+    context = PermissionContext(user, team_video.team)
+    return context.can_unpublish_subs(team_video, lang)
 
 
 # Task permissions
@@ -631,40 +906,17 @@ def can_create_tasks(team, user, project=None):
 
 def can_delete_tasks(team, user, project=None, lang=None):
     """Return whether the given user has permission to delete tasks at all."""
-
-    role = get_role_for_target(user, team, project, lang)
-    if role == ROLE_CONTRIBUTOR:
-        return False
-    return can_assign_tasks(team, user, project, lang)
+    return PermissionContext(user, team).can_delete_tasks(project, lang)
 
 def can_assign_tasks(team, user, project=None, lang=None):
     """Return whether the given user has permission to assign tasks at all."""
-
-    role = get_role_for_target(user, team, project, lang)
-
-    role_required = {
-        10: ROLE_CONTRIBUTOR,
-        20: ROLE_MANAGER,
-        30: ROLE_ADMIN,
-    }[team.task_assign_policy]
-
-    return role in _perms_equal_or_greater(role_required)
+    return PermissionContext(user, team).can_assign_tasks(project, lang)
 
 
 def can_perform_task_for(user, type, team_video, language):
     """Return whether the given user can perform the given type of task."""
-
-    if type:
-        type = int(type)
-
-    if type == Task.TYPE_IDS['Subtitle']:
-        return can_create_and_edit_subtitles(user, team_video)
-    elif type == Task.TYPE_IDS['Translate']:
-        return can_create_and_edit_translations(user, team_video, language)
-    elif type == Task.TYPE_IDS['Review']:
-        return can_review(team_video, user, language)
-    elif type == Task.TYPE_IDS['Approve']:
-        return can_approve(team_video, user, language)
+    context = PermissionContext(user, team_video.team)
+    return context.can_perform_task_for(type, team_video, language)
 
 def can_perform_task(user, task):
     """Return whether the given user can perform the given task."""
@@ -683,11 +935,7 @@ def can_perform_task(user, task):
     # right now.
     #
     # TODO: Remove this hack once we get the "origin" of versions in place.
-    if task.get_type_display() in ['Review', 'Approve']:
-        if task.assignee == user:
-            return True
-
-    return can_perform_task_for(user, task.type, task.team_video, task.language)
+    return PermissionContext(user, task.team).can_perform_task(task)
 
 def can_assign_task(task, user):
     """Return whether the given user can assign the given task.
@@ -698,9 +946,7 @@ def can_assign_task(task, user):
     * They can perform the task themselves.
 
     """
-    team, project, lang = task.team, task.team_video.project, task.language
-
-    return can_assign_tasks(team, user, project, lang) and can_perform_task(user, task)
+    return PermissionContext(user, task.team).can_assign_task(task)
 
 def can_decline_task(task, user):
     """Return whether the given user can decline the given task.
@@ -714,48 +960,16 @@ def can_decline_task(task, user):
 
 def can_delete_task(task, user):
     """Return whether the given user can delete the given task."""
-
-    team, project, lang = task.team, task.team_video.project, task.language
-
-    can_delete = can_delete_tasks(team, user, project, lang)
-
-    # Allow stray review tasks to be deleted.
-    if task.type == Task.TYPE_IDS['Review']:
-        workflow = Workflow.get_for_team_video(task.team_video)
-        if not workflow.review_allowed:
-            return can_delete
-
-    # Allow stray approve tasks to be deleted.
-    if task.type == Task.TYPE_IDS['Approve']:
-        workflow = Workflow.get_for_team_video(task.team_video)
-        if not workflow.approve_allowed:
-            return can_delete
-
-    return can_delete and can_perform_task(user, task)
+    return PermissionContext(user, task.team).can_delete_task(task)
 
 
 def _user_can_create_task_subtitle(user, team_video):
-    role = get_role_for_target(user, team_video.team, team_video.project, None)
-
-    role_req = {
-        10: ROLE_CONTRIBUTOR,
-        20: ROLE_MANAGER,
-        30: ROLE_ADMIN,
-    }[team_video.team.task_assign_policy]
-
-    return role in _perms_equal_or_greater(role_req)
+    context = PermissionContext(user, team_video.team)
+    return context.can_create_tasks_for(team_video)
 
 def _user_can_create_task_translate(user, team_video):
-    # TODO: Take language into account here
-    role = get_role_for_target(user, team_video.team, team_video.project, None)
-
-    role_req = {
-        10: ROLE_CONTRIBUTOR,
-        20: ROLE_MANAGER,
-        30: ROLE_ADMIN,
-    }[team_video.team.task_assign_policy]
-
-    return role in _perms_equal_or_greater(role_req)
+    context = PermissionContext(user, team_video.team)
+    return context.can_create_tasks_for(team_video)
 
 
 def can_create_task_subtitle(team_video, user=None, workflows=None):
@@ -17,6 +17,7 @@
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
 from django.conf import settings
+from django.db import reset_queries
 from django.db.models import Count
 from haystack import site
 from haystack.backends import SQ
@@ -33,6 +34,80 @@ from haystack.exceptions import AlreadyRegistered
 LANGUAGES_DICT = dict(settings.ALL_LANGUAGES)
 
 
+class _LatestVersions(object):
+    """The latest versions and their subtitles for a set of languages.
+
+    Answers SubtitleLanguage.is_complete_and_synced() and
+    SubtitleVersion.is_all_blank() for all of the languages from two queries,
+    by handing those methods the versions and subtitles loaded here instead of
+    running several queries per language.
+
+    """
+    def __init__(self, languages):
+        from videos.models import Subtitle, SubtitleVersion
+
+        self.languages = languages
+        self.latest = {}
+        self.latest_public = {}
+        self.newest_date = {}
+
+        versions = (SubtitleVersion.objects
+                    .filter(language__in=languages.keys())
+                    .defer('title', 'description', 'note')
+                    .order_by('language', '-version_no'))
+        for version in versions:
+            pk = version.language_id
+            # Saves a query in is_dependent().
+            version.language = languages[pk]
+            self.latest.setdefault(pk, version)
+            if version.is_public and pk not in self.latest_public:
+                self.latest_public[pk] = version
+            date = version.datetime_started
+            if pk not in self.newest_date or date > self.newest_date[pk]:
+                self.newest_date[pk] = date
+
+        version_pks = (set(v.pk for v in self.latest.values()) |
+                       set(v.pk for v in self.latest_public.values()))
+        self.subtitles = {}
+        for subtitle in (Subtitle.objects.filter(version__in=version_pks)
+                                         .order_by('version', 'subtitle_order')):
+            self.subtitles.setdefault(subtitle.version_id, []).append(subtitle)
+
+    def _subtitle_args(self, language, version):
+        # Translations take their timing from the latest public version of
+        # their standard language.
+        standard = self.latest_public.get(language.standard_language_id)
+        return {
+            'subtitles_to_use': self.subtitles.get(version.pk, []),
+            'standard_subtitles': (self.subtitles.get(standard.pk, [])
+                                   if standard else []),
+        }
+
+    def has_nonblank_subtitles(self, language):
+        version = self.latest.get(language.pk)
+        if version is None:
+            return False
+        args = self._subtitle_args(language, version)
+        return not version.is_all_blank(
+            subtitles=args['subtitles_to_use'],
+            standard_subtitles=args['standard_subtitles'])
+
+    def is_complete_and_synced(self, language):
+        version = self.latest_public.get(language.pk)
+        if version:
+            subtitles = version.subtitles(
+                **self._subtitle_args(language, version))
+        else:
+            subtitles = []
+        return language.is_complete_and_synced(
+            standard_language=self.languages.get(
+                language.standard_language_id),
+            subtitles=subtitles)
+
+    def latest_submission(self, language):
+        return self.newest_date.get(language.pk)
+
+
 class TeamVideoLanguagesIndex(SearchIndex):
     text = CharField(
         document=True, use_template=True,
@@ -85,8 +160,107 @@ class TeamVideoLanguagesIndex(SearchIndex):
     # * Fully translated, if a translation
     num_completed_langs = IntegerField()
 
+    BATCH_SIZE = getattr(settings, 'HAYSTACK_BATCH_SIZE', 1000)
+
+    def index_queryset(self):
+        return models.TeamVideo.objects.select_related('team', 'project',
+                                                       'video')
+
+    def prefetch(self, objects):
+        """Compute the language data for a chunk of team videos at once.
+
+        prepare() used to work out which languages are complete one language
+        at a time, loading the latest versions and their subtitles for each.
+        Here the languages, versions and subtitles for the whole chunk are
+        loaded in a few queries and the same checks are run in Python.  The
+        results are stored on the team videos for prepare() to pick up.
+
+        """
+        from videos.models import SubtitleLanguage
+
+        if not objects:
+            return
+
+        video_pks = [obj.video_id for obj in objects]
+        data = dict((pk, {'original_language': None, 'total_langs': [],
+                          'completed_langs': [], 'latest_submission': None})
+                    for pk in video_pks)
+
+        languages = list(SubtitleLanguage.objects.filter(video__in=video_pks))
+        by_pk = dict((sl.pk, sl) for sl in languages)
+
+        # Translations can be based on languages we haven't loaded yet.
+        missing = set(sl.standard_language_id for sl in languages
+                      if sl.standard_language_id) - set(by_pk)
+        if missing:
+            by_pk.update((sl.pk, sl) for sl in
+                         SubtitleLanguage.objects.filter(pk__in=missing))
+
+        versions = _LatestVersions(by_pk)
+
+        for sl in languages:
+            item = data[sl.video_id]
+            if sl.is_original and item['original_language'] is None:
+                item['original_language'] = sl
+            if versions.has_nonblank_subtitles(sl):
+                item['total_langs'].append(sl)
+            if versions.is_complete_and_synced(sl):
+                item['completed_langs'].append(sl)
+            submitted = versions.latest_submission(sl)
+            if submitted and (item['latest_submission'] is None or
+                              submitted > item['latest_submission']):
+                item['latest_submission'] = submitted
+
+        task_counts = dict(
+            models.Task.objects.incomplete()
+                               .filter(team_video__in=[o.pk for o in objects])
+                               .order_by().values_list('team_video')
+                               .annotate(n=Count('id')))
+
+        for obj in objects:
+            obj._search_index_data = dict(data[obj.video_id],
+                                          task_count=task_counts.get(obj.pk, 0))
+            # Saves a query per call to subtitle_language().
+            obj.video._original_subtitle = \
+                data[obj.video_id]['original_language']
+
+    def update_team(self, team, batch_size=None, verbosity=0):
+        """Reindex all of a team's videos, sending them to Solr in chunks.
+
+        Returns the number of team videos indexed.
+
+        """
+        batch_size = batch_size or self.BATCH_SIZE
+        qs = self.index_queryset().filter(team=team).order_by('-pk')
+
+        last_pk = None
+        count = 0
+        while True:
+            chunk_qs = qs if last_pk is None else qs.filter(pk__lt=last_pk)
+            objects = list(chunk_qs[:batch_size])
+            if not objects:
+                break
+
+            last_pk = objects[-1].pk
+            count += len(objects)
+
+            self.prefetch(objects)
+            self.backend.update(self, objects)
+
+            if verbosity >= 2:
+                print '  indexed %d.' % count
+
+            reset_queries()
+
+        return count
+
     def prepare(self, obj):
         self.prepared_data = super(TeamVideoLanguagesIndex, self).prepare(obj)
+
+        if getattr(obj, '_search_index_data', None) is None:
+            self.prefetch([obj])
+        data = obj._search_index_data
+
         self.prepared_data['team_id'] = obj.team.id
         self.prepared_data['team_video_pk'] = obj.id
         self.prepared_data['video_pk'] = obj.video.id
@@ -112,22 +286,19 @@ class TeamVideoLanguagesIndex(SearchIndex):
         self.prepared_data['project_slug'] = obj.project.slug
         self.prepared_data['team_video_create_date'] = obj.created
 
-        completed_sls = obj.video.completed_subtitle_languages()
-        all_sls = (obj.video.subtitlelanguage_set
-                            .annotate(num_versions=Count('subtitleversion'))
-                            .filter(num_versions__gt=0))
-        all_sls = [sl for sl in all_sls
-                   if not sl.latest_version(public_only=False).is_all_blank()]
+        completed_sls = data['completed_langs']
 
-        self.prepared_data['num_total_langs'] = len(all_sls)
+        self.prepared_data['num_total_langs'] = len(data['total_langs'])
         self.prepared_data['num_completed_langs'] = len(completed_sls)
 
         self.prepared_data['video_completed_langs'] = \
             [sl.language for sl in completed_sls]
         self.prepared_data['video_completed_lang_urls'] = \
             [sl.get_absolute_url() for sl in completed_sls]
+        self.prepared_data['latest_submission_date'] = \
+            data['latest_submission']
 
-        self.prepared_data['task_count'] = models.Task.objects.incomplete().filter(team_video=obj).count()
+        self.prepared_data['task_count'] = data['task_count']
 
         team_video = obj.video.get_team_video()
 
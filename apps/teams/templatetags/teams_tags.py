@@ -85,6 +85,17 @@ def _get_team_video_from_search_record(search_record):
 
         return None
 
+def _allowed_action(obj, action):
+    """Return the precomputed permission for action on obj, or None.
+
+    Views that list many tasks or team videos annotate them up front with
+    PermissionContext.annotate_tasks() / annotate_team_videos().
+
+    """
+    allowed = getattr(obj, 'allowed_actions', None)
+    if allowed is not None:
+        return allowed.get(action)
+
 @register.filter
 def can_approve_application(team, user):
     return can_invite(team, user)
@@ -96,14 +107,23 @@ def can_invite_to_team(team, user):
 @register.filter
 def can_edit_video(search_record, user):
     tv = _get_team_video_from_search_record(search_record)
+    allowed = _allowed_action(tv, 'edit')
+    if allowed is not None:
+        return allowed
     return _can_edit_video(tv, user)
 
 @register.filter
 def can_remove_video(tv, user):
+    allowed = _allowed_action(tv, 'remove')
+    if allowed is not None:
+        return allowed
     return _can_remove_video(tv, user)
 
 @register.filter
 def can_delete_video(tv, user):
+    allowed = _allowed_action(tv, 'delete')
+    if allowed is not None:
+        return allowed
     return _can_delete_video(tv, user)
 
 @register.filter
@@ -456,18 +476,30 @@ def approve_enabled(team):
 
 @register.filter
 def can_perform_task(task, user):
+    allowed = _allowed_action(task, 'perform')
+    if allowed is not None:
+        return allowed
     return _can_perform_task(user, task)
 
 @register.filter
 def can_assign_task(task, user):
+    allowed = _allowed_action(task, 'assign')
+    if allowed is not None:
+        return allowed
     return _can_assign_task(task, user)
 
 @register.filter
 def can_decline_task(task, user):
+    allowed = _allowed_action(task, 'decline')
+    if allowed is not None:
+        return allowed
     return _can_decline_task(task, user)
 
 @register.filter
 def can_delete_task(task, user):
+    allowed = _allowed_action(task, 'delete')
+    if allowed is not None:
+        return allowed
     return _can_delete_task(task, user)
 
 
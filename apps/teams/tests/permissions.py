@@ -17,6 +17,7 @@
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
 import datetime
+from django.db import connection
 from django.test import TestCase
 from django.core.urlresolvers import reverse
 from apps.teams.models import Team, TeamVideo, TeamMember, Workflow, Task
@@ -35,7 +36,8 @@ from apps.teams.permissions import (
     can_create_task_translate, can_join_team, can_edit_video, can_approve,
     roles_user_can_invite, can_add_video_somewhere, can_assign_tasks,
     can_create_and_edit_translations, save_role, can_remove_video,
-    can_delete_team, can_delete_video
+    can_delete_team, can_delete_video, can_perform_task, can_assign_task,
+    can_decline_task, can_delete_task, PermissionContext
 )
 
 
@@ -927,6 +929,90 @@ class TestRules(BaseTestPermission):
         langs = can_create_task_translate(self.nonproject_video, outsider)
         self.assertEqual(langs, [])
 
+    def test_permission_context(self):
+        user, team = self.user, self.team
+        team_videos = [self.nonproject_video, self.project_video]
+
+        tasks = []
+        for tv in team_videos:
+            for type in ['Subtitle', 'Review', 'Approve']:
+                task = Task(type=Task.TYPE_IDS[type], team=team, team_video=tv,
+                            language='en')
+                task.save()
+                tasks.append(task)
+
+        for r in [ROLE_CONTRIBUTOR, ROLE_MANAGER, ROLE_ADMIN, ROLE_OWNER]:
+            for project in [None, self.test_project]:
+                with self.role(r, project):
+                    context = PermissionContext(user, team)
+                    context.annotate_tasks(tasks)
+                    context.annotate_team_videos(team_videos)
+
+                    for task in tasks:
+                        self.assertEqual(task.allowed_actions, {
+                            'perform': bool(can_perform_task(user, task)),
+                            'assign': bool(can_assign_task(task, user)),
+                            'decline': can_decline_task(task, user),
+                            'delete': bool(can_delete_task(task, user)),
+                        })
+
+                    for tv in team_videos:
+                        self.assertEqual(tv.allowed_actions['edit'],
+                                         can_edit_video(tv, user))
+                        self.assertEqual(tv.allowed_actions['remove'],
+                                         can_remove_video(tv, user))
+                        self.assertEqual(
+                            tv.allowed_actions['create_subtitles'],
+                            can_create_and_edit_subtitles(user, tv))
+
+                    self.assertEqual(context.can_add_video_somewhere(),
+                                     can_add_video_somewhere(team, user))
+
+    def test_cached_workflow_is_free(self):
+        tv = self.nonproject_video
+        context = PermissionContext(self.user, self.team)
+        workflow = context.workflow_for(tv)
+
+        # Once cached, looking the workflow up again doesn't touch the DB.
+        self.assertNumQueries(0, lambda: PermissionContext(
+            self.user, self.team).workflow_for(tv))
+        self.assertTrue(context.workflow_for(tv) is workflow)
+
+    def test_annotate_tasks_queries(self):
+        self.team.workflow_enabled = True
+        self.team.save()
+        Workflow.objects.create(
+            team=self.team,
+            review_allowed=Workflow.REVIEW_IDS["Peer must review"],
+            approve_allowed=Workflow.APPROVE_IDS["Manager must approve"])
+
+        for tv in TeamVideo.objects.filter(team=self.team):
+            for type in ['Subtitle', 'Approve']:
+                Task(type=Task.TYPE_IDS[type], team=self.team, team_video=tv,
+                     language='en').save()
+
+        def _annotate(tasks):
+            tasks = list(Task.objects.filter(pk__in=[t.pk for t in tasks])
+                                     .select_related('team_video__project'))
+            PermissionContext(self.user, self.team).annotate_tasks(tasks)
+            return tasks
+
+        tasks = Task.objects.filter(team=self.team)
+        self.assertTrue(TeamVideo.objects.filter(team=self.team).count() > 1)
+
+        with self.role(ROLE_MANAGER):
+            # Annotating every team video's tasks takes as many queries as
+            # annotating a single one's.
+            connection.use_debug_cursor = True
+            try:
+                start = len(connection.queries)
+                _annotate(tasks.filter(team_video=self.nonproject_video))
+                expected = len(connection.queries) - start
+            finally:
+                connection.use_debug_cursor = False
+
+            self.assertNumQueries(expected, _annotate, tasks)
+
     # TODO: Review/approve task tests.
 
 class TestViews(BaseTestPermission):
@@ -19,12 +19,13 @@ from apps.teams.permissions import add_role
 from apps.teams.tests.teamstestsutils import refresh_obj, reset_solr
 from apps.teams.models import (
     Team, Invite, TeamVideo, Application, TeamMember,
-    TeamLanguagePreference, Project, Partner, TeamNotificationSetting
+    TeamLanguagePreference, Project, Partner, TeamNotificationSetting, Task
 )
 from apps.teams.templatetags import teams_tags
 from apps.videos.search_indexes import VideoIndex
 from apps.videos import metadata_manager
 from apps.videos.models import Video, SubtitleLanguage
+from apps.videos.templatetags.paginator import paginate_keyset
 from messages.models import Message
 from widget.tests import create_two_sub_session, RequestMockup
 
@@ -168,6 +169,50 @@ class TestTasks(TestCase):
         tv = TeamVideo(team=self.team, video=self.sl.video, added_by=self.team.users.all()[:1].get())
         tv.save()
 
+    def test_denormalized_fields(self):
+        project = Project.objects.create(team=self.tv.team, name='Inbox')
+        task = Task(type=Task.TYPE_IDS['Subtitle'], team=self.tv.team,
+                    team_video=self.tv)
+        task.save()
+        self.assertEqual(task.project_id, self.tv.project_id)
+
+        self.tv.project = project
+        self.tv.title = u'  Some Title  '
+        self.tv.save()
+        task = refresh_obj(task)
+        self.assertEqual(task.project_id, project.pk)
+        self.assertEqual(task.video_title, u'some title')
+
+        self.tv.title = ''
+        self.tv.save()
+        video = self.tv.video
+        video.title = u'The Video Title'
+        video.save()
+        self.assertEqual(refresh_obj(task).video_title, u'the video title')
+
+    def test_keyset_pagination(self):
+        for i in range(7):
+            Task(type=Task.TYPE_IDS['Subtitle'], team=self.tv.team,
+                 team_video=self.tv, priority=i % 3).save()
+        qs = (Task.objects.filter(team=self.tv.team)
+                          .order_by('-priority', 'created', 'id'))
+        expected = [t.pk for t in qs]
+
+        seen, info = [], {'next_cursor': None}
+        while True:
+            page, info = paginate_keyset(qs, 3, after=info['next_cursor'])
+            seen.extend(t.pk for t in page)
+            if not info['has_next']:
+                break
+        self.assertEqual(seen, expected)
+
+        page, info = paginate_keyset(qs, 3, before=info['previous_cursor'])
+        self.assertEqual([t.pk for t in page], expected[-4:-1])
+        self.assertTrue(info['has_previous'])
+
+        page, info = paginate_keyset(qs, 3, after='garbage')
+        self.assertEqual([t.pk for t in page], expected[:3])
+
 
 class TeamVideoTest(TestCase):
 
@@ -464,6 +509,40 @@ class TeamsTest(TestCase):
         self.assertEqual(1, len(search_record.video_completed_langs))
         self.assertEqual('en', search_record.video_completed_langs[0])
 
+    def test_search_index_prefetch(self):
+        from haystack import site
+        index = site.get_index(TeamVideo)
+
+        request = RequestMockup(User.objects.all()[0])
+        create_two_sub_session(request, completed=True)
+        team, new_team_video = self._create_new_team_video()
+        en = new_team_video.video.subtitle_language()
+        en.is_complete = True
+        en.save()
+
+        team_videos = list(TeamVideo.objects.all())
+        index.prefetch(team_videos)
+
+        for tv in team_videos:
+            data = tv._search_index_data
+            video = Video.objects.get(pk=tv.video_id)
+
+            completed = video.completed_subtitle_languages()
+            total = [sl for sl in video.subtitlelanguage_set.all()
+                     if sl.subtitleversion_set.exists() and
+                     not sl.latest_version(public_only=False).is_all_blank()]
+            tasks = tv.task_set.incomplete().count()
+
+            self.assertEqual([sl.pk for sl in data['completed_langs']],
+                             [sl.pk for sl in completed])
+            self.assertEqual([sl.pk for sl in data['total_langs']],
+                             [sl.pk for sl in total])
+            self.assertEqual(data['task_count'], tasks)
+
+        prepared = index.prepare(refresh_obj(new_team_video))
+        self.assertEqual(prepared['video_completed_langs'], ['en'])
+        self.assertTrue(prepared['latest_submission_date'])
+
     def test_detail_contents_after_edit(self):
         # make sure edits show up in search result from solr
         self.client.login(**self.auth)
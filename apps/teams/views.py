@@ -42,7 +42,7 @@ from django.views.generic.list_detail import object_list
 import teams.moderation_const as MODERATION
 import widget
 from apps.auth.models import UserLanguage, CustomUser as User
-from apps.videos.templatetags.paginator import paginate
+from apps.videos.templatetags.paginator import paginate, paginate_keyset
 from messages import tasks as notifier
 from teams.forms import (
     CreateTeamForm, AddTeamVideoForm, EditTeamVideoForm,
@@ -54,7 +54,7 @@ from teams.forms import (
 from teams.models import (
     Team, TeamMember, Invite, Application, TeamVideo, Task, Project, Workflow,
     Setting, TeamLanguagePreference, SubtitleVersion, InviteExpiredException,
-    BillingReport, ApplicationInvalidException
+    BillingReport, ApplicationInvalidException, task_title_key
 )
 from teams.permissions import (
     can_add_video, can_assign_role, can_assign_tasks, can_create_task_subtitle,
@@ -62,7 +62,7 @@ from teams.permissions import (
     roles_user_can_assign, can_join_team, can_edit_video, can_delete_tasks,
     can_perform_task, can_rename_team, can_change_team_settings,
     can_perform_task_for, can_delete_team, can_review, can_approve,
-    can_delete_video, can_remove_video
+    can_delete_video, can_remove_video, PermissionContext
 )
 from teams.moderation_const import APPROVED
 from teams.search_indexes import TeamVideoLanguagesIndex
@@ -84,7 +84,9 @@ from videos.tasks import (
     upload_subtitles_to_original_service, delete_captions_in_original_service,
     delete_captions_in_original_service_by_code
 )
-from videos.models import Action, VideoUrl, SubtitleLanguage, Video
+from videos.models import (
+    Action, ActionFeedEntry, VideoUrl, SubtitleLanguage, Video
+)
 from widget.rpc import add_general_settings
 from widget.views import base_widget_params
 from raven.contrib.django.models import client
@@ -426,11 +428,12 @@ def detail(request, slug, project_slug=None, languages=None):
     extra_context['all_videos_count'] = team.get_videos_for_languages_haystack(
         None, user=request.user, project=None, query=None, sort=sort).count()
 
+    permissions = PermissionContext.for_request(request, team)
     extra_context.update({
         'team': team,
         'project':project,
-        'can_add_video': can_add_video(team, request.user, project),
-        'can_edit_videos': can_add_video(team, request.user, project),
+        'can_add_video': permissions.can_add_video(project),
+        'can_edit_videos': permissions.can_add_video(project),
         'filtered': filtered
     })
 
@@ -493,6 +496,7 @@ def detail(request, slug, project_slug=None, languages=None):
     if is_editor:
         team_video_ids = [record.team_video_pk for record in team_video_md_list]
         team_videos = list(TeamVideo.objects.filter(id__in=team_video_ids).select_related('video', 'team', 'project'))
+        permissions.annotate_team_videos(team_videos)
         team_videos = dict((tv.pk, tv) for tv in team_videos)
         for record in team_video_md_list:
             if record:
@@ -666,19 +670,13 @@ def activity(request, slug):
 
     public_only = False if member else True
 
-    # This section is here to work around MySQL's poor decisions.
-    #
-    # Much like the Tasks page, this query performs extremely poorly when run
-    # normally.  So we split it into two parts here so that each will run fast.
-    action_ids = Action.objects.for_team(team, public_only=public_only, ids=True)
-    action_ids, pagination_info = paginate(action_ids, ACTIONS_ON_PAGE,
-                                           request.GET.get('page'))
-    action_ids = list(action_ids)
-
-    activity_list = list(Action.objects.filter(id__in=action_ids).select_related(
-            'video', 'user', 'language', 'language__video'
-    ).order_by())
-    activity_list.sort(key=lambda a: action_ids.index(a.pk))
+    # Page through the materialized team feed, then load just the Actions on
+    # the page.
+    entries, pagination_info = paginate_keyset(
+        ActionFeedEntry.objects.for_team(team, public_only=public_only),
+        ACTIONS_ON_PAGE, request.GET.get('after'), request.GET.get('before'))
+    activity_list = ActionFeedEntry.objects.actions(entries)
+    Action.renderer.render_many(activity_list)
 
     context = { 'activity_list': activity_list, 'team': team }
     context.update(pagination_info)
@@ -1050,12 +1048,16 @@ def _tasks_list(request, team, project, filters, user):
     * completed: true or false
     * assignee: user ID as an integer
     * team_video: team video ID as an integer
+    * q: the start of the video title
+
+    Everything is filtered on Task's own (partly denormalized) columns, so
+    there are no joins.
 
     '''
     tasks = Task.objects.filter(team=team.id, deleted=False)
 
     if project:
-        tasks = tasks.filter(team_video__project = project)
+        tasks = tasks.filter(project=project)
 
     if filters.get('team_video'):
         tasks = tasks.filter(team_video=filters['team_video'])
@@ -1073,12 +1075,8 @@ def _tasks_list(request, team, project, filters, user):
         tasks = tasks.filter(language__in=languages)
 
     if filters.get('q'):
-        terms = get_terms(filters['q'])
-        for term in terms:
-            tasks = tasks.filter(
-                Q(team_video__video__title__icontains=term)
-              | Q(team_video__title__icontains=term)
-            )
+        tasks = tasks.filter(
+            video_title__startswith=task_title_key(filters['q']))
 
     if filters.get('type'):
         tasks = tasks.filter(type=Task.TYPE_IDS[filters['type']])
@@ -1105,15 +1103,17 @@ def _order_tasks(request, tasks):
     # the default sorting.
     order_clause = ["-priority"]
     if sort == 'created':
-        order_clause.append('created')
+        order_clause += ['created', 'id']
     elif sort == '-created':
-        order_clause.append('-created')
+        order_clause += ['-created', '-id']
     elif sort == 'expires':
         tasks = tasks.exclude(expiration_date=None)
-        order_clause.append('expiration_date')
+        order_clause += ['expiration_date', 'id']
     elif sort == '-expires':
         tasks = tasks.exclude(expiration_date=None)
-        order_clause.append('-expiration_date')
+        order_clause += ['-expiration_date', '-id']
+    else:
+        order_clause += ['-id']
     tasks = tasks.order_by(*order_clause)
     return tasks
 
@@ -1148,7 +1148,9 @@ def team_tasks(request, slug, project_slug=None):
 
     tasks = _order_tasks(request,
                          _tasks_list(request, team, project, filters, user))
-    tasks, pagination_info = paginate(tasks, TASKS_ON_PAGE, request.GET.get('page'))
+    tasks, pagination_info = paginate_keyset(
+        tasks.only('id', 'priority', 'created', 'expiration_date'),
+        TASKS_ON_PAGE, request.GET.get('after'), request.GET.get('before'))
 
     # We pull out the task IDs here for performance.  It's ugly, I know.
     #
@@ -1157,7 +1159,7 @@ def team_tasks(request, slug, project_slug=None):
     # two queries they'll both be fast.
     #
     # Thanks, MySQL.
-    task_ids = list(tasks.values_list('id', flat=True))
+    task_ids = [t.id for t in tasks]
     tasks = list(Task.objects.filter(id__in=task_ids).select_related(
             'team_video__video',
             'team_video__team',
@@ -1202,11 +1204,14 @@ def team_tasks(request, slug, project_slug=None):
     for t in tasks:
         t.cached_video_url = video_urls.get(t.team_video.video_id)
 
+    permissions = PermissionContext.for_request(request, team)
+    permissions.annotate_tasks(tasks)
+
     context = {
         'team': team,
         'project': project, # TODO: Review
-        'user_can_delete_tasks': can_delete_tasks(team, request.user),
-        'user_can_assign_tasks': can_assign_tasks(team, request.user),
+        'user_can_delete_tasks': permissions.can_delete_tasks(),
+        'user_can_assign_tasks': permissions.can_assign_tasks(),
         'assign_form': TaskAssignForm(team, member),
         'languages': languages,
         'tasks': tasks,
@@ -1,3 +1,9 @@
+import json
+
+from django.http import HttpResponse
+
+from utils import metrics as _metrics
+from utils import profiling as _profiling
 from utils import render_to
 from django.views.generic.list_detail import object_list
 from uslogging.models import WidgetDialogLog
@@ -15,3 +21,40 @@ def widget_logs(request):
 @render_to('uslogging/widget_log.html')
 def widget_log(request, log_pk):
     return { 'log': WidgetDialogLog.objects.get(id=log_pk) }
+
+@staff_member_required
+def metrics(request):
+    """Dump this process's aggregated metrics, as JSON or (?format=text) text.
+
+    This works without Riemann.  Each web process has its own aggregates, so
+    this only shows the one that served the request.
+
+    """
+    snapshot = _metrics.aggregator.snapshot()
+
+    if request.GET.get('format') != 'text':
+        return HttpResponse(json.dumps(snapshot, indent=2, sort_keys=True),
+                            mimetype='application/json')
+
+    lines = []
+    for section in ('current', 'last'):
+        lines.append('[%s]' % section)
+        for name, data in sorted(snapshot[section]['metrics'].items()):
+            values = ' '.join('%s=%s' % item for item in sorted(data.items())
+                              if item[0] != 'type')
+            lines.append('%-60s %-10s %s' % (name, data['type'], values))
+        lines.append('')
+    return HttpResponse('\n'.join(lines), mimetype='text/plain')
+
+@staff_member_required
+@render_to('uslogging/profiling.html')
+def profiling(request):
+    """Show the per-view and per-RPC profiles of this process."""
+    if request.method == 'POST':
+        _profiling.store.clear()
+
+    return {
+        'endpoints': _profiling.store.summary(),
+        'sample_rate': _profiling.SAMPLE_RATE,
+        'threshold': _profiling.N_PLUS_ONE_THRESHOLD,
+    }
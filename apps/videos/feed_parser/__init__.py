@@ -40,9 +40,9 @@ class FeedParser(object):
     See videos.tests.TestFeedParser for details.
     """
     
-    def __init__(self, feed_url):
+    def __init__(self, feed_url, feed=None):
         self.feed_url = feed_url
-        self.feed = feedparser.parse(feed_url)
+        self.feed = feed if feed is not None else feedparser.parse(feed_url)
         self.parser = None
         
     def items(self, reverse=False, until=False, since=False, ignore_error=False):
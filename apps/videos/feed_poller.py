@@ -0,0 +1,168 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2012 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+"""
+Fetches many video feeds at once.
+
+Every feed is requested with the ETag and Last-Modified validators saved from
+its previous fetch, so a feed that hasn't changed costs one 304 response and
+no parsing or database work.
+
+Downloads run in a pool of FEED_POLL_WORKERS threads.  At most
+FEED_POLL_PER_HOST of them talk to the same host at once, and requests to one
+host start at least FEED_POLL_HOST_DELAY seconds apart.  The threads only do
+HTTP; the fetched feeds are saved from the calling thread, one at a time.
+"""
+import logging
+import threading
+import time
+import urlparse
+from Queue import Queue, Empty
+from contextlib import contextmanager
+
+import feedparser
+from django.conf import settings
+
+from utils.metrics import Meter
+
+
+logger = logging.getLogger('videos.feed_poller')
+
+WORKERS = getattr(settings, 'FEED_POLL_WORKERS', 8)
+PER_HOST = getattr(settings, 'FEED_POLL_PER_HOST', 2)
+HOST_DELAY = getattr(settings, 'FEED_POLL_HOST_DELAY', 1.0)
+
+
+def fetch(url, etag=None, modified=None):
+    """Fetch and parse a feed, conditionally if validators are given.
+
+    Returns the feedparser result.  If the feed hasn't changed its status is
+    304 and it has no entries.
+
+    """
+    return feedparser.parse(url, etag=etag or None, modified=modified or None)
+
+def not_modified(parsed):
+    return parsed.get('status') == 304
+
+def fetch_failed(parsed):
+    """Return True if the feed couldn't be downloaded at all."""
+    # feedparser doesn't raise, it sets bozo.  A response without a status
+    # means the request itself failed.
+    return parsed.get('bozo') and 'status' not in parsed and \
+           not parsed.get('entries')
+
+
+class HostLimiter(object):
+    """Limits how hard the poller hits any single host."""
+    def __init__(self, per_host=PER_HOST, delay=HOST_DELAY):
+        self.per_host = per_host
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.semaphores = {}
+        self.next_start = {}
+
+    @contextmanager
+    def limit(self, url):
+        host = urlparse.urlsplit(url).netloc.lower()
+
+        with self.lock:
+            semaphore = self.semaphores.get(host)
+            if semaphore is None:
+                semaphore = threading.Semaphore(self.per_host)
+                self.semaphores[host] = semaphore
+
+        semaphore.acquire()
+        try:
+            with self.lock:
+                now = time.time()
+                start = max(now, self.next_start.get(host, 0))
+                self.next_start[host] = start + self.delay
+
+            if start > now:
+                time.sleep(start - now)
+
+            yield
+        finally:
+            semaphore.release()
+
+
+def poll(feeds, workers=WORKERS, limiter=None):
+    """Fetch the given VideoFeeds concurrently.
+
+    Returns a list of (feed, parsed feed) in the order of feeds.  The parsed
+    feed is None if fetching it raised an exception.
+
+    """
+    feeds = list(feeds)
+    limiter = limiter or HostLimiter()
+    results = [None] * len(feeds)
+
+    queue = Queue()
+    for i, feed in enumerate(feeds):
+        # Hand the threads plain values, they must not touch the database.
+        queue.put((i, feed.url, feed.etag, feed.last_modified))
+
+    def work():
+        while True:
+            try:
+                i, url, etag, modified = queue.get_nowait()
+            except Empty:
+                return
+
+            try:
+                with limiter.limit(url):
+                    results[i] = fetch(url, etag, modified)
+            except Exception:
+                logger.exception('Error fetching feed %s' % url)
+
+    threads = [threading.Thread(target=work)
+               for i in xrange(min(workers, len(feeds)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return zip(feeds, results)
+
+def update_feeds(feeds, workers=WORKERS, limiter=None):
+    """Poll the given VideoFeeds and import new entries from the changed ones.
+
+    Returns the number of feeds that had changed.
+
+    """
+    changed = 0
+
+    for feed, parsed in poll(feeds, workers, limiter):
+        if parsed is None or fetch_failed(parsed):
+            Meter('feeds.errors').inc()
+            continue
+
+        if not_modified(parsed):
+            Meter('feeds.not-modified').inc()
+            continue
+
+        Meter('feeds.changed').inc()
+        changed += 1
+
+        try:
+            feed.update(parsed)
+        except Exception:
+            logger.exception('Error updating feed %s' % feed.url)
+
+    return changed
@@ -0,0 +1,59 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2012 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from videos.models import Action, ActionFeedEntry
+
+
+class Command(BaseCommand):
+    help = ('Builds the team and user activity feeds from the existing '
+            'actions.  Safe to run again: the feed entries of each batch of '
+            'actions are rebuilt from scratch.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('-b', '--batch-size', action='store', dest='batch_size',
+                    type='int', default=1000,
+                    help='Number of actions to handle at once.'),
+        make_option('--start', action='store', dest='start',
+                    type='int', default=0,
+                    help='Only handle actions with an id above this one.'),
+    )
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity', 1))
+        batch_size = options['batch_size']
+
+        last_pk, created = options['start'], 0
+        while True:
+            actions = list(Action.objects.filter(pk__gt=last_pk)
+                                         .order_by('pk')[:batch_size])
+            if not actions:
+                break
+
+            ActionFeedEntry.objects.filter(action__in=actions).delete()
+            created += ActionFeedEntry.objects.add_actions(
+                actions, members_async=False)
+
+            last_pk = actions[-1].pk
+            if verbosity >= 2:
+                print 'Up to action %d, %d feed entries.' % (last_pk, created)
+
+        if verbosity >= 1:
+            print 'Created %d feed entries.' % created
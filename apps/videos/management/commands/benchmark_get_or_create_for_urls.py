@@ -0,0 +1,77 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2012 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+import time
+import uuid
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from apps.videos.models import Video
+
+
+class Command(BaseCommand):
+    help = ('Compares importing N video URLs with get_or_create_for_url '
+            'against one get_or_create_for_urls call.  Everything is rolled '
+            'back afterwards.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--count', action='store', dest='count',
+                    type='int', default=5000,
+                    help='Number of URLs to import.'),
+        make_option('--existing', action='store', dest='existing',
+                    type='int', default=10,
+                    help='Percentage of the URLs that already exist.'),
+    )
+
+    def run(self, label, urls, fn):
+        with transaction.commit_manually():
+            try:
+                # Create the "existing" part up front, outside the timing.
+                Video.get_or_create_for_urls(urls[:self.existing])
+
+                queries_before = len(connection.queries)
+                start = time.time()
+                fn(urls)
+                elapsed = time.time() - start
+                queries = len(connection.queries) - queries_before
+            finally:
+                transaction.rollback()
+
+        print '%-8s %8.2fs %10s' % (label, elapsed,
+                                    queries if connection.queries else 'n/a')
+
+    def handle(self, *args, **options):
+        prefix = uuid.uuid4().hex
+        urls = ['http://example.com/%s/%d.mp4' % (prefix, i)
+                for i in xrange(options['count'])]
+        self.existing = len(urls) * options['existing'] / 100
+
+        def _single(urls):
+            for url in urls:
+                Video.get_or_create_for_url(url)
+
+        def _bulk(urls):
+            Video.get_or_create_for_urls(urls)
+
+        print '%d URLs, %d of them existing' % (len(urls), self.existing)
+        print '(query counts are only available with DEBUG on)'
+        print ''
+        print '%-8s %9s %10s' % ('mode', 'time', 'queries')
+        self.run('single', urls, _single)
+        self.run('bulk', urls, _bulk)
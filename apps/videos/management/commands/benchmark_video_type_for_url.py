@@ -0,0 +1,111 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2012 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+import time
+from optparse import make_option
+from urlparse import urlparse
+
+from django.core.management.base import BaseCommand
+
+from apps.videos.models import VideoUrl, VIDEO_TYPE_DAILYMOTION
+from apps.videos.types import video_type_registrar
+
+
+# Used when the database has no URLs.  No Dailymotion URLs, since matching
+# those makes an HTTP request.
+CORPUS = [
+    'http://www.youtube.com/watch?v=UOtJUmiUZ08',
+    'http://www.youtube.com/watch?v=iizcw0Sgces&feature=related',
+    'http://youtube.com/watch?v=HeHC2OBrIKc',
+    'http://youtu.be/J_DV9b0x7v4',
+    'http://www.youtube.com/v/Fc-gB5z2UHo?version=3',
+    'http://vimeo.com/15786066',
+    'http://player.vimeo.com/video/22070806',
+    'http://vimeo.com/channels/staffpicks/41862263',
+    'http://blip.tv/day9tv/day-9-daily-101-kawaii-rice-tvp-macro-1531',
+    'http://blip.tv/file/get/Coldguy-SpineBreakersLiveAWizardOfEarthsea210.FLV',
+    'http://bcove.me/7q6lqdhw',
+    'http://link.brightcove.com/services/player/bcpid955357260001',
+    'http://videos.mozilla.org/firefox/3.5/switch/switch.ogv',
+    'http://qa.pculture.org/amara_tests/Birds_short.webmsd.webm',
+    'http://ocw.mit.edu/ans7870/18/18.01/f07/lecture01.mp4',
+    'http://upload.wikimedia.org/wikipedia/commons/7/75/Big_Buck_Bunny.ogg',
+    'http://example.com/media/interview.m4v',
+    'http://example.com/media/talk.flv',
+    'http://example.com/podcasts/episode-12.mp3',
+    'http://www.ted.com/talks/ken_robinson_says_schools_kill_creativity.html',
+    'http://www.example.com/not-a-video',
+    'http://www.youtube.com/user/universalsubtitles',
+]
+
+
+class Command(BaseCommand):
+    help = ('Times VideoTypeRegistrar URL matching: a scan of every type, '
+            'the host index, and the host index behind the URL cache.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--count', action='store', dest='count',
+                    type='int', default=1000,
+                    help='Number of URLs to take from the database.'),
+        make_option('--rounds', action='store', dest='rounds',
+                    type='int', default=20,
+                    help='Number of times to match every URL.'),
+    )
+
+    def run(self, label, urls, rounds, fn):
+        start = time.time()
+        for i in xrange(rounds):
+            for url in urls:
+                fn(url)
+        elapsed = time.time() - start
+
+        lookups = len(urls) * rounds
+        print '%-8s %8.3fs %10.1fus' % (label, elapsed,
+                                        elapsed / lookups * 1000000)
+
+    def handle(self, *args, **options):
+        urls = list(VideoUrl.objects.exclude(type=VIDEO_TYPE_DAILYMOTION)
+                                    .values_list('url', flat=True)
+                                    .order_by('-id')[:options['count']])
+        if not urls:
+            urls = CORPUS
+
+        registrar = video_type_registrar
+
+        def _scan(url):
+            return registrar._scan(url, registrar.itervalues())
+
+        def _indexed(url):
+            host = urlparse(url).hostname
+            if not host:
+                return _scan(url)
+            return registrar._scan(url, registrar._candidates_for_host(host))
+
+        def _cached(url):
+            return registrar.video_type_class_for_url(url)
+
+        mismatches = [url for url in urls if _scan(url) != _cached(url)]
+        if mismatches:
+            print '%d URLs matched differently, e.g. %s' % (len(mismatches),
+                                                            mismatches[0])
+
+        print '%d URLs, %d rounds' % (len(urls), options['rounds'])
+        print ''
+        print '%-8s %9s %12s' % ('mode', 'time', 'per lookup')
+        self.run('scan', urls, options['rounds'], _scan)
+        self.run('indexed', urls, options['rounds'], _indexed)
+        self.run('cached', urls, options['rounds'], _cached)
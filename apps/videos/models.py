@@ -41,7 +41,8 @@ from django.core.urlresolvers import reverse
 
 from auth.models import CustomUser as User, Awards
 from videos import EffectiveSubtitle, is_synced, is_synced_value
-from videos.types import video_type_registrar
+from videos.types import video_type_registrar, VideoTypeError
+from videos import feed_poller
 from videos.feed_parser import FeedParser
 from comments.models import Comment
 from statistic import st_widget_view_statistic
@@ -111,6 +112,9 @@ update_metadata_choices()
 
 WRITELOCK_EXPIRATION = 30 # 30 seconds
 
+# The most URLs get_or_create_for_urls() puts in one query.
+URL_BATCH_SIZE = 500
+
 ALL_LANGUAGES = [(val, _(name))for val, name in settings.ALL_LANGUAGES]
 
 
@@ -186,9 +190,9 @@ class Video(models.Model):
         return title
 
     def update_search_index(self):
-        """Queue a Celery task that will update this video's Solr entry."""
-        from utils.celery_search_index import update_search_index
-        update_search_index.delay(self.__class__, self.pk)
+        """Queue this video for having its Solr entry updated."""
+        from utils.celery_search_index import schedule_update
+        schedule_update(self.__class__, self.pk)
 
     @property
     def views(self):
@@ -202,7 +206,7 @@ class Video(models.Model):
 
         """
         if not hasattr(self, '_video_views_statistic'):
-            cache_key = 'video_views_statistic_%s' % self.pk
+            cache_key = self._views_cache_key(self.pk)
             views_st = cache.get(cache_key)
 
             if not views_st:
@@ -214,6 +218,42 @@ class Video(models.Model):
 
         return self._video_views_statistic
 
+    @staticmethod
+    def _views_cache_key(pk):
+        return 'video_views_statistic_%s' % pk
+
+    @classmethod
+    def prefetch_views(cls, videos):
+        """Fill in the views property for many videos at once.
+
+        Uses one cache get_many, and a single query for all of the videos that
+        weren't cached.
+
+        """
+        videos = [v for v in videos
+                  if not hasattr(v, '_video_views_statistic')]
+        if not videos:
+            return
+
+        keys = dict((v.pk, cls._views_cache_key(v.pk)) for v in videos)
+        cached = cache.get_many(keys.values())
+
+        missing = [v for v in videos if not cached.get(keys[v.pk])]
+        if missing:
+            views = st_widget_view_statistic.get_views_bulk(
+                'video', [v.pk for v in missing])
+
+            for video in missing:
+                views_st = views[video.pk]
+                views_st['total'] = video.widget_views_count
+                cached[keys[video.pk]] = views_st
+
+            cache.set_many(dict((keys[v.pk], cached[keys[v.pk]])
+                                for v in missing), 60*60*2)
+
+        for video in videos:
+            video._video_views_statistic = cached[keys[video.pk]]
+
     def title_display(self, truncate=True):
         v = self.latest_version()
 
@@ -463,6 +503,162 @@ class Video(models.Model):
                 video_url_obj.save()
         return video, created
 
+    @classmethod
+    def get_or_create_for_urls(cls, video_urls, user=None):
+        """Like get_or_create_for_url(), for many URLs at once.
+
+        video_urls can contain URLs and VideoType instances.  Returns a list of
+        (video, created) tuples in the same order, with (None, False) for URLs
+        that aren't videos we support.
+
+        Existing URLs are looked up with a few url__in queries.  The videos,
+        URLs and actions for the rest are inserted with bulk_create(), and
+        their thumbnails and search index entries are updated in one batch.
+
+        """
+        vts = []
+        for item in video_urls:
+            if isinstance(item, basestring):
+                try:
+                    item = video_type_registrar.video_type_for_url(item)
+                except VideoTypeError:
+                    item = None
+            vts.append(item)
+
+        urls, by_url = [], {}
+        for vt in vts:
+            if vt is None:
+                continue
+            url = vt.convert_to_video_url()
+            if url not in by_url:
+                urls.append(url)
+                by_url[url] = vt
+
+        found = {}
+        for i in xrange(0, len(urls), URL_BATCH_SIZE):
+            qs = VideoUrl.objects.filter(url__in=urls[i:i + URL_BATCH_SIZE])
+            for video_url in qs.select_related('video'):
+                found[video_url.url] = (video_url.video, False)
+
+                username = getattr(by_url[video_url.url], 'username', None)
+                if username and not video_url.owner_username:
+                    video_url.owner_username = username
+                    video_url.save(updates_timestamp=False)
+
+        missing = [url for url in urls if url not in found]
+        matched = cls._match_video_urls([by_url[url] for url in missing])
+        for url, video in matched.items():
+            if user:
+                Action.create_video_handler(video, user)
+            found[url] = (video, False)
+        missing = [url for url in missing if url not in matched]
+
+        videos = cls._create_for_video_types([by_url[url] for url in missing],
+                                             user)
+        found.update((url, (video, True)) for url, video in zip(missing, videos))
+
+        if user and user.notify_by_message:
+            followed = set(video for url, (video, created) in found.items()
+                           if url not in matched)
+            if followed:
+                user.followed_videos.add(*followed)
+
+        return [found[vt.convert_to_video_url()] if vt else (None, False)
+                for vt in vts]
+
+    @classmethod
+    def _match_video_urls(cls, vts):
+        """Find the videos for the given VideoTypes by type-specific fields.
+
+        This is the fallback get_or_create_for_url() does with create_kwars()
+        for URLs it doesn't know.  Returns a {url: video} dict.
+
+        """
+        groups = {}
+        for vt in vts:
+            kwargs = vt.create_kwars()
+            if len(kwargs) != 1:
+                continue
+            field, value = kwargs.items()[0]
+            groups.setdefault((vt.abbreviation, field), {})[value] = vt
+
+        matched = {}
+        for (abbreviation, field), values in groups.items():
+            keys = values.keys()
+            for i in xrange(0, len(keys), URL_BATCH_SIZE):
+                lookup = {'type': abbreviation,
+                          '%s__in' % field: keys[i:i + URL_BATCH_SIZE]}
+                for video_url in (VideoUrl.objects.filter(**lookup)
+                                                  .select_related('video')):
+                    vt = values.get(getattr(video_url, field))
+                    if vt is not None:
+                        matched[vt.convert_to_video_url()] = video_url.video
+        return matched
+
+    @classmethod
+    def _create_for_video_types(cls, vts, user=None):
+        """Create a video, its URL and its action for each VideoType."""
+        from videos.tasks import save_thumbnails_in_s3
+        from utils.celery_search_index import schedule_updates
+
+        if not vts:
+            return []
+
+        videos, unsaved = [], []
+        for vt in vts:
+            video = vt.set_values(Video())
+            video.user = user
+            if video.pk is None:
+                # Some types save the video themselves while filling it in.
+                create_video_id(Video, video)
+                unsaved.append(video)
+            videos.append(video)
+
+        for i in xrange(0, len(unsaved), URL_BATCH_SIZE):
+            Video.objects.bulk_create(unsaved[i:i + URL_BATCH_SIZE])
+
+        # bulk_create() doesn't set primary keys, so fetch them back.
+        saved = {}
+        video_ids = [video.video_id for video in unsaved]
+        for i in xrange(0, len(video_ids), URL_BATCH_SIZE):
+            saved.update((v.video_id, v) for v in Video.objects.filter(
+                video_id__in=video_ids[i:i + URL_BATCH_SIZE]))
+        videos = [saved.get(video.video_id, video) for video in videos]
+
+        now = datetime.now()
+        video_urls = []
+        for vt, video in zip(vts, videos):
+            video_urls.append(VideoUrl(
+                video=video, url=vt.convert_to_video_url(),
+                type=vt.abbreviation, videoid=vt.video_id or '',
+                original=True, primary=True, added_by=user, created=now,
+                owner_username=getattr(vt, 'username', None)))
+
+        try:
+            for i in xrange(0, len(video_urls), URL_BATCH_SIZE):
+                VideoUrl.objects.bulk_create(video_urls[i:i + URL_BATCH_SIZE])
+        except IntegrityError:
+            # Someone else added some of these URLs in the meantime.  Throw
+            # our copies away and go through them one at a time instead.
+            VideoUrl.objects.filter(video__in=videos).delete()
+            Video.objects.filter(pk__in=[v.pk for v in videos]).delete()
+            return [Video.get_or_create_for_url(vt=vt, user=user)[0]
+                    for vt in vts]
+
+        actions = [Action(video=video, action_type=Action.ADD_VIDEO, user=user,
+                          created=video.created or now)
+                   for video in videos]
+        Action.objects.bulk_create(actions)
+        ActionFeedEntry.objects.add_actions(list(
+            Action.objects.filter(video__in=videos,
+                                  action_type=Action.ADD_VIDEO)))
+
+        video_pks = [video.pk for video in videos]
+        save_thumbnails_in_s3.delay(video_pks)
+        schedule_updates(Video, video_pks)
+
+        return videos
+
     @property
     def language(self):
         """Return the language code of this video's original language as a string.
@@ -969,23 +1165,28 @@ class SubtitleLanguage(models.Model):
         """
         return not self.is_original and not self.is_forked
 
-    def is_complete_and_synced(self, public_only=True):
+    def is_complete_and_synced(self, public_only=True, standard_language=None,
+                               subtitles=None):
         """
         For transcripts, this means the user marked it as completed.
         For translations, the original language must be marked as completed.
 
         We consider a set of subs where the very last has no end time
         to be synced, as that is a convention for 'until end of time'.
+
+        If the standard language or the (effective) latest subtitles have
+        already been loaded they can be passed in to save the queries.
         """
         if not self.is_dependent() and not self.is_complete:
             return False
         if self.is_dependent():
             if self.percent_done != 100:
                 return False
-            standard_lang = self.standard_language
+            standard_lang = standard_language or self.standard_language
             if not standard_lang or not standard_lang.is_complete:
                 return False
-        subtitles = self.latest_subtitles(public_only=public_only)
+        if subtitles is None:
+            subtitles = self.latest_subtitles(public_only=public_only)
         if len(subtitles) == 0:
 
             return False
@@ -1210,39 +1411,47 @@ class SubtitleCollection(models.Model):
         abstract = True
 
 
-    def subtitles(self, subtitles_to_use=None, public_only=True):
+    def subtitles(self, subtitles_to_use=None, public_only=True,
+                  standard_subtitles=None):
         """
         Returns EffectiveSubtitle instances but also fetches timing data
         from the original sub if this is a translation.
         It will only match if the subtitile_id matches, else those subs
         not returned.
+
+        If the subtitles of this collection or of the standard collection
+        (empty if there is none) have already been loaded they can be passed in
+        as subtitles_to_use and standard_subtitles to save the queries.
         """
         ATTR = 'computed_effective_subtitles'
         if hasattr(self, ATTR):
             return getattr(self, ATTR)
-        if  self.pk:
+        if subtitles_to_use is not None:
+            subtitles = subtitles_to_use
+        elif  self.pk:
             # if this collection hasn't been saved, then subtitle_set.all will return all subtitles
             # which will take too long / never return
-            subtitles = subtitles_to_use or self.subtitle_set.all()
+            subtitles = self.subtitle_set.all()
         else:
-            subtitles = subtitles_to_use or []
+            subtitles = []
         if not self.is_dependent():
             effective_subtitles = [EffectiveSubtitle.for_subtitle(s)
                                    for s in subtitles]
         else:
-            standard_collection = self._get_standard_collection(public_only=public_only)
-            if not standard_collection:
-                effective_subtitles = []
-            else:
-                t_dict = \
-                    dict([(s.subtitle_id, s) for s
-                          in subtitles])
-                filtered_subs = standard_collection.subtitle_set.all()
-                subs = [s for s in filtered_subs
-                        if s.subtitle_id in t_dict]
-                effective_subtitles = \
-                    [EffectiveSubtitle.for_dependent_translation(
-                        s, t_dict[s.subtitle_id]) for s in subs]
+            if standard_subtitles is None:
+                standard_collection = self._get_standard_collection(public_only=public_only)
+                if standard_collection:
+                    standard_subtitles = standard_collection.subtitle_set.all()
+                else:
+                    standard_subtitles = []
+            t_dict = \
+                dict([(s.subtitle_id, s) for s
+                      in subtitles])
+            subs = [s for s in standard_subtitles
+                    if s.subtitle_id in t_dict]
+            effective_subtitles = \
+                [EffectiveSubtitle.for_dependent_translation(
+                    s, t_dict[s.subtitle_id]) for s in subs]
         setattr(self, ATTR, effective_subtitles)
         return effective_subtitles
 
@@ -1503,8 +1712,13 @@ class SubtitleVersion(SubtitleCollection):
                 self.language.save()
         return new_version
 
-    def is_all_blank(self):
-        for s in self.subtitles():
+    def is_all_blank(self, subtitles=None, standard_subtitles=None):
+        """
+        Are all of the (effective) subtitles blank?  The arguments are passed
+        on to subtitles(), to use subtitles that have already been loaded.
+        """
+        for s in self.subtitles(subtitles_to_use=subtitles,
+                                standard_subtitles=standard_subtitles):
             if s.text.strip() != '':
                 return False
         return True
@@ -1845,15 +2059,21 @@ class Subtitle(models.Model):
             if 'end_time' in caption_dict:
                 self.end_time = caption_dict['end_time']
 
-    def save(self, *args, **kwargs):
-        # Normalize start_time and end_time to None (separately) if either is
-        # not a valid time.
+    def normalize_times(self):
+        """Set start_time and end_time to None (separately) if either is not
+        a valid time.
+
+        save() does this, so it's only needed before bulk_create().
+
+        """
         if not is_synced_value(self.start_time):
             self.start_time = None
 
         if not is_synced_value(self.end_time):
             self.end_time = None
 
+    def save(self, *args, **kwargs):
+        self.normalize_times()
         return super(Subtitle, self).save(*args, **kwargs)
 
     def __unicode__(self):
@@ -1884,54 +2104,117 @@ class SubtitleMetadata(models.Model):
 
 
 # Action
-from django.template.loader import render_to_string
+from django.template import Context
+from django.template.loader import get_template
+from django.utils.html import escape
+from django.utils.timesince import timesince
+from django.utils.translation import get_language, ugettext
+
+# How long rendered actions are cached for.  Actions never change once they're
+# written, so this only bounds how stale renamed videos, users and so on get.
+ACTION_CACHE_TIMEOUT = getattr(settings, 'ACTION_CACHE_TIMEOUT', 60 * 60 * 6)
 
 class ActionRenderer(object):
+    # Rendered actions are cached without their timestamp, which is relative
+    # to now; the templates output this marker in its place.
+    TIMESTAMP = u'<!-- action timestamp -->'
+
+    # Related objects the render_* methods use, loaded in bulk by _prefetch().
+    PREFETCH_FIELDS = ('video', 'language', 'user', 'team', 'member')
 
     def __init__(self, template_name):
         self.template_name = template_name
+        self._template = None
 
     def render(self, item):
+        rendered = getattr(item, '_rendered', {})
+        if self.template_name in rendered:
+            return rendered[self.template_name]
 
-        if item.action_type == Action.ADD_VIDEO:
-            info = self.render_ADD_VIDEO(item)
-        elif item.action_type == Action.CHANGE_TITLE:
-            info = self.render_CHANGE_TITLE(item)
-        elif item.action_type == Action.COMMENT:
-            info = self.render_COMMENT(item)
-        elif item.action_type == Action.ADD_VERSION and item.language:
-            info = self.render_ADD_VERSION(item)
-        elif item.action_type == Action.ADD_VIDEO_URL:
-            info = self.render_ADD_VIDEO_URL(item)
-        elif item.action_type == Action.ADD_TRANSLATION:
-            info = self.render_ADD_TRANSLATION(item)
-        elif item.action_type == Action.SUBTITLE_REQUEST:
-            info = self.render_SUBTITLE_REQUEST(item)
-        elif item.action_type == Action.APPROVE_VERSION:
-            info = self.render_APPROVE_VERSION(item)
-        elif item.action_type == Action.REJECT_VERSION:
-            info = self.render_REJECT_VERSION(item)
-        elif item.action_type == Action.MEMBER_JOINED:
-            info = self.render_MEMBER_JOINED(item)
-        elif item.action_type == Action.MEMBER_LEFT:
-            info = self.render_MEMBER_LEFT(item)
-        elif item.action_type == Action.REVIEW_VERSION:
-            info = self.render_REVIEW_VERSION(item)
-        elif item.action_type == Action.ACCEPT_VERSION:
-            info = self.render_ACCEPT_VERSION(item)
-        elif item.action_type == Action.DECLINE_VERSION:
-            info = self.render_DECLINE_VERSION(item)
-        elif item.action_type == Action.DELETE_VIDEO:
-            info = self.render_DELETE_VIDEO(item)
-        else:
-            info = ''
+        return self.render_many([item])[0]
 
-        context = {
-            'info': info,
-            'item': item
-        }
+    def render_many(self, items):
+        """Render a list of Actions, returning a list of HTML strings.
 
-        return render_to_string(self.template_name, context)
+        Cached renderings are used where possible.  The related objects of the
+        rest are loaded with a handful of queries for the whole list, rather
+        than lazily per action.  The results are also kept on the items, so
+        calling this on a page of actions before the template does
+        {{ item.render }} renders the whole page in one go.
+
+        """
+        keys = dict((item.pk, self._cache_key(item)) for item in items)
+        cached = cache.get_many(keys.values()) if keys else {}
+
+        missing = [item for item in items if keys[item.pk] not in cached]
+        if missing:
+            self._prefetch(missing)
+
+            rendered = dict((keys[item.pk], self._render(item))
+                            for item in missing)
+            cache.set_many(rendered, ACTION_CACHE_TIMEOUT)
+            cached.update(rendered)
+
+        results = []
+        for item in items:
+            html = mark_safe(cached[keys[item.pk]].replace(
+                self.TIMESTAMP, self._timestamp(item)))
+            item.__dict__.setdefault('_rendered', {})[self.template_name] = html
+            results.append(html)
+
+        return results
+
+    def _cache_key(self, item):
+        return 'action-html:%s:%s:%s' % (self.template_name, item.pk,
+                                         get_language())
+
+    def _timestamp(self, item):
+        return escape(u'%s %s' % (timesince(item.created), ugettext('ago')))
+
+    def _prefetch(self, items):
+        for name in self.PREFETCH_FIELDS:
+            field = Action._meta.get_field(name)
+            cache_name = field.get_cache_name()
+
+            ids = set(getattr(item, field.attname) for item in items
+                      if not hasattr(item, cache_name))
+            ids.discard(None)
+            if not ids:
+                continue
+
+            objects = field.rel.to._default_manager.in_bulk(list(ids))
+            for item in items:
+                obj = objects.get(getattr(item, field.attname))
+                if obj is not None:
+                    setattr(item, cache_name, obj)
+
+        # Language URLs need the language's video, which is usually the
+        # action's own video.  select_related() caches None for actions
+        # without one (member and deleted video actions).
+        videos = dict((item.video_id, item.video) for item in items
+                      if getattr(item, '_video_cache', None) is not None)
+        for item in items:
+            language = getattr(item, '_language_cache', None)
+            if language and language.video_id in videos:
+                language._video_cache = videos[language.video_id]
+
+    def _render(self, item):
+        if self._template is None:
+            self._template = get_template(self.template_name)
+
+        return self._template.render(Context({
+            'info': self.render_info(item),
+            'item': item,
+            'timestamp': mark_safe(self.TIMESTAMP),
+        }))
+
+    def render_info(self, item):
+        if item.action_type == Action.ADD_VERSION and not item.language:
+            return ''
+
+        method = getattr(self, 'render_%s' % Action.TYPE_NAMES.get(
+            item.action_type), None)
+        return method(item) if method else ''
 
     def _base_kwargs(self, item):
         data = {}
@@ -2141,6 +2424,25 @@ class Action(models.Model):
         (DELETE_VIDEO, _(u'delete video')),
     )
 
+    # Names of the types above, for ActionRenderer.render_info().
+    TYPE_NAMES = {
+        ADD_VIDEO: 'ADD_VIDEO',
+        CHANGE_TITLE: 'CHANGE_TITLE',
+        COMMENT: 'COMMENT',
+        ADD_VERSION: 'ADD_VERSION',
+        ADD_VIDEO_URL: 'ADD_VIDEO_URL',
+        ADD_TRANSLATION: 'ADD_TRANSLATION',
+        SUBTITLE_REQUEST: 'SUBTITLE_REQUEST',
+        APPROVE_VERSION: 'APPROVE_VERSION',
+        MEMBER_JOINED: 'MEMBER_JOINED',
+        REJECT_VERSION: 'REJECT_VERSION',
+        MEMBER_LEFT: 'MEMBER_LEFT',
+        REVIEW_VERSION: 'REVIEW_VERSION',
+        ACCEPT_VERSION: 'ACCEPT_VERSION',
+        DECLINE_VERSION: 'DECLINE_VERSION',
+        DELETE_VIDEO: 'DELETE_VIDEO',
+    }
+
     renderer = ActionRenderer('videos/_action_tpl.html')
     renderer_for_video = ActionRenderer('videos/_action_tpl_video.html')
 
@@ -2350,7 +2652,215 @@ class Action(models.Model):
             instance.save()
 
 
+class ActionFeedManager(models.Manager):
+    # Rows per INSERT when fanning actions out.
+    BATCH_SIZE = 500
+
+    def for_team(self, team, public_only=True):
+        '''Return the entries of the given team's activity feed, newest first.
+
+        This is the materialized equivalent of Action.objects.for_team().  Use
+        actions() to turn a page of entries into Actions.
+
+        '''
+        result = self.filter(team=team)
+
+        if public_only:
+            result = result.filter(public=True)
+
+        return result.order_by('-created', '-id')
+
+    def for_user(self, user):
+        '''Return the entries of the given user's activity feed, newest first.
+
+        This is the materialized equivalent of Action.objects.for_user().
+
+        '''
+        return self.filter(user=user).order_by('-created', '-id')
+
+    def actions(self, entries):
+        '''Return the Actions of the given entries, in the same order.'''
+        action_ids = [entry.action_id for entry in entries]
+        actions = Action.objects.filter(id__in=action_ids).select_related(
+            'video', 'user', 'language', 'language__video'
+        ).order_by()
+        actions = dict((action.pk, action) for action in actions)
+
+        return [actions[pk] for pk in action_ids if pk in actions]
+
+    def _bulk_create(self, entries):
+        for i in xrange(0, len(entries), self.BATCH_SIZE):
+            self.bulk_create(entries[i:i + self.BATCH_SIZE])
+        return len(entries)
+
+    def _public_language_ids(self, actions):
+        language_ids = set(a.language_id for a in actions if a.language_id)
+        if not language_ids:
+            return set()
+
+        return set(SubtitleLanguage.objects.filter(
+            pk__in=language_ids, has_version=True).values_list('pk', flat=True))
+
+    def _entry(self, action, public, **kwargs):
+        return ActionFeedEntry(action_id=action.pk, video_id=action.video_id,
+                               language_id=action.language_id, public=public,
+                               created=action.created, **kwargs)
+
+    def add_actions(self, actions, members_async=True):
+        '''Fan the given (new) Actions out to the feeds they belong in.
+
+        An action goes in the feed of its team and of its video's team, and in
+        the feeds of its user and of every member of its team, which mirrors
+        ActionManager.for_team() and for_user().
+
+        Teams can be big, so by default the members' entries are created by
+        a celery task (see add_member_entries).  Returns the number of entries
+        created here.
+
+        '''
+        from teams.models import TeamVideo
+
+        video_ids = set(a.video_id for a in actions if a.video_id)
+        video_teams = dict(TeamVideo.objects.filter(video__in=video_ids)
+                                            .values_list('video', 'team'))
+
+        public_language_ids = self._public_language_ids(actions)
+
+        entries = []
+        for action in actions:
+            public = action.language_id in public_language_ids
+
+            teams = set([action.team_id, video_teams.get(action.video_id)])
+
+            entries.extend(self._entry(action, public, team_id=team_id)
+                           for team_id in teams if team_id)
+            if action.user_id:
+                entries.append(self._entry(action, public,
+                                           user_id=action.user_id))
+
+        created = self._bulk_create(entries)
+
+        team_action_ids = [a.pk for a in actions if a.team_id]
+        if team_action_ids:
+            if members_async:
+                from videos.tasks import add_action_feed_member_entries
+                add_action_feed_member_entries.delay(team_action_ids)
+            else:
+                created += self.add_member_entries(
+                    [a for a in actions if a.team_id])
+
+        return created
+
+    def add_member_entries(self, actions):
+        '''Add the given Actions to the feeds of their team's members.
+
+        The acting user is skipped, add_actions() has already handled them.
+        Returns the number of entries created.
+
+        '''
+        from teams.models import TeamMember
+
+        team_ids = set(a.team_id for a in actions if a.team_id)
+        if not team_ids:
+            return 0
+
+        members = {}
+        for team_id, user_id in (TeamMember.objects.filter(team__in=team_ids)
+                                                   .values_list('team', 'user')):
+            members.setdefault(team_id, set()).add(user_id)
+
+        public_language_ids = self._public_language_ids(actions)
+
+        entries = []
+        for action in actions:
+            public = action.language_id in public_language_ids
+            users = members.get(action.team_id, set()) - set([action.user_id])
+
+            entries.extend(self._entry(action, public, user_id=user_id)
+                           for user_id in users)
+
+        return self._bulk_create(entries)
+
+    def remove_member(self, team_id, user_id):
+        '''Remove a team's activity from the feed of a member who left it.
+
+        The user's own actions stay in their feed.
+
+        '''
+        (self.filter(user=user_id, action__team=team_id)
+             .exclude(action__user=user_id)
+             .delete())
+
+    def set_video_team(self, video_id, team_id):
+        '''Move the actions of a video to the feed of the given team.
+
+        team_id may be None when the video leaves its team.  This is called
+        when a video is added to, moved between or removed from teams.
+
+        '''
+        moved = self.filter(video=video_id, team__isnull=False)
+        if team_id:
+            moved = moved.exclude(team=team_id)
+        moved.delete()
+
+        if not team_id:
+            return
+
+        existing = self.filter(video=video_id, team=team_id).values_list(
+            'action', flat=True)
+        actions = list(Action.objects.filter(video=video_id)
+                                     .exclude(pk__in=list(existing))
+                                     .order_by())
+        public_language_ids = self._public_language_ids(actions)
+
+        self._bulk_create([
+            self._entry(action, action.language_id in public_language_ids,
+                        team_id=team_id)
+            for action in actions])
+
+class ActionFeedEntry(models.Model):
+    """An Action as it appears in a team's or a user's activity feed.
+
+    Feeds are written when the Action is created so that reading one is a
+    range scan over a single index instead of the OR-joined Action queries in
+    ActionManager.  Each entry belongs to exactly one feed: either team or user
+    is set.  video, language and created are copied from the Action, and
+    public caches language.has_version.
+
+    """
+    action = models.ForeignKey(Action, related_name='feed_entries')
+    team = models.ForeignKey("teams.Team", blank=True, null=True)
+    user = models.ForeignKey(User, blank=True, null=True)
+    video = models.ForeignKey(Video, blank=True, null=True)
+    language = models.ForeignKey(SubtitleLanguage, blank=True, null=True)
+    public = models.BooleanField(default=False)
+    created = models.DateTimeField()
+
+    objects = ActionFeedManager()
+
+    def __unicode__(self):
+        return u'%s in %s' % (self.action_id, self.team_id and
+                              'team %s' % self.team_id or
+                              'user %s' % self.user_id)
+
+def action_feed_add(sender, instance, created, raw, **kwargs):
+    """Every Action.create_*_handler ends up here."""
+    if created and not raw:
+        ActionFeedEntry.objects.add_actions([instance])
+
+def action_feed_language_public(sender, instance, raw, **kwargs):
+    if raw:
+        return
+
+    (ActionFeedEntry.objects.filter(language=instance)
+                            .exclude(public=instance.has_version)
+                            .update(public=instance.has_version))
+
 post_save.connect(Action.create_comment_handler, Comment)
+post_save.connect(action_feed_add, Action,
+                  dispatch_uid='videos.action.action_feed_add')
+post_save.connect(action_feed_language_public, SubtitleLanguage,
+                  dispatch_uid='videos.subtitlelanguage.action_feed_language_public')
 
 
 # UserTestResult
@@ -2417,27 +2927,46 @@ class VideoFeed(models.Model):
     last_link = models.URLField(blank=True)
     created = models.DateTimeField(auto_now_add=True)
     user = models.ForeignKey(User, blank=True, null=True)
+    # HTTP validators from the last fetch, sent back to make it conditional
+    etag = models.CharField(max_length=255, blank=True)
+    last_modified = models.CharField(max_length=64, blank=True)
 
     def __unicode__(self):
         return self.url
 
-    def update(self):
-        feed_parser = FeedParser(self.url)
+    def update(self, parsed=None):
+        """Import the entries added since the last update.
+
+        parsed is the feed as returned by feed_poller.fetch(), if it has
+        already been fetched.  Returns the number of entries checked.
+
+        """
+        if parsed is None:
+            parsed = feed_poller.fetch(self.url, self.etag, self.last_modified)
+        if feed_poller.not_modified(parsed) or feed_poller.fetch_failed(parsed):
+            return 0
+
+        feed_parser = FeedParser(self.url, feed=parsed)
 
         checked_entries = 0
         last_link = self.last_link
 
         try:
             self.last_link = feed_parser.feed.entries[0]['link']
-            self.save()
         except (IndexError, KeyError):
             pass
+        self.etag = parsed.get('etag', '')[:255]
+        self.last_modified = parsed.get('modified', '')[:64]
+        self.save()
 
         _iter = feed_parser.items(reverse=True, until=last_link, ignore_error=True)
 
+        video_types = []
         for vt, info, entry in _iter:
-            vt and Video.get_or_create_for_url(vt=vt, user=self.user)
+            vt and video_types.append(vt)
             checked_entries += 1
 
+        Video.get_or_create_for_urls(video_types, user=self.user)
+
         return checked_entries
 
@@ -5,6 +5,7 @@ from models import Video
 from auth.models import CustomUser as User
 from utils.celery_search_index import CelerySearchIndex
 from django.conf import settings
+from django.db.models import Count
 from haystack.query import SearchQuerySet
 import datetime
 
@@ -100,22 +101,80 @@ class VideoIndex(CelerySearchIndex):
 
     IN_ROW = getattr(settings, 'VIDEO_IN_ROW', 6)
 
+    def prefetch(self, objects):
+        """Compute the per-video counts for a chunk of videos at once.
+
+        This is a handful of grouped queries per chunk instead of a few
+        queries per video.  The results are stored on the videos for prepare()
+        to pick up.
+
+        """
+        from videos.models import Action, SubtitleLanguage, SubtitleVersion
+
+        if not objects:
+            return
+
+        pks = [obj.pk for obj in objects]
+        data = dict((pk, {'languages': [], 'languages_count': 0,
+                          'contributors_count': 0, 'activity_count': 0,
+                          'original_language': None})
+                    for pk in pks)
+
+        for sl in SubtitleLanguage.objects.filter(video__in=pks):
+            item = data[sl.video_id]
+            if sl.subtitle_count:
+                if sl.language:
+                    item['languages'].append(sl.language)
+                if sl.has_version:
+                    item['languages_count'] += 1
+            if sl.is_original and item['original_language'] is None:
+                item['original_language'] = sl
+
+        contributors = (SubtitleVersion.objects
+                        .filter(language__video__in=pks, user__isnull=False)
+                        .order_by().values_list('language__video')
+                        .annotate(n=Count('user', distinct=True)))
+        for pk, count in contributors:
+            data[pk]['contributors_count'] = count
+
+        activity = (Action.objects.filter(video__in=pks).order_by()
+                    .values_list('video').annotate(n=Count('id')))
+        for pk, count in activity:
+            data[pk]['activity_count'] = count
+
+        for obj in objects:
+            obj._search_index_data = data[obj.pk]
+            # Saves a query per call to title_display().
+            obj._original_subtitle = data[obj.pk]['original_language']
+
+        Video.prefetch_views(objects)
+
     def prepare(self, obj):
         self.prepared_data = super(VideoIndex, self).prepare(obj)
 
-        langs = obj.subtitlelanguage_set.exclude(language=u'', subtitle_count__gt=0)
-        self.prepared_data['languages_count'] = obj.subtitlelanguage_set.filter(
-                subtitle_count__gt=0, has_version=True).count()
+        data = getattr(obj, '_search_index_data', None)
+        if data is None:
+            langs = obj.subtitlelanguage_set.exclude(language=u'', subtitle_count__gt=0)
+            data = {
+                'languages': [lang.language for lang in langs if lang.subtitle_count],
+                'languages_count': obj.subtitlelanguage_set.filter(
+                    subtitle_count__gt=0, has_version=True).count(),
+                'contributors_count': User.objects.filter(subtitleversion__language__video=obj).distinct().count(),
+                'activity_count': obj.action_set.count(),
+            }
+
+        self.prepared_data['languages_count'] = data['languages_count']
         self.prepared_data['video_language'] = obj.language
         #TODO: converting should be in Field
         self.prepared_data['video_language'] = obj.language and LanguageField.prepare_lang(obj.language) or u''
-        self.prepared_data['languages'] = [LanguageField.prepare_lang(lang.language) for lang in langs if lang.subtitle_count]
-        self.prepared_data['contributors_count'] = User.objects.filter(subtitleversion__language__video=obj).distinct().count()
-        self.prepared_data['activity_count'] = obj.action_set.count()
-        self.prepared_data['week_views'] = obj.views['week']
-        self.prepared_data['month_views'] = obj.views['month']
-        self.prepared_data['year_views'] = obj.views['year']
-        self.prepared_data['today_views'] = obj.views['today']
+        self.prepared_data['languages'] = [LanguageField.prepare_lang(lang) for lang in data['languages']]
+        self.prepared_data['contributors_count'] = data['contributors_count']
+        self.prepared_data['activity_count'] = data['activity_count']
+        views = obj.views
+        self.prepared_data['week_views'] = views['week']
+        self.prepared_data['month_views'] = views['month']
+        self.prepared_data['year_views'] = views['year']
+        self.prepared_data['today_views'] = views['today']
         self.prepared_data['title'] = obj.title_display(truncate=False).strip()
         self.prepared_data['is_public'] = obj.is_public
 
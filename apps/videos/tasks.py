@@ -36,10 +36,13 @@ from messages.models import Message
 from utils import send_templated_email, DEFAULT_PROTOCOL
 from utils.metrics import Gauge, Meter
 from videos.models import VideoFeed, SubtitleLanguage, Video, Subtitle, SubtitleVersion
+from videos import feed_poller
 from videos.feed_parser import FeedParser
 
 celery_logger = logging.getLogger('celery.task')
 
+FEED_POLL_BATCH_SIZE = getattr(settings, 'FEED_POLL_BATCH_SIZE', 50)
+
 
 def process_failure_signal(exception, traceback, sender, task_id,
                            signal, args, kwargs, einfo, **kw):
@@ -78,6 +81,11 @@ def cleanup():
     TaskState.objects.filter(tstamp__lt=d).delete()
     transaction.commit_unless_managed()
 
+def _save_thumbnail_in_s3(video):
+    if video.thumbnail and not video.s3_thumbnail:
+        content = ContentFile(urlopen(video.thumbnail).read())
+        video.s3_thumbnail.save(video.thumbnail.split('/')[-1], content)
+
 @task
 def save_thumbnail_in_s3(video_id):
     try:
@@ -85,14 +93,38 @@ def save_thumbnail_in_s3(video_id):
     except Video.DoesNotExist:
         return
 
-    if video.thumbnail and not video.s3_thumbnail:
-        content = ContentFile(urlopen(video.thumbnail).read())
-        video.s3_thumbnail.save(video.thumbnail.split('/')[-1], content)
+    _save_thumbnail_in_s3(video)
+
+@task
+def save_thumbnails_in_s3(video_ids):
+    videos = Video.objects.filter(pk__in=video_ids, s3_thumbnail='') \
+                          .exclude(thumbnail='')
+    for video in videos:
+        try:
+            _save_thumbnail_in_s3(video)
+        except Exception:
+            celery_logger.exception('Error saving the thumbnail of %s' %
+                                    video.video_id)
 
 @periodic_task(run_every=crontab(minute=0, hour=1))
 def update_from_feed(*args, **kwargs):
-    for feed in VideoFeed.objects.all():
-        update_video_feed.delay(feed.pk)
+    feed_ids = list(VideoFeed.objects.values_list('pk', flat=True))
+    for i in xrange(0, len(feed_ids), FEED_POLL_BATCH_SIZE):
+        update_video_feeds.delay(feed_ids[i:i + FEED_POLL_BATCH_SIZE])
+
+@task
+def update_video_feeds(video_feed_ids):
+    feeds = VideoFeed.objects.filter(pk__in=video_feed_ids) \
+                             .select_related('user')
+    return feed_poller.update_feeds(feeds)
+
+@task
+def add_action_feed_member_entries(action_ids):
+    """Fan new team actions out to the feeds of the team's members."""
+    from videos.models import Action, ActionFeedEntry
+
+    actions = list(Action.objects.filter(pk__in=action_ids))
+    ActionFeedEntry.objects.add_member_entries(actions)
 
 @task
 def update_subtitles_fetched_counter_for_sl(sl_pk):
@@ -107,7 +139,7 @@ def update_video_feed(video_feed_id):
     try:
         video_feed = VideoFeed.objects.get(pk=video_feed_id)
         video_feed.update()
-    except VideoFeed:
+    except VideoFeed.DoesNotExist:
         msg = '**update_video_feed**. VideoFeed does not exist. ID: %s' % video_feed_id
         client.captureMessage(msg)
 
@@ -198,7 +230,7 @@ def import_videos_from_feeds(urls, user_id=None):
     except ObjectDoesNotExist:
         user = None
 
-    videos = []
+    video_types = []
     last_entry = dict()
 
     for url in urls:
@@ -206,11 +238,13 @@ def import_videos_from_feeds(urls, user_id=None):
 
         for vt, info, entry in feed_parser.items():
             if not vt: continue
-            videos.append(Video.get_or_create_for_url(vt=vt, user=user))
+            video_types.append(vt)
             last_entry = entry
         else:
             _save_video_feed(url, last_entry.get('link', ''), user)
 
+    videos = Video.get_or_create_for_urls(video_types, user=user)
+
     if user:
         notifier.videos_imported_message.delay(user_id, len(videos))
 
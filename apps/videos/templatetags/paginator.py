@@ -15,8 +15,12 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see 
 # http://www.gnu.org/licenses/agpl-3.0.html.
+import base64
+import json
+
 from django import template
 from django.core.paginator import Paginator, EmptyPage
+from django.db.models import Q
 
 register = template.Library()
 
@@ -48,6 +52,88 @@ def paginate(items, per_page, page):
         'previous': page_obj.previous_page_number(),
     }
 
+def _keyset_fields(qs):
+    """Return [(field_name, descending)] for the ordering of qs.
+
+    The ordering has to end with a unique field (usually the pk) for the
+    cursors to be unambiguous.
+
+    """
+    fields = []
+    for name in qs.query.order_by:
+        descending = name.startswith('-')
+        name = name.lstrip('-')
+        if name == 'pk':
+            name = qs.model._meta.pk.name
+        fields.append((name, descending))
+    return fields
+
+def _encode_cursor(obj, fields):
+    values = [getattr(obj, name) for name, _ in fields]
+    values = [None if v is None else unicode(v) for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values))
+
+def _decode_cursor(qs, fields, cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(str(cursor)))
+        return [qs.model._meta.get_field(name).to_python(value)
+                for (name, _), value in zip(fields, values)]
+    except (TypeError, ValueError, UnicodeEncodeError):
+        return None
+
+def _seek(fields, values, forward):
+    """Return a Q for the rows past the given cursor values.
+
+    Rows are past the cursor when they're past it on some field and equal to
+    it on all the fields before that one.
+
+    """
+    q = None
+    equal = {}
+    for (name, descending), value in zip(fields, values):
+        lookup = 'lt' if descending == forward else 'gt'
+        past = Q(**dict(equal, **{'%s__%s' % (name, lookup): value}))
+        q = past if q is None else q | past
+        equal[name] = value
+    return q
+
+def paginate_keyset(qs, per_page, after=None, before=None):
+    """Return a page of qs and its pagination info, using cursors.
+
+    Unlike paginate() this never counts the results or uses OFFSET, so deep
+    pages cost the same as the first one, as long as the database has an index
+    matching the ordering of qs.  Pages are addressed by the opaque cursors in
+    the info dict ('next_cursor' and 'previous_cursor'), which are passed back
+    in as `after` and `before`.  Bad cursors give the first page.
+
+    """
+    fields = _keyset_fields(qs)
+
+    values = before and _decode_cursor(qs, fields, before)
+    if values:
+        reverse = [('%s' if descending else '-%s') % name
+                   for name, descending in fields]
+        items = list(qs.filter(_seek(fields, values, False))
+                       .order_by(*reverse)[:per_page + 1])
+        has_previous, has_next = len(items) > per_page, True
+        items = items[:per_page][::-1]
+    else:
+        values = after and _decode_cursor(qs, fields, after)
+        if values:
+            qs = qs.filter(_seek(fields, values, True))
+        items = list(qs[:per_page + 1])
+        has_previous, has_next = bool(values), len(items) > per_page
+        items = items[:per_page]
+
+    return items, {
+        'has_next': bool(items) and has_next,
+        'has_previous': bool(items) and has_previous,
+        'is_paginated': bool(items) and (has_next or has_previous),
+        'next_cursor': _encode_cursor(items[-1], fields) if items else None,
+        'previous_cursor': _encode_cursor(items[0], fields) if items else None,
+        'results_per_page': per_page,
+    }
+
 def paginator(context, anchor='', adjacent_pages=3):
     """
     To be used in conjunction with the object_list generic view.
@@ -97,6 +183,28 @@ def paginator(context, anchor='', adjacent_pages=3):
 
 register.inclusion_tag('_paginator.html', takes_context=True)(paginator)
 
+def keyset_paginator(context, anchor=''):
+    """Previous/next links for a page from paginate_keyset()."""
+    getvars = ''
+    if 'request' in context:
+        GET_vars = context['request'].GET.copy()
+        for name in ('page', 'after', 'before'):
+            if name in GET_vars:
+                del GET_vars[name]
+        if len(GET_vars.keys()) > 0:
+            getvars = "&%s" % GET_vars.urlencode()
+
+    return {
+        'has_next': context['has_next'],
+        'has_previous': context['has_previous'],
+        'next_cursor': context['next_cursor'],
+        'previous_cursor': context['previous_cursor'],
+        'getvars': getvars,
+        'anchor': anchor
+    }
+
+register.inclusion_tag('_keyset_paginator.html', takes_context=True)(keyset_paginator)
+
 @register.tag
 def ordered_column(parser, token):
     try:
@@ -17,7 +17,7 @@
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
 from django import template
-from videos.models import Action
+from videos.models import Action, ActionFeedEntry
 from django.conf import settings
 from datetime import date
 from django.utils.dateformat import format as date_format
@@ -28,19 +28,21 @@ LIMIT = settings.RECENT_ACTIVITIES_ONPAGE
 
 @register.inclusion_tag('videos/_recent_activity.html')
 def recent_activity(user):
-    qs = Action.objects.for_user(user=user)
+    entries = ActionFeedEntry.objects.for_user(user)[:LIMIT]
+    events = ActionFeedEntry.objects.actions(entries)
+    Action.renderer.render_many(events)
 
     return {
-        'events': qs[:LIMIT],
+        'events': events,
         'user_info': user
     }
 
 @register.inclusion_tag('videos/_video_activity.html')
 def video_activity(video, user):
-    qs = (Action.objects.for_video(video, user)
-                .select_related('user', 'language__video', 'language', 'video'))
+    events = list(Action.objects.for_video(video, user)[:LIMIT])
+    Action.renderer_for_video.render_many(events)
 
     return {
-        'events': qs[:LIMIT],
+        'events': events,
         'video': video
     }
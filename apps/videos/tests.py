@@ -16,11 +16,16 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program. If not, see
 # http://www.gnu.org/licenses/agpl-3.0.html.
+import BaseHTTPServer
+import SocketServer
 import codecs
 import feedparser
 import json
 import os
 import re
+import threading
+import time
+import urlparse
 from datetime import datetime
 from StringIO import StringIO
 
@@ -29,7 +34,7 @@ from django.conf import settings
 from django.core import mail
 from django.core.cache import cache
 from django.core.urlresolvers import reverse
-from django.db.models import ObjectDoesNotExist
+from django.db.models import ObjectDoesNotExist, Q
 from django.test import TestCase
 from django.contrib.contenttypes.models import ContentType
 
@@ -42,14 +47,14 @@ from testhelpers.views import _create_videos
 from utils.subtitles import (
     SrtSubtitleParser, YoutubeSubtitleParser, TxtSubtitleParser, DfxpSubtitleParser
 )
-from videos import metadata_manager, alarms, EffectiveSubtitle
+from videos import metadata_manager, alarms, EffectiveSubtitle, feed_poller
 from utils.unisubsmarkup import html_to_markup, markup_to_html
 from videos.feed_parser import FeedParser
 from videos.forms import VideoForm
 from videos.models import (
     Video, Action, VIDEO_TYPE_YOUTUBE, UserTestResult, SubtitleLanguage,
     VideoUrl, VideoFeed, Subtitle, SubtitleVersion, VIDEO_TYPE_HTML5,
-    VIDEO_TYPE_BRIGHTCOVE
+    VIDEO_TYPE_BRIGHTCOVE, ActionFeedEntry
 )
 from videos.rpc import VideosApiClass
 from videos.share_utils import _make_email_url
@@ -63,6 +68,7 @@ from videos.types.flv import FLVVideoType
 from videos.types.htmlfive import HtmlFiveVideoType
 from videos.types.mp3 import Mp3VideoType
 from videos.types.vimeo import VimeoVideoType
+from videos.types import youtube
 from videos.types.youtube import YoutubeVideoType, save_subtitles_for_lang
 from vidscraper.sites import blip
 from widget import video_cache
@@ -785,6 +791,38 @@ class VideoTest(TestCase):
         cache_id_3 = video_cache.get_video_id(video_url)
         self.assertEqual(cache_id_3, cache_id_2)
 
+    def test_views(self):
+        from datetime import date, timedelta
+        from statistic import st_widget_view_statistic
+        from statistic.models import WidgetViewCounter
+
+        video, created = Video.get_or_create_for_url(self.youtube_video)
+        other, created = Video.get_or_create_for_url(self.html5_video)
+        today = date.today()
+
+        for days_ago, count in [(0, 1), (3, 10), (20, 100), (200, 1000),
+                                (400, 10000)]:
+            WidgetViewCounter.objects.create(
+                video=video, date=today - timedelta(days=days_ago),
+                count=count)
+
+        views = st_widget_view_statistic.get_views(video=video)
+        self.assertEqual(views['week'], 11)
+        self.assertEqual(views['month'], 111)
+        self.assertEqual(views['year'], 1111)
+
+        bulk = st_widget_view_statistic.get_views_bulk(
+            'video', [video.pk, other.pk])
+        self.assertEqual(bulk[video.pk], views)
+        self.assertEqual(bulk[other.pk],
+                         st_widget_view_statistic.get_views(video=other))
+
+        cache.delete_many([Video._views_cache_key(v.pk)
+                           for v in (video, other)])
+        Video.prefetch_views([video, other])
+        self.assertEqual(video.views['month'], 111)
+        self.assertEqual(other.views['month'], 0)
+
 class RpcTest(TestCase):
     fixtures = ['test.json']
 
@@ -1353,6 +1391,97 @@ class VideoTypeRegistrarTest(TestCase):
         self.assertRaises(VideoTypeError, video_type_registrar.video_type_for_url,
                           'http://youtube.com/v=100500')
 
+    def test_indexed_dispatch(self):
+        urls = [
+            'http://www.youtube.com/watch?v=UOtJUmiUZ08',
+            'http://youtu.be/J_DV9b0x7v4',
+            'http://vimeo.com/15786066',
+            'http://player.vimeo.com/video/22070806',
+            'http://blip.tv/day9tv/day-9-daily-101-kawaii-rice-tvp-macro-1531',
+            'http://bcove.me/7q6lqdhw',
+            'http://videos.mozilla.org/firefox/3.5/switch/switch.ogv',
+            'http://example.com/talk.flv',
+            'http://example.com/episode-12.mp3',
+            'http://www.youtube.com/video.mp4',
+            'http://www.example.com/not-a-video',
+            'not a url',
+        ]
+        registrar = video_type_registrar
+        for url in urls:
+            self.assertEqual(registrar.video_type_class_for_url(url),
+                             registrar._scan(url, registrar.itervalues()))
+
+        self.assertEqual(
+            registrar.video_type_class_for_url('http://vimeo.com/15786066'),
+            VimeoVideoType)
+        candidates = registrar._candidates_for_host('player.vimeo.com')
+        self.assertTrue(VimeoVideoType in candidates)
+        self.assertTrue(YoutubeVideoType not in candidates)
+        self.assertTrue(HtmlFiveVideoType in candidates)
+
+    def test_url_cache(self):
+        calls = []
+
+        class MockupVideoType(VideoType):
+            abbreviation = 'mockup'
+            name = 'MockUp'
+            hosts = ('example.com',)
+
+            @classmethod
+            def matches_video_url(cls, url):
+                calls.append(url)
+                return url.endswith('/video')
+
+        registrar = VideoTypeRegistrar()
+        registrar.url_cache.size = 2
+        registrar.register(MockupVideoType)
+
+        for url in ['http://example.com/video', 'http://example.com/other',
+                    'http://example.com/video']:
+            registrar.video_type_class_for_url(url)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(
+            registrar.video_type_class_for_url('http://example.com/video'),
+            MockupVideoType)
+        self.assertEqual(
+            registrar.video_type_class_for_url('http://example.com/other'),
+            None)
+        self.assertEqual(len(calls), 2)
+
+    def test_url_cache_network_types(self):
+        calls = []
+
+        class NetworkVideoType(VideoType):
+            abbreviation = 'network'
+            name = 'Network'
+            hosts = ('example.com',)
+            matches_over_network = True
+
+            @classmethod
+            def matches_video_url(cls, url):
+                # Pretend the request failed.
+                calls.append(url)
+                return False
+
+        registrar = VideoTypeRegistrar()
+        registrar.register(NetworkVideoType)
+
+        for i in range(2):
+            self.assertEqual(
+                registrar.video_type_class_for_url('http://example.com/video'),
+                None)
+        # A "no" from a network type could be an error, so it's asked again.
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(len(registrar.url_cache), 0)
+
+        # Hosts that aren't registered never get to the type.
+        registrar.video_type_class_for_url('http://example.org/video')
+        self.assertEqual(len(calls), 2)
+
+        registrar.video_type_class_for_url('http://example.com/third')
+        registrar.video_type_class_for_url('http://example.com/video')
+        self.assertEqual(len(calls), 4)
+
 
 class TestFeedsSubmit(TestCase):
     def setUp(self):
@@ -2493,6 +2622,105 @@ class FollowTest(WebUseTest):
 
         self.assertEquals(1, sl.followers.count())
 
+class TestActionFeed(TestCase):
+    fixtures = ['test.json']
+
+    def setUp(self):
+        self.user = User.objects.all()[0]
+        self.team = Team.objects.create(name='feed', slug='feed')
+        TeamMember.objects.create(team=self.team, user=self.user)
+        self.video = Video.objects.filter(teamvideo__isnull=True)[0]
+
+    def assertFeedsMatch(self):
+        for public_only in (True, False):
+            entries = ActionFeedEntry.objects.for_team(self.team, public_only)
+            expected = (Action.objects.for_team(self.team, public_only, ids=True)
+                                      .order_by('-created', '-id'))
+            self.assertEqual([a.pk for a in ActionFeedEntry.objects.actions(entries)],
+                             list(expected))
+
+        entries = ActionFeedEntry.objects.for_user(self.user)
+        self.assertEqual(set(e.action_id for e in entries),
+                         set(a.pk for a in Action.objects.for_user(self.user)))
+
+    def test_feeds(self):
+        Action.change_title_handler(self.video, self.user)
+        self.assertFeedsMatch()
+
+        team_video = TeamVideo.objects.create(team=self.team, video=self.video,
+                                              added_by=self.user)
+        Action.create_member_left_handler(self.team, User.objects.all()[1])
+        self.assertFeedsMatch()
+
+        language = SubtitleLanguage.objects.create(
+            video=self.video, language='eo', created=datetime.now())
+        Action.objects.create(video=self.video, language=language,
+                              user=self.user, created=datetime.now(),
+                              action_type=Action.ADD_VERSION)
+        self.assertFeedsMatch()
+
+        language.has_version = True
+        language.save()
+        self.assertFeedsMatch()
+
+        team_video.delete()
+        self.assertFeedsMatch()
+
+    def test_member_removed(self):
+        other = User.objects.exclude(pk=self.user.pk)[0]
+        member = TeamMember.objects.create(team=self.team, user=other)
+
+        Action.create_member_left_handler(self.team, self.user)
+        action = Action.objects.filter(team=self.team).latest('pk')
+
+        def _in_feed():
+            return (ActionFeedEntry.objects.for_user(other)
+                                           .filter(action=action).exists())
+
+        self.assertTrue(_in_feed())
+
+        # A former member doesn't see the team's activity any more.
+        member.delete()
+        self.assertFalse(_in_feed())
+        self.assertTrue(ActionFeedEntry.objects.for_user(self.user)
+                                               .filter(action=action).exists())
+
+    def test_render_many(self):
+        cache.clear()
+        Action.change_title_handler(self.video, self.user)
+        Action.create_member_left_handler(self.team, self.user)
+        actions = list(Action.objects.filter(
+            Q(video=self.video) | Q(team=self.team)))
+        self.assertTrue(actions)
+
+        rendered = Action.renderer.render_many(actions)
+        for action, html in zip(actions, rendered):
+            self.assertFalse(Action.renderer.TIMESTAMP in html)
+            self.assertEqual(action.render(), html)
+
+        # The second time around everything comes from the cache.
+        fresh = list(Action.objects.filter(pk__in=[a.pk for a in actions]))
+        fresh.sort(key=lambda a: [b.pk for b in actions].index(a.pk))
+        with self.assertNumQueries(0):
+            self.assertEqual(Action.renderer.render_many(fresh), rendered)
+
+    def test_render_many_without_video(self):
+        cache.clear()
+        member = TeamMember.objects.create(team=self.team, user=self.user)
+        Action.create_new_member_handler(member)
+        Action.change_title_handler(self.video, self.user)
+
+        # The feeds load actions with select_related(), which caches a None
+        # video on the member action.
+        entries = ActionFeedEntry.objects.for_user(self.user)
+        actions = ActionFeedEntry.objects.actions(entries)
+        self.assertTrue(Action.MEMBER_JOINED in
+                        [a.action_type for a in actions])
+
+        rendered = Action.renderer.render_many(actions)
+        for action, html in zip(actions, rendered):
+            self.assertEqual(action.render(), html)
+
 class MarkupHtmlTest(TestCase):
 
     def test_markup_to_html(self):
@@ -2629,3 +2857,308 @@ def add_subs(language, subs_texts):
             end_time = i + 1 - 0.1
         )
 
+
+class TestGetOrCreateForUrls(TestCase):
+    fixtures = ['test.json']
+
+    def setUp(self):
+        self.user = User.objects.all()[0]
+        self.user.notify_by_message = True
+        self.user.save()
+
+    def test_get_or_create_for_urls(self):
+        existing_url = 'http://example.com/existing.mp4'
+        existing, created = Video.get_or_create_for_url(existing_url)
+        new_urls = ['http://example.com/new-%s.mp4' % i for i in xrange(5)]
+
+        video_count = Video.objects.count()
+        results = Video.get_or_create_for_urls(
+            [new_urls[0], existing_url, 'http://example.com/not-a-video'] +
+            new_urls + [video_type_registrar.video_type_for_url(existing_url)],
+            user=self.user)
+
+        self.assertEqual(len(results), 9)
+        self.assertEqual(results[1], (existing, False))
+        self.assertEqual(results[2], (None, False))
+        self.assertEqual(results[8], (existing, False))
+        self.assertEqual(results[0], results[3])
+        self.assertEqual(Video.objects.count(), video_count + 5)
+
+        for url, (video, created) in zip(new_urls, results[3:8]):
+            self.assertTrue(created)
+            self.assertTrue(video.pk)
+            video_url = VideoUrl.objects.get(url=url)
+            self.assertEqual(video_url.video, video)
+            self.assertTrue(video_url.original and video_url.primary)
+            self.assertEqual(video_url.added_by, self.user)
+            self.assertEqual(video.user, self.user)
+            self.assertTrue(Action.objects.filter(
+                video=video, action_type=Action.ADD_VIDEO,
+                user=self.user).exists())
+            self.assertTrue(ActionFeedEntry.objects.filter(
+                action__video=video, user=self.user).exists())
+
+        followed = set(self.user.followed_videos.values_list('pk', flat=True))
+        self.assertTrue(existing.pk in followed)
+        self.assertTrue(all(v.pk in followed for v, c in results[3:8]))
+
+        # A second import finds everything.
+        results = Video.get_or_create_for_urls(new_urls)
+        self.assertEqual([c for v, c in results], [False] * 5)
+        self.assertEqual(Video.objects.count(), video_count + 5)
+
+
+class FeedStubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serves the canned feeds in `feeds`, honouring If-None-Match."""
+    # path -> (etag, body)
+    feeds = {}
+    # (path, If-None-Match header) of every request
+    requests = []
+
+    def do_GET(self):
+        etag, body = self.feeds[self.path]
+        sent_etag = self.headers.get('If-None-Match')
+        self.requests.append((self.path, sent_etag))
+
+        if sent_etag == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/rss+xml')
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class FeedStubServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+def _rss(*links):
+    items = ''.join('<item><title>%s</title><link>%s</link></item>' % (l, l)
+                    for l in links)
+    return ('<?xml version="1.0" encoding="utf-8"?><rss version="2.0">'
+            '<channel><title>Test</title><link>http://example.com/</link>'
+            '%s</channel></rss>' % items)
+
+class TestFeedPoller(TestCase):
+    fixtures = ['test.json']
+
+    def setUp(self):
+        FeedStubHandler.feeds = {}
+        FeedStubHandler.requests = []
+        self.server = FeedStubServer(('127.0.0.1', 0), FeedStubHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+        self.user = User.objects.all()[0]
+        self.limiter = feed_poller.HostLimiter(per_host=2, delay=0)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _feed(self, path, etag, *links):
+        FeedStubHandler.feeds[path] = (etag, _rss(*links))
+        url = 'http://127.0.0.1:%s%s' % (self.server.server_address[1], path)
+        feed, created = VideoFeed.objects.get_or_create(
+            url=url, defaults={'user': self.user})
+        return feed
+
+    def _update(self):
+        return feed_poller.update_feeds(VideoFeed.objects.all(),
+                                        limiter=self.limiter)
+
+    def test_conditional_get(self):
+        links = ['http://example.com/feed-a/%s.mp4' % i for i in xrange(3)]
+        feed = self._feed('/a', '"v1"', *links)
+        other = self._feed('/b', '"w1"', 'http://example.com/feed-b/0.mp4')
+
+        self.assertEqual(self._update(), 2)
+        for link in links:
+            self.assertTrue(VideoUrl.objects.filter(url=link).exists())
+        feed = VideoFeed.objects.get(pk=feed.pk)
+        self.assertEqual(feed.etag, '"v1"')
+        self.assertEqual(feed.last_link, links[0])
+
+        # Nothing changed, so both feeds come back as 304s.
+        video_count = Video.objects.count()
+        self.assertEqual(self._update(), 0)
+        self.assertEqual(Video.objects.count(), video_count)
+        self.assertEqual(sorted(FeedStubHandler.requests[-2:]),
+                         [('/a', '"v1"'), ('/b', '"w1"')])
+
+        # Only the changed feed is imported again, and only its new entry.
+        new_link = 'http://example.com/feed-a/new.mp4'
+        self._feed('/a', '"v2"', new_link, *links)
+        self.assertEqual(self._update(), 1)
+        self.assertEqual(Video.objects.count(), video_count + 1)
+        self.assertEqual(VideoFeed.objects.get(pk=feed.pk).etag, '"v2"')
+
+    def test_existing_urls(self):
+        link = 'http://example.com/existing.mp4'
+        video, created = Video.get_or_create_for_url(link)
+        feed = self._feed('/c', '"x1"', link, 'http://example.com/fresh.mp4')
+
+        video_count = Video.objects.count()
+        self.assertEqual(self._update(), 1)
+        self.assertEqual(Video.objects.count(), video_count + 1)
+        self.assertEqual(VideoUrl.objects.get(url=link).video, video)
+
+    def test_fetch_error(self):
+        feed = self._feed('/d', '"y1"', 'http://example.com/d.mp4')
+        self.server.shutdown()
+        self.server.server_close()
+
+        self.assertEqual(self._update(), 0)
+        self.assertEqual(VideoFeed.objects.get(pk=feed.pk).etag, '')
+
+    def test_host_limiter(self):
+        limiter = feed_poller.HostLimiter(per_host=1, delay=0)
+        running = []
+        overlapped = []
+
+        def fetch(url):
+            with limiter.limit(url):
+                running.append(url)
+                overlapped.append(len(running) > 1)
+                time.sleep(0.01)
+                running.remove(url)
+
+        threads = [threading.Thread(target=fetch,
+                                    args=('http://example.com/%s' % i,))
+                   for i in xrange(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(overlapped, [False] * 4)
+
+
+class TimedTextStubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serves the caption tracks in `tracks` like youtube's timedtext API."""
+    protocol_version = 'HTTP/1.1'
+    # lang_code -> list of texts
+    tracks = {}
+    # (client port, lang_code) of every request
+    requests = []
+
+    def do_GET(self):
+        query = urlparse.parse_qs(urlparse.urlsplit(self.path).query)
+        lang_code = query['lang'][0]
+        self.requests.append((self.client_address[1], lang_code))
+
+        if lang_code in self.tracks:
+            status = 200
+            body = '<transcript>%s</transcript>' % ''.join(
+                '<text start="%s" dur="1">%s</text>' % (i + 1, text)
+                for i, text in enumerate(self.tracks[lang_code]))
+        else:
+            status, body = 404, ''
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class TestYoutubeCaptionImport(TestCase):
+    fixtures = ['test.json']
+
+    def setUp(self):
+        TimedTextStubHandler.tracks = {
+            'en': ['One', 'Two', 'Three'],
+            'fr': ['Un', 'Deux', 'Trois'],
+            'de': ['Eins', 'Zwei', 'Drei'],
+            'es': ['Uno', 'Dos', 'Tres'],
+        }
+        TimedTextStubHandler.requests = []
+        self.server = FeedStubServer(('127.0.0.1', 0), TimedTextStubHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+        self.old_timedtext_url = youtube.TIMEDTEXT_URL
+        youtube.TIMEDTEXT_URL = 'http://127.0.0.1:%s/api/timedtext' % (
+            self.server.server_address[1])
+
+        self.video, created = Video.get_or_create_for_url(
+            'http://example.com/captioned.mp4')
+
+    def tearDown(self):
+        youtube.TIMEDTEXT_URL = self.old_timedtext_url
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _langs(self, *codes):
+        return [{'lang_code': code, 'name': u''} for code in codes]
+
+    def test_import_subtitles(self):
+        youtube.import_subtitles(self._langs('en', 'fr', 'de', 'ru'),
+                                 self.video.pk, 'abc')
+
+        # ru isn't on the stub, so it's skipped.
+        self.assertEqual(
+            sorted(self.video.subtitlelanguage_set.values_list('language',
+                                                               flat=True)),
+            ['de', 'en', 'fr'])
+
+        language = self.video.subtitlelanguage_set.get(language='fr')
+        self.assertTrue(language.has_version and language.is_forked)
+        version = language.subtitleversion_set.get()
+        subtitles = list(version.subtitle_set.all())
+        self.assertEqual([s.subtitle_text for s in subtitles],
+                         ['Un', 'Deux', 'Trois'])
+        self.assertEqual([s.start_time for s in subtitles], [1.0, 2.0, 3.0])
+        self.assertEqual([s.end_time for s in subtitles], [2.0, 3.0, None])
+        self.assertEqual(len(set(s.subtitle_id for s in subtitles)), 3)
+
+        # Importing again adds a new version.
+        youtube.save_subtitles_for_lang(self._langs('fr')[0], self.video.pk,
+                                        'abc')
+        self.assertEqual(language.subtitleversion_set.count(), 2)
+
+    def test_import_subtitles_bad_track(self):
+        save_subtitles = youtube._save_subtitles
+
+        def _save_subtitles(video, language_code, items):
+            if language_code == 'fr':
+                raise ValueError('bad track')
+            save_subtitles(video, language_code, items)
+
+        youtube._save_subtitles = _save_subtitles
+        try:
+            youtube.import_subtitles(self._langs('en', 'fr', 'de'),
+                                     self.video.pk, 'abc')
+        finally:
+            youtube._save_subtitles = save_subtitles
+
+        # The tracks after the bad one are still saved.
+        self.assertEqual(
+            sorted(self.video.subtitlelanguage_set.filter(has_version=True)
+                                                  .values_list('language',
+                                                               flat=True)),
+            ['de', 'en'])
+
+    def test_fetch_tracks(self):
+        langs = self._langs('en', 'fr', 'de', 'es', 'ru', 'en')
+        results = youtube.fetch_tracks('abc', langs, concurrency=2)
+
+        self.assertEqual(len(results), 6)
+        self.assertEqual(results[4], None)
+        self.assertEqual([item['subtitle_text'] for item in results[1]],
+                         ['Un', 'Deux', 'Trois'])
+        self.assertEqual(results[0], results[5])
+
+        # The keep-alive connections are reused, two at most.
+        ports = set(port for port, lang_code in TimedTextStubHandler.requests)
+        self.assertEqual(len(TimedTextStubHandler.requests), 6)
+        self.assertTrue(len(ports) <= 2)
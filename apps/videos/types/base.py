@@ -16,13 +16,24 @@
 # along with this program.  If not, see 
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
+import threading
+from collections import OrderedDict
 from urlparse import urlparse
+
+from django.conf import settings
 from django.core.exceptions import ValidationError
 
 class VideoType(object):
 
     abbreviation = None
     name = None    
+    # Hosts this type's URLs can be on, subdomains included.  None means any
+    # host, for types like HTML5 that go by the file extension.
+    hosts = None
+    # Whether matches_video_url() makes network requests.  If it does, a "no"
+    # may just mean the request failed, so VideoTypeRegistrar won't remember
+    # any answer this type had a say in.
+    matches_over_network = False
     
     def __init__(self, url):
         self.url = url
@@ -59,24 +70,123 @@ class VideoType(object):
         parsed_url = urlparse(url)
         return '%s://%s%s' % (parsed_url.scheme or 'http', parsed_url.netloc, parsed_url.path)    
     
+# How many URL to type lookups VideoTypeRegistrar remembers.
+URL_CACHE_SIZE = getattr(settings, 'VIDEO_TYPE_URL_CACHE_SIZE', 1000)
+
+class LRUCache(object):
+    """A small thread-safe dict that forgets its least recently used keys."""
+    def __init__(self, size):
+        self.size = size
+        self.lock = threading.Lock()
+        self.data = OrderedDict()
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value = self.data.pop(key)
+            except KeyError:
+                return default
+            self.data[key] = value
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.data.pop(key, None)
+            self.data[key] = value
+            if len(self.data) > self.size:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
+
 class VideoTypeRegistrar(dict):
+    """The registered video types, by abbreviation.
+
+    video_type_class_for_url() only tries the types whose hosts cover the
+    URL's host, plus the types with no hosts, and remembers its answers for
+    the last URL_CACHE_SIZE URLs.  Types are still tried in the order
+    video_type_for_url() always tried them, so the first match wins as
+    before.  Answers that depend on a type with matches_over_network saying
+    no aren't remembered.
+
+    """
     
     domains = []
     
     def __init__(self, *args, **kwargs):
         super(VideoTypeRegistrar, self).__init__(*args, **kwargs)
         self.choices = []
+        self.url_cache = LRUCache(URL_CACHE_SIZE)
+        self._reset_index()
         
     def register(self, video_type):
         self[video_type.abbreviation] = video_type
         self.choices.append((video_type.abbreviation, video_type.name))
         domain = getattr(video_type, 'site', None)
         domain and self.domains.append(domain)
-        
-    def video_type_for_url(self, url):
+        self._reset_index()
+
+    def _reset_index(self):
+        # host -> the types registered for it
+        self._by_host = {}
+        # frozenset of host-specific types -> the types to try, in order
+        self._candidates = {}
         for video_type in self.itervalues():
+            for host in video_type.hosts or ():
+                self._by_host.setdefault(host, set()).add(video_type)
+        self.url_cache.clear()
+
+    def _candidates_for_host(self, host):
+        # www.youtube.com is looked up as www.youtube.com, youtube.com and com.
+        parts = host.split('.')
+        matching = set()
+        for i in xrange(len(parts)):
+            matching.update(self._by_host.get('.'.join(parts[i:]), ()))
+        matching = frozenset(matching)
+
+        candidates = self._candidates.get(matching)
+        if candidates is None:
+            candidates = [video_type for video_type in self.itervalues()
+                          if video_type.hosts is None
+                          or video_type in matching]
+            self._candidates[matching] = candidates
+        return candidates
+
+    def _scan(self, url, video_types):
+        for video_type in video_types:
             if video_type.matches_video_url(url):
-                return video_type(url)
+                return video_type
+
+    def video_type_class_for_url(self, url):
+        """Return the VideoType subclass for url, or None."""
+        video_type = self.url_cache.get(url, False)
+        if video_type is not False:
+            return video_type
+
+        host = urlparse(url).hostname
+        if host:
+            candidates = self._candidates_for_host(host)
+        else:
+            candidates = list(self.itervalues())
+        video_type = self._scan(url, candidates)
+
+        if video_type is None:
+            tried = candidates
+        else:
+            tried = candidates[:candidates.index(video_type)]
+        if not any(t.matches_over_network for t in tried):
+            self.url_cache.set(url, video_type)
+
+        return video_type
+        
+    def video_type_for_url(self, url):
+        video_type = self.video_type_class_for_url(url)
+        if video_type:
+            return video_type(url)
             
 class VideoTypeError(Exception):
     pass
@@ -30,6 +30,8 @@ class DailymotionVideoType(VideoType):
     abbreviation = 'D'
     name = 'dailymotion.com'
     site = 'dailymotion.com'
+    hosts = ('dailymotion.com',)
+    matches_over_network = True
 
     def __init__(self, url):
         self.url = url
@@ -18,6 +18,9 @@
 import logging
 import random
 import re
+import threading
+from Queue import LifoQueue, Queue, Empty
+from contextlib import contextmanager
 from datetime import datetime
 from urlparse import urlparse
 
@@ -58,12 +61,44 @@ def get_youtube_service():
 
 yt_service = get_youtube_service()
 
-@task
-def save_subtitles_for_lang(lang, video_pk, youtube_id):
-    from videos.models import Video
+# Fetching many caption tracks
+#
+# The tracks of a video are downloaded by a few threads at once, at most
+# YOUTUBE_CAPTION_IMPORT_CONCURRENCY of them.  Every request goes through an
+# httplib2 client from _http_clients.  httplib2 keeps connections open between
+# requests, so reusing the clients saves a TCP handshake per track.  A client
+# isn't thread-safe, so it's only used by one thread at a time.  The threads
+# only download and parse; the subtitles are saved afterwards, from the task's
+# thread.
+
+TIMEDTEXT_URL = getattr(settings, 'YOUTUBE_TIMEDTEXT_URL',
+                        'http://www.youtube.com/api/timedtext')
+CAPTION_IMPORT_CONCURRENCY = getattr(
+    settings, 'YOUTUBE_CAPTION_IMPORT_CONCURRENCY', 4)
+SUBTITLE_BATCH_SIZE = 100
+
+# Last in, first out, so the clients with the warmest connections get used.
+_http_clients = LifoQueue()
+
+@contextmanager
+def _http_client():
+    try:
+        client = _http_clients.get_nowait()
+    except Empty:
+        client = httplib2.Http()
+    try:
+        yield client
+    finally:
+        _http_clients.put(client)
+
+def _track_url(youtube_id, lang):
+    return u'%s?v=%s&lang=%s&name=%s' % (
+        TIMEDTEXT_URL, youtube_id, lang.get('lang_code'),
+        urlquote(lang.get('name', u'')))
 
-    yt_lc = lang.get('lang_code')
-    lc  = LanguageCode(yt_lc, "youtube").encode("unisubs")
+def _language_code(lang, youtube_id):
+    """Return our code for a track's language, or None if we don't have it."""
+    lc = LanguageCode(lang.get('lang_code'), "youtube").encode("unisubs")
 
     if not lc in SUPPORTED_LANGUAGE_CODES:
         logger.warn("Youtube import did not find language code", extra={
@@ -74,17 +109,12 @@ def save_subtitles_for_lang(lang, video_pk, youtube_id):
         })
         return
 
-    try:
-        video = Video.objects.get(pk=video_pk)
-    except Video.DoesNotExist:
-        return
-
-    from videos.models import SubtitleLanguage, SubtitleVersion, Subtitle
+    return lc
 
-    url = u'http://www.youtube.com/api/timedtext?v=%s&lang=%s&name=%s'
-    url = url % (youtube_id, yt_lc, urlquote(lang.get('name', u'')))
-
-    xml = YoutubeVideoType._get_response_from_youtube(url)
+def _fetch_track(youtube_id, lang):
+    """Download a track and return its subtitles as a list of dicts."""
+    xml = YoutubeVideoType._get_response_from_youtube(
+        _track_url(youtube_id, lang))
 
     if xml is None:
         return
@@ -94,6 +124,47 @@ def save_subtitles_for_lang(lang, video_pk, youtube_id):
     if not parser:
         return
 
+    return list(parser)
+
+def fetch_tracks(youtube_id, langs, concurrency=CAPTION_IMPORT_CONCURRENCY):
+    """Download the given tracks concurrently.
+
+    Returns a list with the subtitles of each track, in the order of langs,
+    or None for the tracks that couldn't be fetched.
+
+    """
+    results = [None] * len(langs)
+
+    queue = Queue()
+    for i, lang in enumerate(langs):
+        queue.put((i, lang))
+
+    def work():
+        while True:
+            try:
+                i, lang = queue.get_nowait()
+            except Empty:
+                return
+
+            try:
+                results[i] = _fetch_track(youtube_id, lang)
+            except Exception:
+                logger.exception("Error fetching youtube subtitles")
+
+    threads = [threading.Thread(target=work)
+               for i in xrange(min(concurrency, len(langs)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return results
+
+def _save_subtitles(video, lc, items):
+    """Add a new forked version of video's lc language with the subtitles."""
+    from videos.models import SubtitleLanguage, SubtitleVersion, Subtitle
+
     language, create = SubtitleLanguage.objects.get_or_create(
         video=video,
         language=lc,
@@ -120,7 +191,8 @@ def save_subtitles_for_lang(lang, video_pk, youtube_id):
     version.is_forked = True
     version.save()
 
-    for i, item in enumerate(parser):
+    subtitles = []
+    for i, item in enumerate(items):
         subtitle = Subtitle()
         subtitle.subtitle_text = item['subtitle_text']
         subtitle.start_time = item['start_time']
@@ -128,8 +200,13 @@ def save_subtitles_for_lang(lang, video_pk, youtube_id):
         subtitle.version = version
         subtitle.subtitle_id = int(random.random()*10e12)
         subtitle.subtitle_order = i+1
-        subtitle.save()
+        subtitle.normalize_times()
         assert subtitle.start_time or subtitle.end_time, item['subtitle_text']
+        subtitles.append(subtitle)
+
+    for i in xrange(0, len(subtitles), SUBTITLE_BATCH_SIZE):
+        Subtitle.objects.bulk_create(subtitles[i:i + SUBTITLE_BATCH_SIZE])
+
     version.finished = True
     version.save()
 
@@ -138,8 +215,43 @@ def save_subtitles_for_lang(lang, video_pk, youtube_id):
     language.is_complete = True
     language.save()
 
+@task
+def import_subtitles(langs, video_pk, youtube_id):
+    """Import the given youtube caption tracks of a video."""
+    from videos.models import Video
     from videos.tasks import video_changed_tasks
-    video_changed_tasks.delay(video.pk)
+
+    try:
+        video = Video.objects.get(pk=video_pk)
+    except Video.DoesNotExist:
+        return
+
+    tracks = [(lang, _language_code(lang, youtube_id)) for lang in langs]
+    tracks = [(lang, lc) for lang, lc in tracks if lc]
+
+    fetched = fetch_tracks(youtube_id, [lang for lang, lc in tracks])
+
+    saved = 0
+    for (lang, lc), items in zip(tracks, fetched):
+        if not items:
+            continue
+
+        # Each track used to be its own task, so one bad track shouldn't stop
+        # the others from being saved.
+        try:
+            _save_subtitles(video, lc, items)
+        except Exception:
+            logger.exception('Error saving youtube subtitles %s for %s'
+                             % (lang, youtube_id))
+            continue
+        saved += 1
+
+    if saved:
+        video_changed_tasks.delay(video.pk)
+
+@task
+def save_subtitles_for_lang(lang, video_pk, youtube_id):
+    import_subtitles([lang], video_pk, youtube_id)
 
 class YoutubeVideoType(VideoType):
 
@@ -153,6 +265,7 @@ class YoutubeVideoType(VideoType):
     abbreviation = 'Y'
     name = 'Youtube'
     site = 'youtube.com'
+    hosts = ('youtube.com', 'youtu.be')
 
     # changing this will cause havock, let's talks about this first
     URL_TEMPLATE = 'http://www.youtube.com/watch?v=%s'
@@ -232,8 +345,8 @@ class YoutubeVideoType(VideoType):
 
     @classmethod
     def _get_response_from_youtube(cls, url):
-        h = httplib2.Http()
-        resp, content = h.request(url, "GET")
+        with _http_client() as h:
+            resp, content = h.request(url, "GET")
 
         if resp.status < 200 or resp.status >= 400:
             logger.error("Youtube subtitles error", extra={
@@ -257,7 +370,7 @@ class YoutubeVideoType(VideoType):
             return
 
     def get_subtitled_languages(self):
-        url = "http://www.youtube.com/api/timedtext?type=list&v=%s" % self.video_id
+        url = "%s?type=list&v=%s" % (TIMEDTEXT_URL, self.video_id)
         xml = self._get_response_from_youtube(url)
 
         if  xml is None:
@@ -276,8 +389,8 @@ class YoutubeVideoType(VideoType):
     def get_subtitles(self, video_obj):
         langs = self.get_subtitled_languages()
 
-        for item in langs:
-            save_subtitles_for_lang.delay(item, video_obj.pk, self.video_id)
+        if langs:
+            import_subtitles.delay(langs, video_obj.pk, self.video_id)
 
     def _get_bridge(self, third_party_account):
 
@@ -706,7 +706,7 @@ def video_staff_delete(request, video_id):
 def video_debug(request, video_id):
     from apps.testhelpers.views import debug_video
     from apps.widget import video_cache as vc
-    from django.core.cache import cache
+    from utils.cache_utils import peek
     from accountlinker.models import youtube_sync
     from videos.models import VIDEO_TYPE_YOUTUBE
 
@@ -714,16 +714,20 @@ def video_debug(request, video_id):
     lang_info = debug_video(video)
     vid = video.video_id
     get_subtitles_dict = {}
+    generation = vc.get_generation(vid)
+    def _versioned(key):
+        return vc._versioned_key(vid, key, generation)
     for l in video.subtitlelanguage_set.all():
-        cache_key = vc._subtitles_dict_key(vid, l.pk, None)
-        get_subtitles_dict[l.language] = cache.get(cache_key)
+        cache_key = _versioned(vc._subtitles_dict_key(vid, l.pk, None))
+        get_subtitles_dict[l.language] = peek(cache_key)
     cache = {
-        "get_video_urls": cache.get(vc._video_urls_key(vid)),
+        "generation": generation,
+        "get_video_urls": peek(_versioned(vc._video_urls_key(vid))),
         "get_subtitles_dict": get_subtitles_dict,
-        "get_video_languages": cache.get(vc._video_languages_key(vid)),
+        "get_video_languages": peek(_versioned(vc._video_languages_key(vid))),
 
-        "get_video_languages_verbose": cache.get(vc._video_languages_verbose_key(vid)),
-        "writelocked_langs": cache.get(vc._video_writelocked_langs_key(vid)),
+        "get_video_languages_verbose": peek(_versioned(vc._video_languages_verbose_key(vid))),
+        "writelocked_langs": peek(vc._video_writelocked_langs_key(vid)),
     }
     tasks = Task.objects.filter(team_video=video)
 
@@ -0,0 +1,127 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2012 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+"""
+Subtitle file downloads.
+
+An Export is one subtitle version rendered by one of the srt_subs handlers.
+Its output is fully determined by:
+
+    - the version and the number of subtitles in it
+    - for dependent translations, the version of the standard language their
+      timing comes from
+    - the title, which some formats include
+    - the handler
+
+so those make up its key.  The key is used for the cache of rendered files,
+and a hash of it is the strong ETag, so a request can be answered with a 304
+before anything is rendered.  A file that isn't cached is streamed as the
+handler produces it, and cached once it has all been sent.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import parse_http_date_safe
+
+
+CACHE_TIMEOUT = getattr(settings, 'SUBTITLE_EXPORT_CACHE_TIMEOUT',
+                        60 * 60 * 24)
+# How long downstream caches can keep a download without revalidating it:
+# a given revision never changes, the latest one of a language might.
+MAX_AGE = getattr(settings, 'SUBTITLE_EXPORT_MAX_AGE', 60 * 60 * 24)
+LATEST_MAX_AGE = getattr(settings, 'SUBTITLE_EXPORT_LATEST_MAX_AGE', 60)
+# memcached won't store values bigger than 1MB.
+MAX_CACHED_SIZE = 1000 * 1000
+# Change this when the output of the handlers changes, to drop cached files.
+FORMAT_VERSION = 1
+
+
+class Export(object):
+    def __init__(self, handler, version, video=None, language=None):
+        self.handler = handler
+        self.version = version
+        self.language = language or version.language
+        self.video = video or self.language.video
+
+        self.standard_version = None
+        if version.is_dependent():
+            self.standard_version = version._get_standard_collection()
+
+        self.title = self.language.get_title_display() or self.video.title
+        self.subtitle_count = version.subtitle_set.count()
+
+        parts = [FORMAT_VERSION, handler.__name__, version.pk,
+                 self.standard_version and self.standard_version.pk,
+                 self.subtitle_count, self.title]
+        self.hash = hashlib.md5(
+            u':'.join(unicode(p) for p in parts).encode('utf-8')).hexdigest()
+
+    @property
+    def cache_key(self):
+        return 'subtitle-export:%s' % self.hash
+
+    @property
+    def etag(self):
+        return '"%s"' % self.hash
+
+    @property
+    def last_modified(self):
+        """Return when the output last changed, as a timestamp."""
+        modified = self.version.datetime_started
+        if self.standard_version:
+            modified = max(modified, self.standard_version.datetime_started)
+        return time.mktime(modified.timetuple())
+
+    def not_modified(self, request):
+        """Return True if the client already has this export."""
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            etags = [etag.strip() for etag in if_none_match.split(',')]
+            return self.etag in etags or '*' in etags
+
+        if_modified_since = parse_http_date_safe(
+            request.META.get('HTTP_IF_MODIFIED_SINCE'))
+        return (if_modified_since is not None and
+                int(self.last_modified) <= if_modified_since)
+
+    def content(self):
+        """Return the file as an iterable of UTF-8 encoded chunks."""
+        cached = cache.get(self.cache_key)
+        if cached is not None:
+            return [cached]
+        return self._render()
+
+    def _render(self):
+        h = self.handler.create(self.version, self.video, self.language)
+
+        parts = []
+        size = 0
+        for chunk in h.chunks():
+            chunk = chunk.encode('utf-8')
+            yield chunk
+
+            if parts is not None:
+                parts.append(chunk)
+                size += len(chunk)
+                if size > MAX_CACHED_SIZE:
+                    parts = None
+
+        # Only reached once the whole file has been sent.
+        if parts is not None:
+            cache.set(self.cache_key, ''.join(parts), CACHE_TIMEOUT)
@@ -95,22 +95,20 @@ class Rpc(BaseRpc):
 
 
     # Widget
-    def _check_visibility_policy_for_widget(self, request, video_id):
+    def _check_visibility_policy_for_widget(self, request, visibility_policy):
         """Return an error if the user cannot see the widget, None otherwise."""
 
-        visibility_policy = video_cache.get_visibility_policies(video_id)
-
         if not visibility_policy.get("is_public", True):
             team = Team.objects.get(id=visibility_policy['team_id'])
 
             if not team.is_member(request.user):
                 return {"error_msg": _("Video embedding disabled by owner")}
 
-    def _get_video_urls_for_widget(self, video_url, video_id):
-        """Return the video URLs, 'cleaned' video id, and error."""
+    def _get_widget_data(self, video_url, video_id, language_codes):
+        """Return the cached widget data, 'cleaned' video id, and error."""
 
         try:
-            video_urls = video_cache.get_video_urls(video_id)
+            data = video_cache.get_widget_data(video_id, language_codes)
         except models.Video.DoesNotExist:
             video_cache.invalidate_video_id(video_url)
 
@@ -119,9 +117,9 @@ class Rpc(BaseRpc):
             except Exception as e:
                 return None, None, {"error_msg": unicode(e)}
 
-            video_urls = video_cache.get_video_urls(video_id)
+            data = video_cache.get_widget_data(video_id, language_codes)
 
-        return video_urls, video_id, None
+        return data, video_id, None
 
     def _find_remote_autoplay_language(self, request):
         language = None
@@ -131,26 +129,139 @@ class Rpc(BaseRpc):
             language = request.user.preferred_language
         return language if language != '' else None
 
-    def _get_subtitles_for_widget(self, request, base_state, video_id, is_remote):
+    def _get_widget_language_code(self, request, base_state, is_remote):
+        """Return the language code we'll need a default language pk for.
+
+        Returns a (needs_pk, language_code) pair, since None is a meaningful
+        language code to pk_for_default_language.
+
+        """
         # keeping both forms valid as backwards compatibility layer
         lang_code = base_state and base_state.get("language_code", base_state.get("language", None))
 
+        if base_state is not None and lang_code is not None:
+            needs_pk = (base_state.get('language_pk', None) is None and
+                        isinstance(lang_code, basestring))
+            return needs_pk, lang_code
+        elif is_remote:
+            return True, self._find_remote_autoplay_language(request)
+        else:
+            return False, None
+
+    def _get_subtitles_for_widget(self, request, base_state, video_id,
+                                  is_remote, language_pks=None,
+                                  generation=None):
+        # keeping both forms valid as backwards compatibility layer
+        lang_code = base_state and base_state.get("language_code", base_state.get("language", None))
+
+        def _pk_for_default_language(language_code):
+            if language_pks is not None and language_code in language_pks:
+                return language_pks[language_code]
+            return video_cache.pk_for_default_language(video_id, language_code)
+
         if base_state is not None and lang_code is not None:
             lang_pk = base_state.get('language_pk', None)
 
             if lang_pk is  None:
-                lang_pk = video_cache.pk_for_default_language(video_id, lang_code)
+                lang_pk = _pk_for_default_language(lang_code)
 
             return self._autoplay_subtitles(request.user, video_id, lang_pk,
-                                            base_state.get('revision', None))
+                                            base_state.get('revision', None),
+                                            generation)
         else:
             if is_remote:
                 autoplay_language = self._find_remote_autoplay_language(request)
-                language_pk = video_cache.pk_for_default_language(video_id, autoplay_language)
+                language_pk = _pk_for_default_language(autoplay_language)
 
                 if autoplay_language is not None:
                     return self._autoplay_subtitles(request.user, video_id,
-                                                    language_pk, None)
+                                                    language_pk, None,
+                                                    generation)
+
+    def _can_use_widget_bootstrap(self, base_state, language_code):
+        """Can show_widget be answered from the shared bootstrap payload?
+
+        That's the case when the subtitles we'd show are just the default
+        version of a known language (or no subtitles at all), which covers
+        most embeds.
+
+        """
+        if language_code is not None and language_code not in LANGUAGES_MAP:
+            # Don't let arbitrary codes from the client fill up the cache.
+            return False
+
+        lang_code = base_state and base_state.get("language_code", base_state.get("language", None))
+
+        if base_state is None or lang_code is None:
+            return True
+
+        return (base_state.get('language_pk', None) is None and
+                base_state.get('revision', None) is None)
+
+    def _make_widget_bootstrap(self, video_id, data, language_code):
+        """Return the parts of show_widget's response shared by every user."""
+        if language_code is not None:
+            subtitles = self._autoplay_subtitles(
+                None, video_id, data['language_pks'][language_code], None,
+                data['generation'])
+        else:
+            subtitles = None
+
+        return {
+            'video_id': video_id,
+            'video_urls': data['video_urls'],
+            'is_moderated': data['is_moderated'],
+            'visibility_policies': data['visibility_policies'],
+            'drop_down_contents': data['video_languages'],
+            'subtitles': subtitles,
+        }
+
+    def _build_widget_bootstrap(self, video_id, language_code):
+        """Compute and cache a widget bootstrap.  Raises Video.DoesNotExist."""
+        language_codes = [language_code] if language_code is not None else []
+        data = video_cache.get_widget_data(video_id, language_codes)
+        bootstrap = self._make_widget_bootstrap(video_id, data, language_code)
+        video_cache.set_widget_bootstrap(video_id, language_code, bootstrap,
+                                         data['generation'])
+        return bootstrap
+
+    def _get_widget_bootstrap(self, request, video_url, video_id, base_state,
+                              is_remote):
+        """Return the bootstrap payload for show_widget and an error.
+
+        Cacheable requests are served from (and fill) the video's bootstrap
+        cache.  Others are computed the same way but with their own subtitles.
+
+        """
+        needs_pk, language_code = self._get_widget_language_code(
+            request, base_state, is_remote)
+        use_bootstrap = self._can_use_widget_bootstrap(base_state,
+                                                       language_code)
+
+        if use_bootstrap:
+            bootstrap = video_cache.get_widget_bootstrap(video_id,
+                                                         language_code)
+            if bootstrap is not None:
+                return bootstrap, None
+
+        language_codes = [language_code] if needs_pk else []
+        data, video_id, error = self._get_widget_data(video_url, video_id,
+                                                      language_codes)
+        if error:
+            return None, error
+
+        if use_bootstrap:
+            bootstrap = self._make_widget_bootstrap(video_id, data,
+                                                    language_code)
+            video_cache.set_widget_bootstrap(video_id, language_code,
+                                             bootstrap, data['generation'])
+        else:
+            bootstrap = self._make_widget_bootstrap(video_id, data, None)
+            bootstrap['subtitles'] = self._get_subtitles_for_widget(
+                request, base_state, video_id, is_remote,
+                data['language_pks'], data['generation'])
+
+        return bootstrap, None
 
     def show_widget(self, request, video_url, is_remote, base_state=None, additional_video_urls=None):
         try:
@@ -162,21 +273,26 @@ class Rpc(BaseRpc):
         if video_id is None:
             return None
 
-        error = self._check_visibility_policy_for_widget(request, video_id)
+        # Everything that doesn't depend on the user comes from one cache read
+        # in the common case.
+        bootstrap, error = self._get_widget_bootstrap(
+            request, video_url, video_id, base_state, is_remote)
 
         if error:
             return error
 
-        video_urls, video_id, error = self._get_video_urls_for_widget(video_url, video_id)
+        error = self._check_visibility_policy_for_widget(
+            request, bootstrap['visibility_policies'])
 
         if error:
             return error
 
+        video_id = bootstrap['video_id']
         resp = {
             'video_id' : video_id,
-            'subtitles': None,
-            'video_urls': video_urls,
-            'is_moderated': video_cache.get_is_moderated(video_id),
+            'subtitles': bootstrap['subtitles'],
+            'video_urls': bootstrap['video_urls'],
+            'is_moderated': bootstrap['is_moderated'],
         }
 
         if additional_video_urls is not None:
@@ -188,10 +304,8 @@ class Rpc(BaseRpc):
         if request.user.is_authenticated():
             resp['username'] = request.user.username
 
-        resp['drop_down_contents'] = video_cache.get_video_languages(video_id)
+        resp['drop_down_contents'] = bootstrap['drop_down_contents']
         resp['my_languages'] = get_user_languages_from_request(request)
-        resp['subtitles'] = self._get_subtitles_for_widget(request, base_state,
-                                                           video_id, is_remote)
         return resp
 
 
@@ -1144,10 +1258,12 @@ class Rpc(BaseRpc):
                 writelock_session_key='')
             sl.save()
 
-    def _autoplay_subtitles(self, user, video_id, language_pk, version_no):
+    def _autoplay_subtitles(self, user, video_id, language_pk, version_no,
+                            generation=None):
         cache =  video_cache.get_subtitles_dict(
             video_id, language_pk, version_no,
-            lambda version: self._subtitles_dict(version))
+            lambda version: self._subtitles_dict(version),
+            generation=generation)
         if cache and cache.get("language", None) is not None:
             cache['language_code'] = cache['language'].language
             cache['language_pk'] = cache['language'].pk
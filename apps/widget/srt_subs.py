@@ -86,6 +86,22 @@ def write_padded_num(num, numchars, output):
 from math import floor
 import codecs
 
+# How many lines the handlers put in each chunk they stream.
+CHUNK_LINES = 200
+
+def chunked_join(delimiter, lines, size=CHUNK_LINES):
+    """Like delimiter.join(lines), as a generator of pieces of size lines."""
+    buf = []
+    first = True
+    for line in lines:
+        buf.append(line)
+        if len(buf) >= size:
+            yield (u'' if first else delimiter) + delimiter.join(buf)
+            first = False
+            buf = []
+    if buf:
+        yield (u'' if first else delimiter) + delimiter.join(buf)
+
 class BaseSubtitles(object):
     file_type = ''
 
@@ -106,6 +122,10 @@ class BaseSubtitles(object):
     def __unicode__(self):
         raise Exception('Should return subtitles')
 
+    def chunks(self):
+        """Yield the formatted subtitles in pieces that add up to unicode(self)."""
+        yield unicode(self)
+
     @classmethod
     def isnumber(cls, val):
         return isinstance(val, (int, long, float))
@@ -129,6 +149,18 @@ class GenerateSubtitlesHandlerClass(dict):
 
 GenerateSubtitlesHandler = GenerateSubtitlesHandlerClass()
 
+class LineSubtitles(BaseSubtitles):
+    """Formats that are a list of lines joined by line_delimiter."""
+
+    def lines(self):
+        raise Exception('Should yield lines')
+
+    def __unicode__(self):
+        return self.line_delimiter.join(self.lines())
+
+    def chunks(self):
+        return chunked_join(self.line_delimiter, self.lines())
+
 class MGSubtitles(BaseSubtitles):
 
     def __unicode__(self):
@@ -142,29 +174,25 @@ class MGSubtitles(BaseSubtitles):
 
 GenerateSubtitlesHandler.register(MGSubtitles)
 
-class SRTSubtitles(BaseSubtitles):
+class SRTSubtitles(LineSubtitles):
     file_type = 'srt'
 
     def __init__(self, subtitles, video, line_delimiter=u'\r\n', sl=None):
         super(SRTSubtitles, self).__init__(subtitles, video, line_delimiter)
 
-    def __unicode__(self):
-        output = []
-
+    def lines(self):
         parser = HTMLParser()
         i = 1
         for item in self.subtitles:
             if self.isnumber(item['start']) and self.isnumber(item['end']):
-                output.append(unicode(i))
+                yield unicode(i)
                 start = self.format_time(item['start'])
                 end = self.format_time(item['end'])
-                output.append(u'%s --> %s' % (start, end))
-                output.append(parser.unescape(item['text']).strip())
-                output.append(u'')
+                yield u'%s --> %s' % (start, end)
+                yield parser.unescape(item['text']).strip()
+                yield u''
                 i += 1
 
-        return self.line_delimiter.join(output)
-
     def format_time(self, time):
         hours = int(floor(time / 3600))
         if hours < 0:
@@ -176,24 +204,20 @@ class SRTSubtitles(BaseSubtitles):
 
 GenerateSubtitlesHandler.register(SRTSubtitles)
 
-class SBVSubtitles(BaseSubtitles):
+class SBVSubtitles(LineSubtitles):
     file_type = 'sbv'
 
     def __init__(self, subtitles, video, line_delimiter=u'\r\n', sl=None):
         super(SBVSubtitles, self).__init__(subtitles, video, line_delimiter)
 
-    def __unicode__(self):
-        output = []
-
+    def lines(self):
         for item in self.subtitles:
             if self.isnumber(item['start']) and self.isnumber(item['end']):
                 start = self.format_time(item['start'])
                 end = self.format_time(item['end'])
-                output.append(u'%s,%s' % (start, end))
-                output.append(item['text'].strip())
-                output.append(u'')
-
-        return self.line_delimiter.join(output)
+                yield u'%s,%s' % (start, end)
+                yield item['text'].strip()
+                yield u''
 
     def format_time(self, time):
         hours = int(floor(time / 3600))
@@ -206,18 +230,16 @@ class SBVSubtitles(BaseSubtitles):
 
 GenerateSubtitlesHandler.register(SBVSubtitles)
 
-class TXTSubtitles(BaseSubtitles):
+class TXTSubtitles(LineSubtitles):
     file_type = 'txt'
 
     def __init__(self, subtitles, video, line_delimiter=u'\r\n\r\n', sl=None):
         super(TXTSubtitles, self).__init__(subtitles, video, line_delimiter)
 
-    def __unicode__(self):
-        output = []
+    def lines(self):
         for item in self.subtitles:
-            item['text'] and output.append(item['text'].strip())
-
-        return self.line_delimiter.join(output)
+            if item['text']:
+                yield item['text'].strip()
 
 GenerateSubtitlesHandler.register(TXTSubtitles)
 
@@ -225,8 +247,14 @@ class SSASubtitles(BaseSubtitles):
     file_type = 'ssa'
 
     def __unicode__(self):
+        return u''.join(self.chunks())
+
+    def chunks(self):
         #add BOM to fix python default behaviour, because players don't play without it
-        return u''.join([unicode(codecs.BOM_UTF8, "utf8"), self._start(), self._content(), self._end()])
+        yield u''.join([unicode(codecs.BOM_UTF8, "utf8"), self._start()])
+        for chunk in chunked_join(u'', self._content_lines()):
+            yield chunk
+        yield self._end()
 
     def _start(self):
         ld = self.line_delimiter
@@ -248,18 +276,19 @@ class SSASubtitles(BaseSubtitles):
         return text.replace('\n', ' ')
 
     def _content(self):
+        return u''.join(self._content_lines())
+
+    def _content_lines(self):
         dl = self.line_delimiter
-        output = []
-        output.append(u'[Events]%s' % dl)
-        output.append(u'Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text%s' % dl)
+        yield u'[Events]%s' % dl
+        yield u'Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text%s' % dl
         tpl = u'Dialogue: 0,%s,%s,Default,,0000,0000,0000,,%s%s'
         for item in self.subtitles:
             if self.isnumber(item['start']) and self.isnumber(item['end']):
                 start = self.format_time(item['start'])
                 end = self.format_time(item['end'])
                 text = self._clean_text(item['text'].strip())
-                output.append(tpl % (start, end, text, dl))
-        return ''.join(output)
+                yield tpl % (start, end, text, dl)
 
 GenerateSubtitlesHandler.register(SSASubtitles)
 
@@ -0,0 +1,33 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2012 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+from celery.task import task
+
+
+@task()
+def rebuild_widget_bootstraps(video_id, language_codes):
+    """Rebuild the cached show_widget bootstraps for a video."""
+    from videos.models import Video
+    from widget.rpc import Rpc
+
+    rpc = Rpc()
+    for language_code in language_codes:
+        try:
+            rpc._build_widget_bootstrap(video_id, language_code)
+        except Video.DoesNotExist:
+            # The video is gone, there's nothing left to show.
+            return
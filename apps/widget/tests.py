@@ -1152,6 +1152,110 @@ class TestCache(TestCase):
         video_id = video_cache.get_video_id(url)
         video_cache.get_subtitles_dict(video_id, 0, 0, lambda x: x)
 
+    def test_generation_invalidation(self):
+        url = "http://videos-cdn.mozilla.net/serv/mozhacks/demos/screencasts/londonproject/screencast.ogv"
+        video, create = Video.get_or_create_for_url(url)
+        video_id = video.video_id
+
+        self.assertEqual(video_cache.get_video_urls(video_id),
+                         [vu.effective_url for vu in video.videourl_set.all()])
+
+        # Cached values survive until the generation is bumped.
+        generation = video_cache.get_generation(video_id)
+        key = video_cache._versioned_key(
+            video_id, video_cache._video_urls_key(video_id), generation)
+        video_cache.cache_utils.store(key, ['cached'], video_cache.TIMEOUT)
+        self.assertEqual(video_cache.get_video_urls(video_id), ['cached'])
+
+        video_cache.invalidate_cache(video_id)
+        self.assertNotEqual(video_cache.get_generation(video_id), generation)
+        self.assertNotEqual(video_cache.get_video_urls(video_id), ['cached'])
+
+    def test_get_widget_data(self):
+        url = "http://videos-cdn.mozilla.net/serv/mozhacks/demos/screencasts/londonproject/screencast.ogv"
+        video, create = Video.get_or_create_for_url(url)
+        video_id = video.video_id
+
+        for i in range(2):
+            # The first pass fills the cache, the second reads it back.
+            data = video_cache.get_widget_data(video_id, ['en'])
+            self.assertEqual(data['video_urls'],
+                             video_cache.get_video_urls(video_id))
+            self.assertEqual(data['is_moderated'],
+                             video_cache.get_is_moderated(video_id))
+            self.assertEqual(data['visibility_policies'],
+                             video_cache.get_visibility_policies(video_id))
+            self.assertEqual(data['video_languages'],
+                             video_cache.get_video_languages(video_id))
+            self.assertEqual(data['language_pks'],
+                             {'en': video_cache.pk_for_default_language(
+                                 video_id, 'en')})
+
+        self.assertRaises(models.Video.DoesNotExist,
+                          lambda: video_cache.get_widget_data('bad key'))
+
+    def test_widget_bootstrap(self):
+        url = "http://videos-cdn.mozilla.net/serv/mozhacks/demos/screencasts/londonproject/screencast.ogv"
+        video, create = Video.get_or_create_for_url(url)
+        video_id = video.video_id
+        request = RequestMockup(NotAuthenticatedUser())
+
+        self.assertEqual(video_cache.get_widget_bootstrap(video_id, 'en'),
+                         None)
+
+        response = rpc.show_widget(request, url, False,
+                                   base_state={'language': 'en'})
+        bootstrap = video_cache.get_widget_bootstrap(video_id, 'en')
+        self.assertEqual(bootstrap['video_id'], response['video_id'])
+        self.assertEqual(bootstrap['video_urls'], response['video_urls'])
+        self.assertFalse('username' in bootstrap)
+
+        # A warm bootstrap is a single cache read.
+        reads = []
+        def _counted(name):
+            method = getattr(video_cache.cache, name)
+            def _read(*args, **kwargs):
+                reads.append(name)
+                return method(*args, **kwargs)
+            return _read
+
+        cache = video_cache.cache
+        video_cache.cache = type('CountingCache', (object,), {
+            'get': staticmethod(_counted('get')),
+            'get_many': staticmethod(_counted('get_many')),
+        })()
+        try:
+            self.assertEqual(video_cache.get_widget_bootstrap(video_id, 'en'),
+                             bootstrap)
+        finally:
+            video_cache.cache = cache
+        self.assertEqual(reads, ['get_many'])
+
+        # Requests for a specific revision aren't cached.
+        rpc.show_widget(request, url, False,
+                        base_state={'language': 'fr', 'revision': 1})
+        self.assertEqual(video_cache.get_widget_bootstrap(video_id, 'fr'),
+                         None)
+
+        # Invalidating rebuilds the bootstraps we had (celery is eager here).
+        generation = video_cache.get_generation(video_id)
+        video_cache.set_widget_bootstrap(
+            video_id, 'en', dict(bootstrap, video_urls=['stale']), generation)
+        video_cache.invalidate_cache(video_id)
+        self.assertEqual(
+            video_cache.get_widget_bootstrap(video_id, 'en')['video_urls'],
+            bootstrap['video_urls'])
+
+        # A payload built from data read before an invalidation is never
+        # served, even if it's written afterwards.
+        video_cache.cache.delete(
+            video_cache._widget_bootstrap_languages_key(video_id))
+        video_cache.invalidate_cache(video_id)
+        video_cache.set_widget_bootstrap(
+            video_id, 'en', dict(bootstrap, video_urls=['stale']), generation)
+        self.assertEqual(video_cache.get_widget_bootstrap(video_id, 'en'),
+                         None)
+
 from widget.srt_subs import TTMLSubtitles, SRTSubtitles, SBVSubtitles, TXTSubtitles, SSASubtitles
 
 class TestSubtitlesGenerator(TestCase):
@@ -1204,6 +1308,57 @@ class TestSubtitlesGenerator(TestCase):
         self.assertTrue(unicode(SBVSubtitles(subtitles, self.video)))
         self.assertTrue(unicode(TXTSubtitles(subtitles, self.video)))
 
+    def test_chunks(self):
+        for handler in (SRTSubtitles, SSASubtitles, SBVSubtitles, TXTSubtitles):
+            h = handler(self.subtitles * 150, self.video)
+            self.assertEqual(u''.join(h.chunks()), unicode(h))
+
+
+class TestDownloadSubtitles(TestCase):
+    fixtures = ['test_widget.json']
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.user_0 = CustomUser.objects.get(pk=3)
+        session = create_two_sub_session(RequestMockup(self.user_0))
+        self.video = session.video
+        self.url = reverse('widget:download_srt')
+        self.params = {
+            'video_id': self.video.video_id,
+            'lang_pk': self.video.subtitle_language('en').pk,
+        }
+
+    def test_etag(self):
+        response = self.client.get(self.url, self.params)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('hey!', response.content)
+        self.assertTrue(response['ETag'])
+        self.assertTrue(response['Last-Modified'])
+
+        response = self.client.get(self.url, self.params,
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, '')
+
+        response = self.client.get(self.url, self.params,
+                                   HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_cached(self):
+        from django.core.cache import cache
+        from widget.exports import Export
+
+        language = self.video.subtitle_language('en')
+        export = Export(SRTSubtitles, language.version(public_only=False),
+                        self.video, language)
+        self.assertEqual(cache.get(export.cache_key), None)
+
+        content = self.client.get(self.url, self.params).content
+        self.assertEqual(cache.get(export.cache_key), content)
+        self.assertEqual(self.client.get(self.url, self.params).content,
+                         content)
+
 
 class TestCaching(TestCase):
     fixtures = ['test_widget.json']
@@ -15,29 +15,142 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see
 # http://www.gnu.org/licenses/agpl-3.0.html.
+"""Caching for the data the widget needs about videos.
+
+Almost every key here belongs to a single video, and embeds that video's
+"generation": a counter stored under its own key.  Invalidating everything we
+have cached for a video is then a single incr of the counter -- the old keys
+simply stop being read and fall out of the cache on their own.
+
+The exceptions are the keys that map video URLs to video ids (we don't know the
+video before reading them), the completed languages of a team video (read by
+team video id) and the writelocked languages, which are managed separately.
+
+Widget bootstraps are the part of show_widget's response that's the same for
+every user, precomputed per (video, default language) so that an anonymous
+embed needs one cache read (a get_many of the generation and the payload) once
+it knows the video id.  Each payload is stored with the generation its data
+was read under and is only served while that's still the current generation,
+so a payload built from stale data is never readable after an invalidation.
+We also remember which languages have a payload for each video so they can be
+rebuilt in the background when the video is invalidated.  That list is only a
+hint: a language missing from it is rebuilt on its next request instead.
+
+Values are read and written through utils.cache_utils, so a popular key that
+expires or gets invalidated is only recomputed by one process at a time.
+
+"""
+
 import datetime
+import time
 
-from django.conf import settings
 from django.core.cache import cache
 from django.utils.hashcompat import sha_constructor
 
+from utils import cache_utils
 from videos.types import video_type_registrar
 from videos.types.base import VideoTypeError
 
 
 TIMEOUT = 60 * 60 * 24 * 5 # 5 days
 
+# Name for our metrics in utils.cache_utils.
+METRIC_NAME = 'widget-video-cache'
+
+# The generation counter needs to outlive the keys that embed it.
+GENERATION_TIMEOUT = TIMEOUT * 2
+
+# Bootstraps are only as fresh as their last rebuild, so let them expire
+# sooner than everything else in case one gets built from stale data.
+BOOTSTRAP_TIMEOUT = 60 * 60
+
+
+# Generations
+def _new_generation():
+    # If a generation key is evicted we need to make sure the new counter can't
+    # land on a value some old keys are still using, so start from the clock
+    # rather than from zero.
+    return int(time.time() * 1000)
+
+def get_generation(video_id):
+    """Return the current cache generation for the given video."""
+    cache_key = _video_generation_key(video_id)
+    generation = cache.get(cache_key)
+
+    if generation is None:
+        generation = _new_generation()
+
+        if not cache.add(cache_key, generation, GENERATION_TIMEOUT):
+            # Someone else beat us to it, use theirs.
+            generation = cache.get(cache_key) or generation
+
+    return generation
+
+def _bump_generation(video_id):
+    try:
+        cache.incr(_video_generation_key(video_id))
+    except ValueError:
+        # There's no generation, so nothing is cached under one either.
+        pass
+
+def _versioned_key(video_id, cache_key, generation=None):
+    if generation is None:
+        generation = get_generation(video_id)
+    return '{0}_g{1}'.format(cache_key, generation)
+
+def _get_cached(video_id, cache_key, compute, generation=None):
+    """Return the cached value for a per-video key, computing it on a miss.
+
+    `compute` should return the value to store.  It must not return None, since
+    that's indistinguishable from a miss.
+
+    """
+    return cache_utils.get_or_compute(
+        _versioned_key(video_id, cache_key, generation), compute, TIMEOUT,
+        METRIC_NAME)
+
+def get_many(video_id, getters, generation=None):
+    """Fetch several per-video values at once.
+
+    `getters` should be a dictionary mapping names to (cache_key, compute)
+    pairs, like the arguments to _get_cached.  Returns a dictionary mapping the
+    same names to their values.
+
+    When everything is cached this costs two cache round trips: one for the
+    generation and one get_many.  Any misses are computed and written back with
+    a single set_many.
+
+    """
+    if generation is None:
+        generation = get_generation(video_id)
+
+    keys = dict((name, _versioned_key(video_id, cache_key, generation))
+                for name, (cache_key, _) in getters.items())
+    found = cache_utils.get_many_or_compute(
+        dict((keys[name], compute)
+             for name, (_, compute) in getters.items()),
+        TIMEOUT, METRIC_NAME)
+
+    return dict((name, found[cache_key]) for name, cache_key in keys.items())
+
+def set_many(video_id, values):
+    """Store several per-video values at once.
+
+    `values` should map (unversioned) cache keys to values.
+
+    """
+    generation = get_generation(video_id)
+    cache_utils.store_many(dict((_versioned_key(video_id, k, generation), v)
+                                for k, v in values.items()),
+                           TIMEOUT)
+
 
 def get_video_id(video_url, public_only=False, referer=None):
     """
     Returns the cache video_id for this video
     If public only is
     """
-    cache_key = _video_id_key(video_url)
-    value = cache.get(cache_key)
-    if bool(value):
-        return value
-    else:
+    def _compute():
         from videos.models import Video
         try:
             video, create = Video.get_or_create_for_url(video_url)
@@ -47,10 +160,10 @@ def get_video_id(video_url, public_only=False, referer=None):
         if not video:
             return None
 
-        video_id = video.video_id
+        return video.video_id
 
-        cache.set(cache_key, video_id, TIMEOUT)
-        return video_id
+    return cache_utils.get_or_compute(_video_id_key(video_url), _compute,
+                                      TIMEOUT, METRIC_NAME)
 
 def associate_extra_url(video_url, video_id):
     cache_key = _video_id_key(video_url)
@@ -64,58 +177,54 @@ def associate_extra_url(video_url, video_id):
                 'video': Video.objects.get(video_id=video_id),
                 'type': vt.abbreviation,
                 'videoid': video_id })
-        cache.set(cache_key, video_url.videoid, TIMEOUT)
+        cache_utils.store(cache_key, video_url.videoid, TIMEOUT)
 
 
 # Invalidation
 def invalidate_cache(video_id):
-    cache.delete(_video_urls_key(video_id))
+    """Invalidate everything cached for the given video.
 
-    try:
-        from apps.videos.models import Video
-        video = Video.objects.get(video_id=video_id)
-        for l in video.subtitlelanguage_set.all():
-            cache.delete(_subtitles_dict_key(video_id, l.pk))
-    except Video.DoesNotExist:
-        pass
+    Per-video keys are dropped by bumping the video's generation.  The URL and
+    team video keys are deleted with a single delete_many.
 
-    for language in settings.ALL_LANGUAGES:
-        cache.delete(_subtitle_language_pk_key(video_id, language[0]))
+    """
+    _bump_generation(video_id)
 
-    cache.delete(_subtitle_language_pk_key(video_id, None))
-    cache.delete(_subtitles_dict_key(video_id, None))
-    cache.delete(_subtitles_count_key(video_id))
-    cache.delete(_video_languages_key(video_id))
-    cache.delete(_video_languages_verbose_key(video_id))
-    cache.delete(_video_is_moderated_key(video_id))
-    cache.delete(_video_visibility_policy_key(video_id))
+    from videos.models import VideoUrl
+    from teams.models import TeamVideo
 
-    from videos.models import Video
-    try:
-        video = Video.objects.get(video_id=video_id)
-        for url in video.videourl_set.all():
-            cache.delete(_video_id_key(url.url))
+    urls = VideoUrl.objects.filter(video__video_id=video_id).values_list(
+        'url', flat=True)
+    team_video_ids = TeamVideo.objects.filter(
+        video__video_id=video_id).values_list('id', flat=True)
 
-        team_video = video.get_team_video()
+    keys = ([_video_id_key(url) for url in urls] +
+            [_video_completed_languages(pk) for pk in team_video_ids])
+    if keys:
+        cache.delete_many(keys)
 
-        if team_video:
-            cache.delete(_video_completed_languages(team_video.id))
-    except Video.DoesNotExist:
-        pass
+    _rebuild_widget_bootstraps(video_id)
 
 def invalidate_video_id(video_url):
     cache.delete(_video_id_key(video_url))
 
+# The bootstraps embed the moderation and visibility data, so changing either
+# has to invalidate them too, which means bumping the generation.
 def invalidate_video_moderation(video_id):
-    cache.delete(_video_is_moderated_key(video_id))
+    _bump_generation(video_id)
+    _rebuild_widget_bootstraps(video_id)
 
 def invalidate_video_visibility(video_id):
-    cache.delete(_video_visibility_policy_key(video_id))
+    _bump_generation(video_id)
+    _rebuild_widget_bootstraps(video_id)
 
 def on_video_url_save(sender, instance, **kwargs):
     if instance.video_id:
         invalidate_cache(instance.video.video_id)
 
+def _video_generation_key(video_id):
+    return 'widget_video_generation_{0}'.format(video_id)
+
 def _video_id_key(video_url):
     return 'video_id_{0}'.format(sha_constructor(video_url).hexdigest())
 
@@ -149,39 +258,37 @@ def _video_is_moderated_key(video_id):
 def _video_visibility_policy_key(video_id):
     return 'widget_video_vis_key_{0}'.format(video_id)
 
+def _widget_bootstrap_key(video_id, language_code):
+    return 'widget_bootstrap_{0}_{1}'.format(video_id, language_code)
+
+def _widget_bootstrap_languages_key(video_id):
+    return 'widget_bootstrap_languages_{0}'.format(video_id)
+
+
+def _compute_pk_for_default_language(video_id, language_code):
+    from videos.models import Video
+    sl = Video.objects.get(video_id=video_id).subtitle_language(language_code)
+    return 'none' if sl is None else sl.pk
 
 def pk_for_default_language(video_id, language_code):
-    cache_key = _subtitle_language_pk_key(video_id, language_code)
-    value = cache.get(cache_key)
-    if value is not None:
-        return None if value == 'none' else value
-    else:
-        from videos.models import Video
-        sl = Video.objects.get(video_id=video_id).subtitle_language(
-            language_code)
-        pk = 'none' if sl is None else sl.pk
-        cache.set(cache_key, pk, TIMEOUT)
-        return None if sl is None else sl.pk
+    value = _get_cached(
+        video_id, _subtitle_language_pk_key(video_id, language_code),
+        lambda: _compute_pk_for_default_language(video_id, language_code))
+    return None if value == 'none' else value
+
+def _compute_video_urls(video_id):
+    from videos.models import Video
+    return [vu.effective_url for vu
+            in Video.objects.get(video_id=video_id).videourl_set.all()]
 
 def get_video_urls(video_id):
-    cache_key = _video_urls_key(video_id)
-    value = cache.get(cache_key)
-    if value is not None:
-        return value
-    else:
-        from videos.models import Video
-        video_urls = [vu.effective_url for vu
-                 in Video.objects.get(video_id=video_id).videourl_set.all()]
-        cache.set(cache_key, video_urls, TIMEOUT)
-        return video_urls
+    return _get_cached(video_id, _video_urls_key(video_id),
+                       lambda: _compute_video_urls(video_id))
 
 def get_subtitles_dict(
-    video_id, language_pk, version_no, subtitles_dict_fn, is_remote=False):
-    cache_key = _subtitles_dict_key(video_id, language_pk, version_no)
-    value = cache.get(cache_key)
-    if value is not None:
-        cached_value = value
-    else:
+    video_id, language_pk, version_no, subtitles_dict_fn, is_remote=False,
+    generation=None):
+    def _compute():
         from videos.models import Video, SubtitleLanguage
         video = Video.objects.get(video_id=video_id)
         if language_pk is None:
@@ -195,143 +302,232 @@ def get_subtitles_dict(
         video.update_subtitles_fetched(language)
         version = video.version(version_no, language, public_only=not is_remote)
         if version:
-            cached_value = subtitles_dict_fn(version)
+            return subtitles_dict_fn(version)
         else:
-            cached_value = 0
-        cache.set(cache_key, cached_value, TIMEOUT)
+            return 0
+
+    cached_value = _get_cached(
+        video_id, _subtitles_dict_key(video_id, language_pk, version_no),
+        _compute, generation)
     return None if cached_value == 0 else cached_value
 
-def get_video_languages(video_id):
+def _compute_video_languages(video_id):
     from apps.widget.rpc import language_summary
-    cache_key = _video_languages_key(video_id)
-    value = cache.get(cache_key)
-    if value is not None:
-        return value
-    else:
-        from videos.models import Video
-        video = Video.objects.get(video_id=video_id)
-        languages = video.subtitlelanguage_set.filter(has_version=True)
+    from videos.models import Video
+    video = Video.objects.get(video_id=video_id)
+    languages = video.subtitlelanguage_set.filter(has_version=True)
 
-        team_video = video.get_team_video()
-        if team_video:
-            languages = languages.filter(language__in=team_video.team.get_readable_langs())
+    team_video = video.get_team_video()
+    if team_video:
+        languages = languages.filter(language__in=team_video.team.get_readable_langs())
 
-        return_value = [language_summary(l) for l in languages]
-        cache.set(cache_key, return_value, TIMEOUT)
-        return return_value
+    return [language_summary(l) for l in languages]
 
-def get_video_completed_languages(team_video_id):
-    cache_key = _video_completed_languages(team_video_id)
-    languages = cache.get(cache_key)
+def get_video_languages(video_id):
+    return _get_cached(video_id, _video_languages_key(video_id),
+                       lambda: _compute_video_languages(video_id))
 
-    if not languages:
+def get_video_completed_languages(team_video_id):
+    def _compute():
         from videos.models import SubtitleLanguage
-        languages = [(sl.language, sl.language_display()) for sl in list(SubtitleLanguage.objects.filter(video__teamvideo__id=team_video_id).all())]
+        return [(sl.language, sl.language_display()) for sl in list(SubtitleLanguage.objects.filter(video__teamvideo__id=team_video_id).all())]
 
-        cache.set(cache_key, languages, TIMEOUT)
+    return cache_utils.get_or_compute(
+        _video_completed_languages(team_video_id), _compute, TIMEOUT,
+        METRIC_NAME)
 
-    return languages
+def _compute_video_languages_verbose(video_id, max_items):
+    from videos.models import Video
+    video = Video.objects.get(video_id=video_id)
+    languages_with_version_total = video.subtitlelanguage_set.filter(has_version=True).order_by('-percent_done')
+    total_number = languages_with_version_total.count()
+    languages_with_version = languages_with_version_total[:max_items]
+    data = { "items":[]}
+    if total_number > max_items:
+        data["total"] = total_number - max_items
+    for lang in languages_with_version:
+        # show only with some translation
+        if lang.is_dependent():
+            data["items"].append({
+                'language': lang.language,
+                'percent_done': lang.percent_done ,
+                'language_url': lang.get_absolute_url(),
+                'is_dependent': True,
+            })
+        else:
+            # append to the beggininig of the list as
+            # the UI will show this first
+            data["items"].insert(0, {
+                'language': lang.language,
+                'is_complete': lang.is_complete,
+                'language_url': lang.get_absolute_url(),
+            })
+    return data
 
 def get_video_languages_verbose(video_id, max_items=6):
     # FIXME: we should probably merge a better method with get_video_languages
     # maybe accepting a 'verbose' param?
-    cache_key = _video_languages_verbose_key(video_id)
-    value = cache.get(cache_key)
-    if value is not None:
-        return value
-    else:
-        from videos.models import Video
-        video = Video.objects.get(video_id=video_id)
-        languages_with_version_total = video.subtitlelanguage_set.filter(has_version=True).order_by('-percent_done')
-        total_number = languages_with_version_total.count()
-        languages_with_version = languages_with_version_total[:max_items]
-        data = { "items":[]}
-        if total_number > max_items:
-            data["total"] = total_number - max_items
-        for lang in languages_with_version:
-            # show only with some translation
-            if lang.is_dependent():
-                data["items"].append({
-                    'language': lang.language,
-                    'percent_done': lang.percent_done ,
-                    'language_url': lang.get_absolute_url(),
-                    'is_dependent': True,
-                })
-            else:
-                # append to the beggininig of the list as
-                # the UI will show this first
-                data["items"].insert(0, {
-                    'language': lang.language,
-                    'is_complete': lang.is_complete,
-                    'language_url': lang.get_absolute_url(),
-                })
-        cache.set(cache_key, data, TIMEOUT)
-        return data
+    return _get_cached(
+        video_id, _video_languages_verbose_key(video_id),
+        lambda: _compute_video_languages_verbose(video_id, max_items))
+
+def _compute_is_moderated(video_id):
+    from videos.models import Video
+    return Video.objects.get(video_id=video_id).is_moderated
 
 def get_is_moderated(video_id):
-    cache_key = _video_is_moderated_key(video_id)
-    value = cache.get(cache_key)
-    if value is None:
-        from videos.models import Video
-        video = Video.objects.get(video_id=video_id)
-        value = video.is_moderated
-        cache.set(cache_key, value, TIMEOUT)
-    return value
+    return _get_cached(video_id, _video_is_moderated_key(video_id),
+                       lambda: _compute_is_moderated(video_id))
+
+def _compute_visibility_policies(video_id):
+    """Compute the visibility policies.  Raises Video.DoesNotExist."""
+    from videos.models import Video
+
+    video = Video.objects.get(video_id=video_id)
+    team_video = video.get_team_video()
+
+    if team_video:
+        team = team_video.team
+        is_public = team.is_visible
+        team_id = team.id
+    else:
+        is_public = True
+        team_id = None
+
+    return {
+        "is_public": is_public,
+        "team_id": team_id
+    }
 
 def get_visibility_policies(video_id):
-    cache_key = _video_visibility_policy_key(video_id)
-    value = cache.get(cache_key)
+    from videos.models import Video
 
-    if value is  None:
-        from videos.models import Video
+    try:
+        return _get_cached(video_id, _video_visibility_policy_key(video_id),
+                           lambda: _compute_visibility_policies(video_id))
+    except Video.DoesNotExist:
+        return {}
 
-        try:
-            video = Video.objects.get(video_id=video_id)
-        except Video.DoesNotExist:
-            return {}
+def get_widget_data(video_id, language_codes=()):
+    """Return everything show_widget reads from the cache for a video at once.
 
-        team_video = video.get_team_video()
+    Returns a dictionary with 'video_urls', 'is_moderated',
+    'visibility_policies' and 'video_languages' keys, plus a 'language_pks'
+    dictionary mapping each of the given language codes to the pk that
+    pk_for_default_language would return for it, and the 'generation' the
+    values were read under.
 
-        if team_video:
-            team = team_video.team
-            is_public = team.is_visible
-            team_id = team.id
+    On a warm cache this is two round trips, compared to one or two per value
+    when using the individual getters.  Raises Video.DoesNotExist if the video
+    is gone.
+
+    """
+    getters = {
+        'video_urls': (_video_urls_key(video_id),
+                       lambda: _compute_video_urls(video_id)),
+        'is_moderated': (_video_is_moderated_key(video_id),
+                         lambda: _compute_is_moderated(video_id)),
+        'visibility_policies': (_video_visibility_policy_key(video_id),
+                                lambda: _compute_visibility_policies(video_id)),
+        'video_languages': (_video_languages_key(video_id),
+                            lambda: _compute_video_languages(video_id)),
+    }
+
+    def _pk_getter(language_code):
+        return (_subtitle_language_pk_key(video_id, language_code),
+                lambda: _compute_pk_for_default_language(video_id,
+                                                         language_code))
+
+    for language_code in language_codes:
+        getters[('language_pk', language_code)] = _pk_getter(language_code)
+
+    generation = get_generation(video_id)
+    values = get_many(video_id, getters, generation)
+
+    data = {'language_pks': {}, 'generation': generation}
+    for name, value in values.items():
+        if isinstance(name, tuple):
+            data['language_pks'][name[1]] = None if value == 'none' else value
         else:
-            is_public = True
-            team_id = None
+            data[name] = value
+
+    return data
+
 
-        value = {
-            "is_public": is_public,
-            "team_id": team_id
-        }
+# Widget bootstraps
+def get_widget_bootstrap(video_id, language_code):
+    """Return the cached widget bootstrap payload, or None on a miss.
+
+    The payload and the video's generation are read in one get_many.  A payload
+    built under any other generation counts as a miss.
+
+    """
+    generation_key = _video_generation_key(video_id)
+    bootstrap_key = _widget_bootstrap_key(video_id, language_code)
+    values = cache.get_many([generation_key, bootstrap_key])
 
-        cache.set(cache_key, value, TIMEOUT)
+    generation = values.get(generation_key)
+    stored = values.get(bootstrap_key)
+    if generation is None or stored is None:
+        return None
 
-    return value
+    stored_generation, payload = stored
+    if stored_generation != generation:
+        return None
+
+    return payload
+
+def set_widget_bootstrap(video_id, language_code, payload, generation):
+    """Store a widget bootstrap payload and remember its language.
+
+    `generation` should be the one the payload's data was read under (the
+    'generation' from get_widget_data).  If the video was invalidated since,
+    the payload is stale and isn't stored.
+
+    """
+    generation_key = _video_generation_key(video_id)
+    languages_key = _widget_bootstrap_languages_key(video_id)
+    values = cache.get_many([generation_key, languages_key])
+
+    if values.get(generation_key) != generation:
+        return
+
+    languages = values.get(languages_key) or []
+    values = {
+        _widget_bootstrap_key(video_id, language_code): (generation, payload),
+    }
+    if language_code not in languages:
+        values[languages_key] = languages + [language_code]
+
+    cache.set_many(values, BOOTSTRAP_TIMEOUT)
+
+def _rebuild_widget_bootstraps(video_id):
+    language_codes = cache.get(_widget_bootstrap_languages_key(video_id))
+    if language_codes:
+        from widget.tasks import rebuild_widget_bootstraps
+        rebuild_widget_bootstraps.delay(video_id, language_codes)
 
 
 # Writelocking
+WRITELOCKED_TIMEOUT = 5 * 60
+
 def _writelocked_store_langs(video_id, langs):
-    delimiter = ";"
     cache_key = _video_writelocked_langs_key(video_id)
-    value = delimiter.join(langs)
-    cache.set(cache_key, value, 5 * 60)
+    cache_utils.store(cache_key, langs, WRITELOCKED_TIMEOUT)
     return langs
 
 def writelocked_langs(video_id):
-    from videos.models import WRITELOCK_EXPIRATION, Video
-    delimiter = ";"
-    cache_key = _video_writelocked_langs_key(video_id)
-    value = cache.get(cache_key)
-    if value is not None:
-        langs = [x for x in value.split(delimiter) if len(x)  > 0]
-        return langs
-    else:
+    def _compute():
+        from videos.models import WRITELOCK_EXPIRATION, Video
         treshold = datetime.datetime.now() - datetime.timedelta(seconds=WRITELOCK_EXPIRATION)
         video = Video.objects.get(video_id=video_id)
         langs = list(video.subtitlelanguage_set.filter(writelock_time__gte=treshold))
-        value = _writelocked_store_langs(video_id, [x.language for x in langs])
-        return value
+        return [x.language for x in langs]
+
+    # Return a copy, since callers modify the list before storing it again.
+    return list(cache_utils.get_or_compute(
+        _video_writelocked_langs_key(video_id), _compute,
+        WRITELOCKED_TIMEOUT, METRIC_NAME))
 
 def writelock_add_lang(video_id, language_code):
     writelocked_langs_clear(video_id)
@@ -26,12 +26,16 @@ from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.sites.models import Site
 from django.core.urlresolvers import reverse
 from django.db.models import ObjectDoesNotExist
-from django.http import HttpResponse, Http404, HttpResponseServerError, HttpResponseRedirect
+from django.http import (
+    HttpResponse, Http404, HttpResponseServerError, HttpResponseRedirect,
+    HttpResponseNotModified
+)
 from django.shortcuts import render_to_response, redirect, get_object_or_404
 from django.template import RequestContext
 from django.template.defaultfilters import urlize, linebreaks, force_escape
 from django.utils.encoding import iri_to_uri
-from django.utils.http import cookie_date
+from django.utils.cache import patch_cache_control
+from django.utils.http import cookie_date, http_date
 from django.utils.translation import ugettext_lazy as _
 from django.views.decorators.csrf import csrf_exempt
 from simplejson.decoder import JSONDecodeError
@@ -46,6 +50,8 @@ from utils.metrics import Meter
 from utils.html import unescape as unescape_html
 from utils.unisubsmarkup import markup_to_html
 from videos import models
+from widget import exports
+from widget.exports import Export
 from widget.models import SubtitlingSession
 from widget.null_rpc import NullRpc
 from widget.rpc import add_general_settings, Rpc
@@ -349,12 +355,28 @@ def download_subtitles(request, handler=SSASubtitles):
     if not version:
         raise Http404
 
-    h = handler.create(version, video, language)
-    subs_text = unicode(h)
-    # since this is a downlaod, we can afford not to escape tags, specially true
-    # since speaker change is denoted by '>>' and that would get entirely stripped out
-    response = HttpResponse(subs_text, mimetype="text/plain")
-    original_filename = '%s.%s' % (video.lang_filename(language), h.file_type)
+    export = Export(handler, version, video, language)
+
+    if export.not_modified(request):
+        response = HttpResponseNotModified()
+    else:
+        # since this is a downlaod, we can afford not to escape tags, specially true
+        # since speaker change is denoted by '>>' and that would get entirely stripped out
+        response = HttpResponse(export.content(), mimetype="text/plain")
+
+    response['ETag'] = export.etag
+    response['Last-Modified'] = http_date(export.last_modified)
+    if team_video:
+        # What members get differs from what everyone else gets.
+        patch_cache_control(response, private=True)
+    else:
+        patch_cache_control(response, public=True, max_age=(
+            exports.MAX_AGE if revision is not None else exports.LATEST_MAX_AGE))
+
+    if response.status_code == 304:
+        return response
+
+    original_filename = '%s.%s' % (video.lang_filename(language), handler.file_type)
 
     if not 'HTTP_USER_AGENT' in request.META or u'WebKit' in request.META['HTTP_USER_AGENT']:
         # Safari 3.0 and Chrome 2.0 accepts UTF-8 encoded string directly.
@@ -363,7 +385,7 @@ def download_subtitles(request, handler=SSASubtitles):
         try:
             original_filename.encode('ascii')
         except UnicodeEncodeError:
-            original_filename = 'subtitles.' + h.file_type
+            original_filename = 'subtitles.' + handler.file_type
 
         filename_header = 'filename=%s' % original_filename
     else:
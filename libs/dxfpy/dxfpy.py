@@ -47,6 +47,48 @@ def get_contents(el):
     return ''.join(filter(None, parts)).strip()
 
 
+def summarize_items(items):
+    """Compute summary numbers for an iterable of subtitle items in one pass.
+
+    Returns a dictionary with the following keys:
+
+    * count: the number of subtitles.
+    * synced_count: the number of subtitles with both timings set.
+    * first_ms: the earliest start time, or None if nothing has one.
+    * last_ms: the latest end time (or start time if the last subtitle has
+      no end time), or None.
+    * duration_ms: last_ms - first_ms, or None if either is missing.
+
+    Only the running totals are kept, so the items can come from a generator.
+
+    """
+    count = synced_count = 0
+    first_ms = last_ms = None
+
+    for item in items:
+        from_ms, to_ms = item[0], item[1]
+        count += 1
+
+        if from_ms != None and to_ms != None:
+            synced_count += 1
+
+        if from_ms != None and (first_ms == None or from_ms < first_ms):
+            first_ms = from_ms
+
+        end = to_ms if to_ms != None else from_ms
+        if end != None and (last_ms == None or end > last_ms):
+            last_ms = end
+
+    if first_ms != None and last_ms != None:
+        duration_ms = last_ms - first_ms
+    else:
+        duration_ms = None
+
+    return {'count': count, 'synced_count': synced_count,
+            'first_ms': first_ms, 'last_ms': last_ms,
+            'duration_ms': duration_ms}
+
+
 class SubtitleSet(object):
     BASE_TTML = r'''
         <tt xml:lang="" xmlns="http://www.w3.org/ns/ttml">
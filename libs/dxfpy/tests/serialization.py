@@ -17,7 +17,7 @@
 # with this program.  If not, see http://www.gnu.org/licenses/agpl-3.0.html.
 
 from unittest import TestCase
-from dxfpy.dxfpy import SubtitleSet
+from dxfpy.dxfpy import SubtitleSet, summarize_items
 from dxfpy.tests.data import sample_ttml
 
 
@@ -103,3 +103,17 @@ class TestSerialization(TestCase):
               'a <span xmlns="http://www.w3.org/ns/ttml">bar</span> z'),
              (None, None, "baz"),
              ])
+
+
+class TestSummary(TestCase):
+    def test_summary(self):
+        self.assertEqual(summarize_items([]),
+                         {'count': 0, 'synced_count': 0, 'first_ms': None,
+                          'last_ms': None, 'duration_ms': None})
+
+        data = [( 100,  200, "a"),
+                ( 300, None, "b"),
+                (None, None, "c")]
+        self.assertEqual(summarize_items(data),
+                         {'count': 3, 'synced_count': 1, 'first_ms': 100,
+                          'last_ms': 300, 'duration_ms': 200})
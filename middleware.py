@@ -6,13 +6,14 @@ import debug_toolbar
 import django.db.backends.mysql.base
 from debug_toolbar.middleware import DebugToolbarMiddleware
 from django.conf import settings
-from django.core.exceptions import ValidationError
+from django.core.exceptions import MiddlewareNotUsed, ValidationError
 from django.core.validators import validate_ipv4_address
 from django.db.backends.mysql.base import CursorWrapper as _CursorWrapper
 from django.utils.cache import patch_vary_headers
 from django.utils.hashcompat import sha_constructor
 from django.utils.http import cookie_date
 
+from utils import profiling
 from utils.metrics import ManualTimer, Meter, Timer
 
 
@@ -94,6 +95,36 @@ class ResponseTimeMiddleware(object):
 
         return response
 
+class ProfilingMiddleware(object):
+    """Profile a sample of requests per view, using utils.profiling.
+
+    Set PROFILING_SAMPLE_RATE to the fraction of requests to profile; it's
+    off (and this middleware unused) by default.
+
+    """
+    def __init__(self):
+        if not profiling.SAMPLE_RATE:
+            raise MiddlewareNotUsed()
+        profiling.install_cache_counters()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if random.random() >= profiling.SAMPLE_RATE:
+            return None
+
+        name = getattr(view_func, '__name__', view_func.__class__.__name__)
+        request._profile = profiling.Profile(
+            'views.%s.%s' % (view_func.__module__, name))
+        request._profile.start()
+        return None
+
+    def process_response(self, request, response):
+        p = getattr(request, '_profile', None)
+        if p is not None:
+            del request._profile
+            p.stop()
+
+        return response
+
 class P3PHeaderMiddleware(object):
     def process_response(self, request, response):
         response['P3P'] = settings.P3P_COMPACT
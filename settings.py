@@ -316,6 +316,7 @@ TEMPLATE_LOADERS = (
 
 MIDDLEWARE_CLASSES = (
     'middleware.ResponseTimeMiddleware',
+    'middleware.ProfilingMiddleware',
     'middleware.StripGoogleAnalyticsCookieMiddleware',
     'utils.ajaxmiddleware.AjaxErrorMiddleware',
     'localeurl.middleware.LocaleURLMiddleware',
@@ -330,6 +331,10 @@ MIDDLEWARE_CLASSES = (
     'middleware.SaveUserIp',
 )
 
+# Fraction of requests profiled by middleware.ProfilingMiddleware (see
+# utils.profiling).  0 turns profiling off.
+PROFILING_SAMPLE_RATE = 0
+
 ROOT_URLCONF = 'unisubs.urls'
 
 TEMPLATE_DIRS = (
@@ -437,6 +442,10 @@ HAYSTACK_SITECONF = 'search_site'
 HAYSTACK_SEARCH_ENGINE = 'solr'
 HAYSTACK_SOLR_URL = 'http://127.0.0.1:8983/solr'
 HAYSTACK_SEARCH_RESULTS_PER_PAGE = 20
+# Collect changed objects in a Redis queue that's reindexed in batches, instead
+# of sending a celery task per save.  The queue needs Redis 2.6.12 or later,
+# older servers fall back to the tasks.  See utils/celery_search_index.py.
+SEARCH_INDEX_QUEUE_UPDATES = True
 SOLR_ROOT = rel('..', 'buildout', 'parts', 'solr', 'example')
 
 # socialauth-related
@@ -17,6 +17,8 @@ CACHE_TIMEOUT = 60
 HAYSTACK_SOLR_URL = 'http://localhost:38983/solr/testing'
 
 CELERY_ALWAYS_EAGER = True
+# Index right away instead of going through the dirty queue.
+SEARCH_INDEX_QUEUE_UPDATES = False
 
 INSTALLED_APPS += ('django_nose', )
 INSTALLED_APPS = list(INSTALLED_APPS)
@@ -0,0 +1,209 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2012 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+"""Cached getters that don't stampede.
+
+The usual "get, compute on a miss, set" pattern means that when a popular key
+expires or is invalidated every request that misses it recomputes it at once.
+The functions here wrap cached values with a soft expiry time and add a short
+lived lock key:
+
+* Only the process holding the lock recomputes a key.  Others wait a little for
+  it to show up, and only compute it themselves if it doesn't.
+* Once a value is past its soft expiry it's still served (stale) to everyone
+  but the one process that refreshes it.  It's stored for STALE_FRACTION of
+  its timeout longer than that to make this possible.
+* Timeouts are jittered so that keys set together don't expire together.
+
+Values stored with these functions must be read with them too.  Anything else
+found under a key (like a value cached before this module existed) is treated
+as a miss.
+
+Hits, misses, stale hits and the time spent recomputing are reported through
+utils.metrics under "cache.<name>.*".
+
+"""
+
+import random
+import time
+
+from django.core.cache import cache
+
+from utils.metrics import ManualTimer, Meter
+
+
+LOCK_TIMEOUT = 30
+
+# How long to wait for another process to compute a missing value, and how
+# often to check for it.
+LOCK_WAIT = 0.5
+LOCK_POLL_INTERVAL = 0.05
+
+JITTER = 0.1
+STALE_FRACTION = 0.1
+
+
+class CachedValue(object):
+    """A cached value and the time after which it should be refreshed."""
+
+    def __init__(self, value, fresh_until):
+        self.value = value
+        self.fresh_until = fresh_until
+
+    def is_fresh(self):
+        return time.time() < self.fresh_until
+
+
+def _timeouts(timeout):
+    """Return how long to keep a value fresh for and how long to store it."""
+    fresh_for = int(timeout * random.uniform(1 - JITTER, 1))
+    return fresh_for, fresh_for + int(timeout * STALE_FRACTION)
+
+def _lock_key(cache_key):
+    return '{0}_lock'.format(cache_key)
+
+def _acquire(cache_key):
+    return cache.add(_lock_key(cache_key), 1, LOCK_TIMEOUT)
+
+def _compute(compute, name):
+    start = time.time()
+    try:
+        return compute()
+    finally:
+        ManualTimer('cache.{0}.recompute'.format(name)).record(
+            (time.time() - start) * 1000)
+
+def _wait_for(cache_key):
+    """Wait for another process to store a value for cache_key.
+
+    Returns the CachedValue, or None if it doesn't show up in time.
+
+    """
+    deadline = time.time() + LOCK_WAIT
+    while time.time() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        cached = cache.get(cache_key)
+        if isinstance(cached, CachedValue):
+            return cached
+    return None
+
+# Returned by _lookup when the caller now holds the lock for a key and should
+# recompute it.
+_LOCKED = object()
+
+def _lookup(cache_key, cached, compute, name):
+    """Return the value to use for cache_key given what the cache had for it.
+
+    Returns _LOCKED if the value needs to be recomputed and stored by the
+    caller, who is now holding the key's lock.
+
+    """
+    if isinstance(cached, CachedValue):
+        if cached.is_fresh():
+            Meter('cache.{0}.hit'.format(name)).inc()
+            return cached.value
+
+        if not _acquire(cache_key):
+            # Somebody else is refreshing it, so the stale value will do.
+            Meter('cache.{0}.stale'.format(name)).inc()
+            return cached.value
+
+        Meter('cache.{0}.miss'.format(name)).inc()
+        return _LOCKED
+
+    Meter('cache.{0}.miss'.format(name)).inc()
+
+    if _acquire(cache_key):
+        return _LOCKED
+
+    cached = _wait_for(cache_key)
+    if cached is not None:
+        return cached.value
+
+    # Whoever holds the lock is taking too long (or died).  Don't make the
+    # request wait any longer, but leave storing the value to them.
+    return _compute(compute, name)
+
+
+def peek(cache_key):
+    """Return what's cached under cache_key, fresh or stale, or None."""
+    cached = cache.get(cache_key)
+    return cached.value if isinstance(cached, CachedValue) else None
+
+def store(cache_key, value, timeout):
+    """Store a value so that get_or_compute can read it."""
+    fresh_for, timeout = _timeouts(timeout)
+    cache.set(cache_key, CachedValue(value, time.time() + fresh_for), timeout)
+
+def store_many(values, timeout):
+    """Store a dictionary of values with a single set_many."""
+    if values:
+        fresh_for, timeout = _timeouts(timeout)
+        fresh_until = time.time() + fresh_for
+        cache.set_many(dict((k, CachedValue(v, fresh_until))
+                            for k, v in values.items()),
+                       timeout)
+
+def get_or_compute(cache_key, compute, timeout, name='default'):
+    """Return the value cached under cache_key, calling compute() if needed.
+
+    Values of None are never cached, since they're indistinguishable from a
+    miss.  `name` is used for the metrics.
+
+    """
+    value = _lookup(cache_key, cache.get(cache_key), compute, name)
+
+    if value is _LOCKED:
+        try:
+            value = _compute(compute, name)
+            if value is not None:
+                store(cache_key, value, timeout)
+        finally:
+            cache.delete(_lock_key(cache_key))
+
+    return value
+
+def get_many_or_compute(computes, timeout, name='default'):
+    """Like get_or_compute for several keys, reading them all in one go.
+
+    `computes` should map cache keys to compute functions.  Returns a
+    dictionary mapping the same keys to their values.  Anything that needed
+    recomputing is written back with a single set_many.
+
+    """
+    found = cache.get_many(computes.keys())
+
+    values, locked = {}, []
+    for cache_key, compute in computes.items():
+        values[cache_key] = _lookup(cache_key, found.get(cache_key), compute,
+                                    name)
+        if values[cache_key] is _LOCKED:
+            locked.append(cache_key)
+
+    if locked:
+        try:
+            for cache_key in locked:
+                values[cache_key] = _compute(computes[cache_key], name)
+
+            store_many(dict((k, values[k]) for k in locked
+                            if values[k] is not None),
+                       timeout)
+        finally:
+            cache.delete_many([_lock_key(k) for k in locked])
+
+    return values
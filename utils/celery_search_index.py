@@ -1,7 +1,9 @@
 import time
+import uuid
 
 from celery.task import task
-from django.db.models import signals
+from django.conf import settings
+from django.db.models import get_model, signals
 from haystack import indexes, site
 from haystack.exceptions import NotRegistered
 from haystack.utils import get_identifier
@@ -11,6 +13,15 @@ from utils.redis_utils import default_connection
 
 
 class CelerySearchIndex(indexes.SearchIndex):
+    def prefetch(self, objects):
+        """Load anything prepare() needs for many objects at once.
+
+        Called with each chunk of objects before they're sent to the backend.
+        Does nothing by default.
+
+        """
+        pass
+
     def _setup_save(self, model):
         signals.post_save.connect(self.update_handler, sender=model)
 
@@ -24,10 +35,14 @@ class CelerySearchIndex(indexes.SearchIndex):
         signals.post_delete.disconnect(self.remove_handler, sender=model)
 
     def update_handler(self, instance, **kwargs):
-        update_search_index.deplay(instance.__class__, instance.pk)
+        schedule_update(instance.__class__, instance.pk)
 
     def remove_handler(self, instance, **kwargs):
-        remove_search_index.delay(instance.__class__, get_identifier(instance))
+        if _use_queue():
+            mark_dirty(instance.__class__, [instance.pk])
+        else:
+            remove_search_index.delay(instance.__class__,
+                                      get_identifier(instance))
 
 
 def log(*args, **kwargs):
@@ -74,11 +89,212 @@ def update_search_index_for_qs(model_class, pks):
         log(u'Seacrh index is not registered for %s' % model_class)
         return None
 
-    search_index.backend.update(search_index, qs)
+    objects = list(qs)
+    search_index.prefetch(objects)
+    search_index.backend.update(search_index, objects)
 
     LogEntry(num=len(pks), time=time.time()-start).save()
 
 
+# Dirty queue
+#
+# Instead of one Celery task per save, changed objects are recorded in a Redis
+# sorted set of "<app_label>.<model>:<pk>" members, scored by the time they
+# were last marked.  Marking an object that is already queued just bumps its
+# score, so any number of saves collapse into one entry.
+#
+# process_dirty() consumes the set oldest first, skipping anything marked in
+# the last QUEUE_SETTLE seconds.  Objects that still exist are reindexed with
+# update_search_index_for_qs(), one batch per model; the rest are removed from
+# the index.  After each batch the highest score handled is stored as the
+# high-water mark and everything up to it is dropped from the set.  Objects
+# marked again while a batch is being indexed get a newer score, so they stay
+# queued.  If the consumer dies between indexing and trimming, the next run
+# trims up to the stored mark before carrying on.
+#
+# The consumer lock needs SET's NX and EX options and EVAL, which came in
+# Redis 2.6.12.  The server's version is checked the first time it matters,
+# and on anything older updates go back to one Celery task per object.
+
+QUEUE_UPDATES = getattr(settings, 'SEARCH_INDEX_QUEUE_UPDATES', True)
+QUEUE_MIN_REDIS_VERSION = (2, 6, 12)
+QUEUE_SETTLE = 2
+QUEUE_BATCH_SIZE = 500
+QUEUE_LOCK_TIMEOUT = 60 * 10
+
+DIRTY_KEY = 'search-index:dirty'
+HIGH_WATER_KEY = 'search-index:high-water'
+LOCK_KEY = 'search-index:lock'
+
+# Delete the lock only if it still holds our token, so a consumer that outlived
+# QUEUE_LOCK_TIMEOUT can't release a lock another consumer has since taken.
+_RELEASE_LOCK = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+_queue_supported = None
+
+def _redis_supports_queue():
+    """Is the Redis server new enough for the dirty queue?  Checked once."""
+    global _queue_supported
+
+    if _queue_supported is None:
+        version = default_connection.info().get('redis_version', '')
+        try:
+            parsed = tuple(int(part) for part in version.split('.')[:3])
+        except ValueError:
+            parsed = ()
+
+        _queue_supported = parsed >= QUEUE_MIN_REDIS_VERSION
+        if not _queue_supported:
+            log(u'Redis %s is too old for the search index queue (it needs '
+                u'%s), sending update tasks instead' % (
+                    version, '.'.join(map(str, QUEUE_MIN_REDIS_VERSION))))
+
+    return _queue_supported
+
+def _use_queue():
+    return QUEUE_UPDATES and _redis_supports_queue()
+
+def _acquire_lock():
+    """Take the consumer lock.  Return its token, or None if it's held."""
+    token = uuid.uuid4().hex
+    # redis-py 2.4 has no arguments for SET's options (or eval), so send the
+    # commands directly.  The expiry is set atomically with the value, so a
+    # crash can never leave a lock that doesn't expire.
+    if default_connection.execute_command('SET', LOCK_KEY, token, 'NX',
+                                          'EX', QUEUE_LOCK_TIMEOUT):
+        return token
+    return None
+
+def _release_lock(token):
+    default_connection.execute_command('EVAL', _RELEASE_LOCK, 1, LOCK_KEY,
+                                       token)
+
+def _dirty_member(model_class, pk):
+    return '%s.%s:%s' % (model_class._meta.app_label,
+                         model_class._meta.module_name, pk)
+
+def _parse_dirty_member(member):
+    model_name, pk = member.rsplit(':', 1)
+    app_label, module_name = model_name.split('.', 1)
+    return get_model(app_label, module_name), pk
+
+def mark_dirty(model_class, pks):
+    """Queue the objects of model_class with the given pks for reindexing."""
+    if not pks:
+        return
+
+    now = repr(time.time())
+    default_connection.zadd(DIRTY_KEY, **dict(
+        (_dirty_member(model_class, pk), now) for pk in pks))
+
+def schedule_update(model_class, pk):
+    """Get an object reindexed, through the dirty queue unless it's disabled."""
+    if _use_queue():
+        mark_dirty(model_class, [pk])
+    else:
+        update_search_index.delay(model_class, pk)
+
+def schedule_updates(model_class, pks):
+    """Like schedule_update(), for many objects with one queue write or task."""
+    if not pks:
+        return
+
+    if _use_queue():
+        mark_dirty(model_class, pks)
+    else:
+        update_search_index_for_qs.delay(model_class, pks)
+
+def _reindex(model_class, pks):
+    try:
+        search_index = site.get_index(model_class)
+    except NotRegistered:
+        log(u'Search index is not registered for %s' % model_class)
+        return
+
+    existing = set(model_class._default_manager.filter(pk__in=pks)
+                                               .values_list('pk', flat=True))
+    if existing:
+        update_search_index_for_qs(model_class, list(existing))
+
+    existing = set(unicode(pk) for pk in existing)
+    for pk in pks:
+        if unicode(pk) not in existing:
+            search_index.remove_object(u'%s.%s.%s' % (
+                model_class._meta.app_label, model_class._meta.module_name, pk))
+
+def _process_batch(batch_size, cutoff):
+    members = default_connection.zrangebyscore(
+        DIRTY_KEY, '-inf', repr(cutoff), start=0, num=batch_size,
+        withscores=True)
+    if not members:
+        return 0
+
+    # Trimming goes by score, so a batch can't stop partway through the
+    # entries that share its last score.
+    if len(members) == batch_size:
+        last = members[-1][1]
+        head = [m for m in members if m[1] < last]
+        if head:
+            members = head
+        else:
+            members = default_connection.zrangebyscore(
+                DIRTY_KEY, repr(last), repr(last), withscores=True)
+
+    by_model = {}
+    for member, score in members:
+        model_class, pk = _parse_dirty_member(member)
+        if model_class is None:
+            log(u'Unknown model in search index queue: %s' % member)
+            continue
+        by_model.setdefault(model_class, []).append(pk)
+
+    for model_class, pks in by_model.items():
+        _reindex(model_class, pks)
+
+    high_water = members[-1][1]
+    default_connection.set(HIGH_WATER_KEY, repr(high_water))
+    default_connection.zremrangebyscore(DIRTY_KEY, '-inf', repr(high_water))
+    return len(members)
+
+def process_dirty(batch_size=None, max_batches=None):
+    """Reindex the objects in the dirty queue.
+
+    Returns the number of queue entries handled, or None if another consumer
+    is already running.  Does nothing if the Redis server can't run the queue.
+
+    """
+    if not _redis_supports_queue():
+        return 0
+
+    batch_size = batch_size or QUEUE_BATCH_SIZE
+
+    token = _acquire_lock()
+    if token is None:
+        return None
+
+    try:
+        high_water = default_connection.get(HIGH_WATER_KEY)
+        if high_water is not None:
+            default_connection.zremrangebyscore(DIRTY_KEY, '-inf', high_water)
+
+        cutoff = time.time() - QUEUE_SETTLE
+        processed = batches = 0
+        while max_batches is None or batches < max_batches:
+            count = _process_batch(batch_size, cutoff)
+            if not count:
+                break
+            processed += count
+            batches += 1
+        return processed
+    finally:
+        _release_lock(token)
+
+
 class LogEntry(rmodels.Model):
     num = rmodels.IntegerField()
     time = rmodels.FloatField()
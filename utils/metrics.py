@@ -16,15 +16,20 @@
 # along with this program.  If not, see
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
+import atexit
+import os
+import random
 import socket
+import threading
 import time as _time
+from collections import defaultdict
 from contextlib import contextmanager
 from functools import wraps
 
 from django.conf import settings
 
 try:
-    from bernhard import Client, UDPTransport
+    from bernhard import Client, UDPTransport, Message, Event
 except ImportError:
     # Just use a dummy client if we don't have a Riemann client installed.
     class Client(object):
@@ -34,7 +39,7 @@ except ImportError:
         def send(self, *args, **kwargs):
             pass
 
-    UDPTransport = None
+    UDPTransport = Message = Event = None
 
 
 # Ugly hack to check if we're running the test suite.  If so we shouldn't report
@@ -50,6 +55,16 @@ HOST = socket.gethostname()
 ENABLED = (not RUNNING_TESTS) and getattr(settings, 'ENABLE_METRICS', False)
 RIEMANN_HOST = getattr(settings, 'RIEMANN_HOST', '127.0.0.1')
 
+# Metrics are aggregated in-process and flushed to Riemann by a background
+# thread every FLUSH_INTERVAL seconds, instead of sending a packet per event.
+AGGREGATE = getattr(settings, 'METRICS_AGGREGATE', True)
+FLUSH_INTERVAL = getattr(settings, 'METRICS_FLUSH_INTERVAL', 10)
+RESERVOIR_SIZE = getattr(settings, 'METRICS_RESERVOIR_SIZE', 1028)
+PERCENTILES = (50, 75, 95, 99)
+
+# Events per UDP packet when flushing.
+EVENTS_PER_PACKET = 20
+
 c = Client(RIEMANN_HOST, transport=UDPTransport)
 
 def find_environment_tag():
@@ -66,17 +81,194 @@ def find_environment_tag():
 
 ENV_TAG = find_environment_tag()
 
-def send(service, tag, metric=None):
+def _event(service, tag, metric=None):
     data = {'host': HOST, 'service': service, 'tags': [tag, ENV_TAG]}
 
     if metric:
         data['metric'] = metric
 
-    if ENABLED:
-        try:
-            c.send(data)
-        except:
-            pass
+    return data
+
+def _send_events(events):
+    if not ENABLED:
+        return
+
+    try:
+        if Message is None:
+            for data in events:
+                c.send(data)
+        else:
+            for i in xrange(0, len(events), EVENTS_PER_PACKET):
+                c.transmit(Message(events=[
+                    Event(params=data)
+                    for data in events[i:i + EVENTS_PER_PACKET]]))
+    except:
+        pass
+
+
+class Reservoir(object):
+    '''A uniform random sample of a stream of values, for percentiles.
+
+    Uses Vitter's algorithm R, so memory stays at `size` values however many
+    are added.  The count, sum, min and max are exact.
+
+    '''
+    def __init__(self, size=RESERVOIR_SIZE):
+        self.size = size
+        self.values = []
+        self.count = 0
+        self.total = 0.0
+        self.min = self.max = None
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+        if len(self.values) < self.size:
+            self.values.append(value)
+        else:
+            i = random.randint(0, self.count - 1)
+            if i < self.size:
+                self.values[i] = value
+
+    def percentiles(self, ps=PERCENTILES):
+        '''Return a {p: value} dict of the given percentiles of the sample.'''
+        values = sorted(self.values)
+        if not values:
+            return dict((p, None) for p in ps)
+
+        return dict((p, values[min(len(values) - 1, int(len(values) * p / 100.0))])
+                    for p in ps)
+
+    def summary(self):
+        data = {'count': self.count, 'min': self.min, 'max': self.max,
+                'mean': self.total / self.count if self.count else None}
+        for p, value in self.percentiles().items():
+            data['p%d' % p] = value
+        return data
+
+
+class Aggregator(object):
+    '''Accumulates metrics in memory between flushes.
+
+    Meters and occurrences are summed, gauges keep their last value, and
+    histograms and timers are sampled into a Reservoir.  flush() turns all of
+    that into one event per meter/gauge and one event per statistic (count,
+    mean, percentiles, ...) per histogram/timer, and sends them in batches.
+
+    '''
+    COUNTER_TAGS = ('meter', 'occurrence')
+    SAMPLE_TAGS = ('histogram', 'timer')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last = {}
+        self.last_flush = None
+        self._thread_pid = None
+        self._reset()
+
+    def _reset(self):
+        self.counters = defaultdict(int)
+        self.gauges = {}
+        self.samples = {}
+        self.started = _time.time()
+
+    def add(self, service, tag, metric=None):
+        self._ensure_thread()
+
+        key = (service, tag)
+        with self.lock:
+            if tag in self.COUNTER_TAGS:
+                self.counters[key] += 1 if metric is None else metric
+            elif tag in self.SAMPLE_TAGS:
+                if key not in self.samples:
+                    self.samples[key] = Reservoir()
+                self.samples[key].add(metric)
+            else:
+                self.gauges[key] = metric
+
+    def _summarize(self, counters, gauges, samples):
+        data = {}
+        for (service, tag), value in counters.items():
+            data[service] = {'type': tag, 'value': value}
+        for (service, tag), value in gauges.items():
+            data[service] = {'type': tag, 'value': value}
+        for (service, tag), reservoir in samples.items():
+            data[service] = dict(reservoir.summary(), type=tag)
+        return data
+
+    def snapshot(self):
+        '''Return the current and the last flushed interval as dicts.'''
+        with self.lock:
+            current = self._summarize(self.counters, self.gauges, self.samples)
+            started = self.started
+
+        return {'host': HOST, 'pid': os.getpid(),
+                'flush_interval': FLUSH_INTERVAL,
+                'current': {'since': started, 'metrics': current},
+                'last': {'at': self.last_flush, 'metrics': self.last}}
+
+    def flush(self):
+        '''Send everything accumulated since the last flush.
+
+        Returns the list of events.
+
+        '''
+        with self.lock:
+            counters, gauges, samples = self.counters, self.gauges, self.samples
+            self._reset()
+
+        events = []
+        for (service, tag), value in counters.items():
+            events.append(_event(service, tag, value))
+        for (service, tag), value in gauges.items():
+            events.append(_event(service, tag, value))
+        for (service, tag), reservoir in samples.items():
+            for name, value in reservoir.summary().items():
+                if value is not None:
+                    events.append(_event('%s.%s' % (service, name), tag, value))
+
+        self.last = self._summarize(counters, gauges, samples)
+        self.last_flush = _time.time()
+
+        _send_events(events)
+        return events
+
+    def _ensure_thread(self):
+        # Threads don't survive forking, so check the pid rather than just
+        # whether we've started one.
+        pid = os.getpid()
+        if self._thread_pid == pid:
+            return
+
+        with self.lock:
+            if self._thread_pid == pid:
+                return
+            self._thread_pid = pid
+
+        thread = threading.Thread(target=self._run, name='metrics-flush')
+        thread.daemon = True
+        thread.start()
+
+    def _run(self):
+        while True:
+            _time.sleep(FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except Exception:
+                pass
+
+
+aggregator = Aggregator()
+atexit.register(aggregator.flush)
+
+def send(service, tag, metric=None):
+    if AGGREGATE:
+        aggregator.add(service, tag, metric)
+    else:
+        _send_events([_event(service, tag, metric)])
 
 
 class Metric(object):
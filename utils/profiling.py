@@ -0,0 +1,237 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2012 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+"""Per-endpoint query, cache and latency profiling.
+
+ProfilingMiddleware (in middleware.py) profiles a sample of requests, one
+Profile per view, and RpcRouter.call_action() adds one per RPC
+action.method inside those requests.  Each Profile records:
+
+    - wall time
+    - the number of SQL queries and their total time
+    - the number of cache gets and sets
+    - SQL shapes (the query with its literals stripped) that ran more than
+      PROFILING_N_PLUS_ONE_THRESHOLD times, which is usually an N+1 pattern
+
+The results go to utils.metrics under "profiling.<name>.*" and are kept per
+name in `store`, which the /uslogging/profiling/ page shows.
+
+"""
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+
+from utils.metrics import (
+    Histogram, ManualTimer, Meter, Occurrence, Reservoir
+)
+
+
+# Fraction of requests to profile.  0 disables profiling entirely.
+SAMPLE_RATE = getattr(settings, 'PROFILING_SAMPLE_RATE', 0)
+N_PLUS_ONE_THRESHOLD = getattr(settings, 'PROFILING_N_PLUS_ONE_THRESHOLD', 10)
+
+_local = threading.local()
+
+
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+
+def sql_shape(sql):
+    """Return sql with its literal values replaced, for spotting repeats."""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    return _IN_LIST_RE.sub('(...)', sql)
+
+
+class EndpointStats(object):
+    def __init__(self):
+        self.requests = 0
+        self.wall = Reservoir()
+        self.queries = Reservoir()
+        self.sql_time = Reservoir()
+        self.cache_gets = 0
+        self.cache_sets = 0
+        self.n_plus_one = 0
+        # shape -> the most times it was repeated in one request
+        self.repeated = {}
+
+    def summary(self):
+        return {
+            'requests': self.requests,
+            'wall': self.wall.summary(),
+            'queries': self.queries.summary(),
+            'sql_time': self.sql_time.summary(),
+            'cache_gets': self.cache_gets,
+            'cache_sets': self.cache_sets,
+            'n_plus_one': self.n_plus_one,
+            'repeated': sorted(self.repeated.items(), key=lambda i: -i[1]),
+        }
+
+class ProfileStore(object):
+    """The stats of every profiled name in this process."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def record(self, profile):
+        with self.lock:
+            stats = self.stats.get(profile.name)
+            if stats is None:
+                stats = self.stats[profile.name] = EndpointStats()
+
+            stats.requests += 1
+            stats.wall.add(profile.wall_time)
+            stats.queries.add(len(profile.queries))
+            stats.sql_time.add(profile.sql_time)
+            stats.cache_gets += profile.cache_gets
+            stats.cache_sets += profile.cache_sets
+            if profile.repeated:
+                stats.n_plus_one += 1
+            for shape, count in profile.repeated.items():
+                stats.repeated[shape] = max(count, stats.repeated.get(shape, 0))
+
+    def summary(self):
+        """Return [(name, stats summary)], most queries per request first."""
+        with self.lock:
+            data = [(name, stats.summary())
+                    for name, stats in self.stats.items()]
+        return sorted(data, key=lambda i: -(i[1]['queries']['mean'] or 0))
+
+    def clear(self):
+        with self.lock:
+            self.stats = {}
+
+store = ProfileStore()
+
+
+class Profile(object):
+    def __init__(self, name):
+        self.name = name
+        self.cache_gets = 0
+        self.cache_sets = 0
+
+    def start(self):
+        self._parent = getattr(_local, 'profile', None)
+        _local.profile = self
+
+        # Turning on the debug cursor makes Django log every query, with its
+        # time, in connection.queries, whatever DEBUG is.
+        self._connections = {}
+        for connection in connections.all():
+            self._connections[connection.alias] = (
+                connection.use_debug_cursor, len(connection.queries))
+            connection.use_debug_cursor = True
+
+        self._start = time.time()
+
+    def stop(self):
+        self.wall_time = (time.time() - self._start) * 1000
+
+        self.queries = []
+        for connection in connections.all():
+            debug_cursor, start = self._connections.get(connection.alias,
+                                                        (None, 0))
+            self.queries.extend(connection.queries[start:])
+            connection.use_debug_cursor = debug_cursor
+
+            # Outside of DEBUG nothing else clears the log, so don't let it
+            # grow.  Enclosing profiles still need the queries, though.
+            if self._parent is None and not settings.DEBUG:
+                del connection.queries[start:]
+
+        self.sql_time = sum(float(q['time']) for q in self.queries) * 1000
+        shapes = Counter(sql_shape(q['sql']) for q in self.queries)
+        self.repeated = dict((shape, count) for shape, count in shapes.items()
+                             if count > N_PLUS_ONE_THRESHOLD)
+
+        _local.profile = self._parent
+        if self._parent is not None:
+            self._parent.cache_gets += self.cache_gets
+            self._parent.cache_sets += self.cache_sets
+
+        self.report()
+
+    def report(self):
+        store.record(self)
+
+        prefix = 'profiling.%s' % self.name
+        Histogram('%s.queries' % prefix).record(len(self.queries))
+        ManualTimer('%s.sql-time' % prefix).record(self.sql_time)
+        ManualTimer('%s.wall-time' % prefix).record(self.wall_time)
+        Meter('%s.cache-gets' % prefix).inc(self.cache_gets)
+        Meter('%s.cache-sets' % prefix).inc(self.cache_sets)
+        if self.repeated:
+            Occurrence('%s.n-plus-one' % prefix).mark()
+
+def is_profiling():
+    return getattr(_local, 'profile', None) is not None
+
+@contextmanager
+def profile(name):
+    """Profile the enclosed block as `name`, if this request is being profiled."""
+    if not is_profiling():
+        yield None
+        return
+
+    p = Profile(name)
+    p.start()
+    try:
+        yield p
+    finally:
+        p.stop()
+
+
+_CACHE_METHODS = {
+    'get': 'cache_gets',
+    'get_many': 'cache_gets',
+    'has_key': 'cache_gets',
+    'set': 'cache_sets',
+    'set_many': 'cache_sets',
+    'add': 'cache_sets',
+    'incr': 'cache_sets',
+    'decr': 'cache_sets',
+    'delete': 'cache_sets',
+    'delete_many': 'cache_sets',
+}
+
+def _counting(method, counter):
+    @wraps(method)
+    def counted(*args, **kwargs):
+        p = getattr(_local, 'profile', None)
+        if p is not None:
+            setattr(p, counter, getattr(p, counter) + 1)
+        return method(*args, **kwargs)
+    return counted
+
+def install_cache_counters():
+    """Wrap the default cache's methods so profiles can count round trips."""
+    from django.core.cache import cache
+
+    if getattr(cache, '_profiling_counters', False):
+        return
+
+    for name, counter in _CACHE_METHODS.items():
+        if hasattr(cache, name):
+            setattr(cache, name, _counting(getattr(cache, name), counter))
+    cache._profiling_counters = True
@@ -12,6 +12,8 @@ from django.utils.datastructures import MultiValueDict
 from django.utils.encoding import smart_str, force_unicode
 from django.utils.functional import Promise
 
+from utils import profiling
+
 
 class LazyEncoder(DateTimeAwareJSONEncoder):
     """
@@ -259,12 +261,14 @@ class RpcRouter(object):
             }
 
         try:
+            with profiling.profile('rpc.%s.%s' % (rd['action'], method)):
+                result = func(*args, **extra_kwargs)
             return {
                 'tid': rd['tid'],
                 'type': 'rpc',
                 'action': rd['action'],
                 'method': method,
-                'result': func(*args, **extra_kwargs)
+                'result': result
             }
         except RpcExceptionEvent, e:
             return {
@@ -25,6 +25,9 @@ from videos.models import Video
 from utils.multi_query_set import MultiQuerySet
 from utils.compress import compress, decompress
 from utils.chunkediter import chunkediter
+from utils import cache_utils
+from utils.metrics import Aggregator, Reservoir
+from utils import profiling
 
 
 class MultiQuerySetTest(TestCase):
@@ -187,3 +190,143 @@ class ChunkedIterTest(TestCase):
             sum += i
         self.assertEqual(sum, 0)
 
+
+class CacheUtilsTest(TestCase):
+    def setUp(self):
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return self.calls
+
+    def test_get_or_compute(self):
+        key = 'cache-utils-test-get'
+        cache_utils.cache.delete(key)
+
+        self.assertEqual(cache_utils.get_or_compute(key, self.compute, 60), 1)
+        self.assertEqual(cache_utils.get_or_compute(key, self.compute, 60), 1)
+        self.assertEqual(self.calls, 1)
+
+        # Values that aren't ours are treated as misses.
+        cache_utils.cache.set(key, 'raw', 60)
+        self.assertEqual(cache_utils.get_or_compute(key, self.compute, 60), 2)
+
+    def test_stale_while_revalidate(self):
+        key = 'cache-utils-test-stale'
+        cache_utils.cache.set(key, cache_utils.CachedValue('stale', 0), 60)
+
+        # While someone else holds the lock we get the stale value...
+        cache_utils.cache.set(cache_utils._lock_key(key), 1, 60)
+        self.assertEqual(cache_utils.get_or_compute(key, self.compute, 60),
+                         'stale')
+        self.assertEqual(self.calls, 0)
+
+        # ...and once it's free we refresh it.
+        cache_utils.cache.delete(cache_utils._lock_key(key))
+        self.assertEqual(cache_utils.get_or_compute(key, self.compute, 60), 1)
+        self.assertEqual(cache_utils.get_or_compute(key, self.compute, 60), 1)
+        self.assertEqual(cache_utils.cache.get(cache_utils._lock_key(key)),
+                         None)
+
+    def test_get_many_or_compute(self):
+        keys = ['cache-utils-test-many-1', 'cache-utils-test-many-2']
+        cache_utils.cache.delete_many(keys)
+        cache_utils.store(keys[0], 'cached', 60)
+
+        values = cache_utils.get_many_or_compute(
+            dict((k, self.compute) for k in keys), 60)
+        self.assertEqual(values, {keys[0]: 'cached', keys[1]: 1})
+
+        values = cache_utils.get_many_or_compute(
+            dict((k, self.compute) for k in keys), 60)
+        self.assertEqual(values, {keys[0]: 'cached', keys[1]: 1})
+        self.assertEqual(self.calls, 1)
+
+
+class MetricsAggregationTest(TestCase):
+    def test_reservoir(self):
+        reservoir = Reservoir(size=100)
+        for value in xrange(1, 1001):
+            reservoir.add(value)
+
+        self.assertEqual(len(reservoir.values), 100)
+        summary = reservoir.summary()
+        self.assertEqual(summary['count'], 1000)
+        self.assertEqual(summary['min'], 1)
+        self.assertEqual(summary['max'], 1000)
+        self.assertEqual(summary['mean'], 500.5)
+        self.assertTrue(summary['p50'] <= summary['p95'] <= summary['p99'])
+
+        exact = Reservoir(size=100)
+        for value in xrange(1, 101):
+            exact.add(value)
+        self.assertEqual(exact.percentiles((50, 99)), {50: 51, 99: 100})
+
+    def test_flush(self):
+        aggregator = Aggregator()
+        aggregator.add('emails', 'meter', 2)
+        aggregator.add('emails', 'meter', 3)
+        aggregator.add('errors', 'occurrence')
+        aggregator.add('videos', 'gauge', 10)
+        aggregator.add('videos', 'gauge', 12)
+        for ms in (10, 20, 30):
+            aggregator.add('render', 'timer', ms)
+
+        current = aggregator.snapshot()['current']['metrics']
+        self.assertEqual(current['emails']['value'], 5)
+
+        events = dict((e['service'], e.get('metric'))
+                      for e in aggregator.flush())
+        self.assertEqual(events['emails'], 5)
+        self.assertEqual(events['errors'], 1)
+        self.assertEqual(events['videos'], 12)
+        self.assertEqual(events['render.count'], 3)
+        self.assertEqual(events['render.mean'], 20)
+        self.assertEqual(events['render.max'], 30)
+
+        snapshot = aggregator.snapshot()
+        self.assertEqual(snapshot['current']['metrics'], {})
+        self.assertEqual(snapshot['last']['metrics']['render']['p50'], 20)
+        self.assertEqual(aggregator.flush(), [])
+
+
+class ProfilingTest(TestCase):
+    def tearDown(self):
+        profiling.store.clear()
+
+    def test_sql_shape(self):
+        self.assertEqual(
+            profiling.sql_shape("SELECT * FROM t WHERE a = 12 AND b = 'x''y' "
+                                "AND c IN (1, 2, 3)"),
+            "SELECT * FROM t WHERE a = ? AND b = ? AND c IN (...)")
+
+    def test_profile(self):
+        from django.core.cache import cache
+        profiling.install_cache_counters()
+
+        p = profiling.Profile('test.view')
+        p.start()
+        for pk in xrange(profiling.N_PLUS_ONE_THRESHOLD + 1):
+            Video.objects.filter(pk=pk).exists()
+        with profiling.profile('test.rpc') as inner:
+            cache.set('profiling-test', 1)
+            cache.get('profiling-test')
+            Video.objects.count()
+        p.stop()
+
+        self.assertEqual(len(inner.queries), 1)
+        self.assertEqual((inner.cache_gets, inner.cache_sets), (1, 1))
+        self.assertEqual(len(p.queries), profiling.N_PLUS_ONE_THRESHOLD + 2)
+        self.assertEqual((p.cache_gets, p.cache_sets), (1, 1))
+        self.assertEqual(p.repeated.values(),
+                         [profiling.N_PLUS_ONE_THRESHOLD + 1])
+        self.assertFalse(profiling.is_profiling())
+
+        summary = dict(profiling.store.summary())
+        self.assertEqual(summary['test.view']['n_plus_one'], 1)
+        self.assertEqual(summary['test.rpc']['queries']['max'], 1)
+
+    def test_not_profiling(self):
+        with profiling.profile('test.rpc') as p:
+            self.assertEqual(p, None)
+        self.assertEqual(profiling.store.summary(), [])